@@ -1,31 +1,42 @@
-import asyncio
+import calendar
 import logging
 import os
 import random
 import re
-import smtplib
 import sqlite3
+import statistics
+import threading
 import time
 import psycopg2
-from psycopg2.pool import SimpleConnectionPool
+from concurrent.futures import ThreadPoolExecutor, wait
+from psycopg2.pool import ThreadedConnectionPool
 from datetime import datetime, timedelta, timezone
-from email.mime.image import MIMEImage
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from collections import defaultdict
+from email.utils import parsedate_to_datetime
+from collections import OrderedDict, defaultdict
 
 import feedparser
 import pytz
 import requests
 import toml
 from dateutil.relativedelta import relativedelta
-from nio import AsyncClient, MatrixRoom
 from disposable_email_domains import blocklist
 
 import bot_strings
+import cache_manager
+import db_manager
+import email_manager
+import http_manager
+import migrations
+import onboarding
 import pm_functions as pmf
+import pm_outbox
+import pm_router
+import word_filter
 from config import settings
-from lemmy_manager import get_lemmy_instance, restart_bot
+from lemmy_manager import get_lemmy_instance, note_api_failure, wait_for_rate_limit
+from matrix_manager import send_matrix_message
 from pythorhead import Lemmy
 from pythorhead.types import SortType, ListingType, FeatureType
 
@@ -62,8 +73,8 @@ logging.info("Log level set to %s", settings.DEBUG_LEVEL)
 # Short term memory PM scanning
 recent_messages = defaultdict(list)
 
-#lemmy db helper
-PG_POOL: SimpleConnectionPool = SimpleConnectionPool(
+#lemmy db helper, shared by jobs running in parallel so it must be threaded
+PG_POOL: ThreadedConnectionPool = ThreadedConnectionPool(
     minconn=1,
     maxconn=5,                        
     host=settings.DB_HOST,
@@ -88,7 +99,7 @@ def check_dbs():
     This function is used to validate database connections and configurations.
     """
     try:
-        with sqlite3.connect('resources/vote.db') as conn:
+        with db_manager.connect(db_manager.VOTE_DB) as conn:
             # Create or check votes table
             create_table(
                 conn,
@@ -101,7 +112,7 @@ def check_dbs():
                 'polls',
                 '(poll_id INTEGER PRIMARY KEY AUTOINCREMENT, poll_name TEXT, username TEXT, open TEXT)')
 
-        with sqlite3.connect('resources/users.db') as conn:
+        with db_manager.connect(db_manager.USERS_DB) as conn:
             # Create or check users table
             create_table(
                 conn,
@@ -114,18 +125,64 @@ def check_dbs():
                 'communities',
                 '(community_id INT, community_name TEXT)')
 
-        with sqlite3.connect('resources/games.db') as conn:
+            # create or check onboarding work table, one row per user and stage
+            create_table(
+                conn,
+                'onboarding',
+                '''(onboarding_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                local_user_id INT NOT NULL,
+                public_user_id INT,
+                username TEXT,
+                email TEXT,
+                stage TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INT NOT NULL DEFAULT 0,
+                next_attempt INT NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created INT,
+                UNIQUE (local_user_id, stage))''')
+
+            # create or check queued broadcasts table
+            create_table(
+                conn,
+                'broadcast_jobs',
+                '''(job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message TEXT NOT NULL,
+                admin_id INT,
+                last_user_id INT NOT NULL DEFAULT 0,
+                sent INT NOT NULL DEFAULT 0,
+                failed INT NOT NULL DEFAULT 0,
+                total INT,
+                created INT,
+                finished INT)''')
+
+        with db_manager.connect(db_manager.EMAIL_DB) as conn:
+            # create or check queued emails table
+            create_table(
+                conn,
+                'outbox',
+                '''(email_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                recipient TEXT NOT NULL,
+                message TEXT NOT NULL,
+                description TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INT NOT NULL DEFAULT 0,
+                next_attempt INT NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created INT)''')
+
+        with db_manager.connect(db_manager.GAMES_DB) as conn:
             # create or check game deals table
             create_table(conn, 'deals', '(deal_name TEXT, deal_date TEXT)')
 
-        with sqlite3.connect('resources/welcome/welcome.db') as conn:
+        with db_manager.connect(db_manager.WELCOME_DB) as conn:
             # create or check welcome messages table
             create_table(
                 conn,
                 'messages',
                 '(community TEXT UNIQUE, message TEXT)')
 
-        with sqlite3.connect('resources/mod_actions.db') as conn:
+        with db_manager.connect(db_manager.MOD_DB) as conn:
             # create or check new posts table
             create_table(
                 conn,
@@ -156,8 +213,14 @@ def check_dbs():
                 'pm_spam',
                 '(id INTEGER PRIMARY KEY AUTOINCREMENT, phrase TEXT NOT NULL)')
 
+            # create or check scan watermark table
+            create_table(
+                conn,
+                'scan_state',
+                '(name TEXT PRIMARY KEY, last_id INT)')
+
             # create or check rss tables
-        with sqlite3.connect('resources/rss.db') as conn:
+        with db_manager.connect(db_manager.RSS_DB) as conn:
             create_table(conn, 'feeds', '''
                 (feed_id INTEGER PRIMARY KEY AUTOINCREMENT,
                 feed_url TEXT NOT NULL UNIQUE,
@@ -183,7 +246,7 @@ def check_dbs():
             ''')
 
             # create or check reports tables
-        with sqlite3.connect('resources/reports.db') as conn:
+        with db_manager.connect(db_manager.REPORTS_DB) as conn:
             create_table(
                 conn,
                 'post_reports',
@@ -196,13 +259,13 @@ def check_dbs():
 
             # create_table(conn, 'message_reports', '(report_id INT, reporter_id INT, reporter_name TEXT, report_reason TEXT, message_id INT)')
 
-        with sqlite3.connect('resources/autopost.db') as conn:
+        with db_manager.connect(db_manager.AUTOPOST_DB) as conn:
             create_table(
                 conn,
                 'com_posts',
                 '(pin_id INTEGER PRIMARY KEY AUTOINCREMENT, community_id INT, mod_id INT, post_title TEXT, post_url TEXT, post_body TEXT, scheduled_post TIME, frequency TEXT, previous_post INT)')
 
-        with sqlite3.connect('resources/giveaway.db') as conn:
+        with db_manager.connect(db_manager.GIVEAWAY_DB) as conn:
             create_table(
                 conn,
                 'giveaways',
@@ -213,7 +276,7 @@ def check_dbs():
                 'entrants',
                 '(ticket_number INTEGER PRIMARY KEY AUTOINCREMENT, giveaway_id INTEGER, username TEXT, entry_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY (giveaway_id) REFERENCES giveaways (giveaway_id), UNIQUE (giveaway_id, username))')
             
-        with sqlite3.connect('resources/tags.db') as conn:
+        with db_manager.connect(db_manager.TAGS_DB) as conn:
             create_table(
                 conn,
                 'enforcement_rules',
@@ -230,7 +293,7 @@ def check_dbs():
                 """(id INTEGER PRIMARY KEY AUTOINCREMENT, post_id INTEGER NOT NULL, community TEXT NOT NULL, rule_id INTEGER NOT NULL, current_step INTEGER NOT NULL, next_action_due TIMESTAMP NOT NULL, FOREIGN KEY (rule_id) REFERENCES enforcement_rules(id))""")
 
         
-        with sqlite3.connect('resources/welcome/bus.db') as conn:
+        with db_manager.connect(db_manager.BUS_DB) as conn:
             create_table(
                 conn,
                 'pm_scan_messages',
@@ -244,48 +307,86 @@ def check_dbs():
     except Exception as e:
         logging.error("Exception in _query: %s", e)
 
+    # bring indexes and constraints up to date. A failed migration is raised,
+    # the bot shouldn't start on a half migrated schema
+    migrations.run_migrations()
+
 
 
 def connect_to_vote_db():
-    return sqlite3.connect('resources/vote.db')
+    return db_manager.connect(db_manager.VOTE_DB)
 
 
 def connect_to_rss_db():
-    return sqlite3.connect('resources/rss.db')
+    return db_manager.connect(db_manager.RSS_DB)
 
 
 def connect_to_users_db():
-    return sqlite3.connect('resources/users.db')
+    return db_manager.connect(db_manager.USERS_DB)
+
+
+USER_COLUMNS = ("local_user_id", "public_user_id", "username", "has_posted", "has_had_pm", "email", "subscribed")
+USERS_PAGE_SIZE = 500
+
+
+def iter_users(columns=("local_user_id", "public_user_id", "username"), subscribed=None, after_id=0,
+               page_size=USERS_PAGE_SIZE):
+    """
+    Yield rows of `columns` from the users table in local_user_id order,
+    starting after after_id. subscribed=True/False only yields users who are
+    (or aren't) subscribed to broadcasts. Rows are read page_size at a time,
+    each page picking up after the last id of the one before, so memory use
+    doesn't grow with the number of users and no connection is held between
+    pages.
+    """
+    for column in columns:
+        if column not in USER_COLUMNS:
+            raise ValueError(f"Unknown users column {column}")
+
+    # local_user_id is always selected (first) to know where the next page starts
+    query = f"SELECT local_user_id, {', '.join(columns)} FROM users WHERE local_user_id > ?"
+    if subscribed is not None:
+        query += f" AND subscribed = {1 if subscribed else 0}"
+    query += " ORDER BY local_user_id LIMIT ?"
+
+    while True:
+        with connect_to_users_db() as conn:
+            rows = conn.execute(query, (after_id, page_size)).fetchall()
+        for row in rows:
+            yield row[1:]
+        if len(rows) < page_size:
+            return
+        after_id = rows[-1][0]
 
 
 def connect_to_welcome_db():
-    return sqlite3.connect('resources/welcome/welcome.db')
+    return db_manager.connect(db_manager.WELCOME_DB)
 
 
 def connect_to_reports_db():
-    return sqlite3.connect('resources/reports.db')
+    return db_manager.connect(db_manager.REPORTS_DB)
 
 
 def connect_to_autopost_db():
-    return sqlite3.connect('resources/autopost.db')
+    return db_manager.connect(db_manager.AUTOPOST_DB)
 
 
 def connect_to_mod_db():
-    return sqlite3.connect('resources/mod_actions.db')
+    return db_manager.connect(db_manager.MOD_DB)
 
 
 def connect_to_giveaway_db():
-    return sqlite3.connect('resources/giveaway.db')
+    return db_manager.connect(db_manager.GIVEAWAY_DB)
 
 
 def connect_to_games_db():
-    return sqlite3.connect('resources/games.db')
+    return db_manager.connect(db_manager.GAMES_DB)
 
 def connect_to_tags_db():
-    return sqlite3.connect('resources/tags.db')
+    return db_manager.connect(db_manager.TAGS_DB)
 
 def connect_to_message_bus_db():
-    return sqlite3.connect('resources/welcome/bus.db')
+    return db_manager.connect(db_manager.BUS_DB)
 
 def execute_sql_query(connection, query, params=()):
     with connection:
@@ -316,13 +417,13 @@ def check_version():
 
         if settings.STARTUP_WARNING and settings.MATRIX_FLAG:
             matrix_body = f"ZippyBot has been updated and has restarted at {time_string}. Version updated: {last_version} -> {current_version}"
-            asyncio.run(send_matrix_message(matrix_body))
+            send_matrix_message(matrix_body)
             return
 
     if settings.STARTUP_WARNING and settings.MATRIX_FLAG:
 
         matrix_body = f"ZippyBot has been rebooted at {time_string}. If you weren't expecting this, Zippy has recovered from a crash."
-        asyncio.run(send_matrix_message(matrix_body))
+        send_matrix_message(matrix_body)
 
     logging.info("Bot Version %s", current_version)
 
@@ -459,24 +560,16 @@ def delete_rss(feed_id, pm_sender):
         if feed is None:
             return "no_exist"
 
-        community = feed[6]
-
-        output = lemmy.community.get(community)
+        community = int(feed[6])
 
         # check if user is moderator of community
-        is_moderator = False
-
-        for moderator_info in output['moderators']:
-            if moderator_info['moderator']['id'] == pm_sender:
-                is_moderator = True
-                break
-
-        if not is_moderator:
+        if not cache_manager.is_moderator(pm_sender, community):
             return "not_mod"
 
         cursor.execute("DELETE FROM posts WHERE feed_id = ?", (feed_id,))
         cursor.execute("DELETE FROM feeds WHERE feed_id = ?", (feed_id,))
         conn.commit()
+        forget_rss_posts()
         logging.info("Feed and related posts deleted successfully.")
         return "deleted"
 
@@ -498,14 +591,7 @@ def delete_welcome(com_name, pm_sender):
             if row is None:
                 return "no_exist"
 
-        output = lemmy.community.get(name=com_name)
-        is_moderator = False
-        for moderator_info in output['moderators']:
-            if moderator_info['moderator']['id'] == pm_sender:
-                is_moderator = True
-                break
-
-        if not is_moderator:
+        if not cache_manager.is_moderator(pm_sender, com_name):
             return "not_mod"
 
         cursor.execute("DELETE FROM messages WHERE community = ?", (com_name,))
@@ -547,23 +633,16 @@ def delete_autopost(pin_id, pm_sender, del_post):
                 return "deleted"
 
             # not a match, check if sender is a mod of the community
-            output = lemmy.community.get(name=community_name)
-
-            is_moderator = False
-
-            for moderator_info in output['moderators']:
-                if moderator_info['moderator']['id'] == pm_sender:
-                    is_moderator = True
-                    query = "DELETE FROM com_posts WHERE pin_id = ?"
-                    cursor.execute(query, (pin_id,))
-                    conn.commit()
-                    if prev_post is not None:
-                        if del_post:
-                            lemmy.post.delete(prev_post, True)
-                    return "deleted"
+            if cache_manager.is_moderator(pm_sender, community_name):
+                query = "DELETE FROM com_posts WHERE pin_id = ?"
+                cursor.execute(query, (pin_id,))
+                conn.commit()
+                if prev_post is not None:
+                    if del_post:
+                        lemmy.post.delete(prev_post, True)
+                return "deleted"
 
-            if not is_moderator:
-                return "not mod"
+            return "not mod"
 
     except Exception as e:
         logging.error("An error occurred: %s", e)
@@ -583,8 +662,8 @@ def clear_notifications():
         time.sleep(30)
         return
     except requests.exceptions.HTTPError:
-        logging.info("Error with HTTP connection, restarting bot...")
-        restart_bot()    
+        logging.info("Error with HTTP connection, skipping until the next check...")
+        note_api_failure()
         return
 
 
@@ -592,217 +671,172 @@ def clear_notifications():
         reply_id = notif['comment_reply']['id']
         lemmy.comment.mark_as_read(reply_id, True)
 
-def check_pms():
-    try:
-        pm = lemmy.private_message.list(True, 1)
-        
-        if pm is None:
-            logging.info("No data received from private message API. Skipping...")
-            return
 
-        private_messages = pm.get('private_messages', [])
+# handlers for different senders' PMs run in parallel in this pool
+PM_EXECUTOR = ThreadPoolExecutor(max_workers=settings.PM_CONCURRENCY, thread_name_prefix="pm")
 
-    except (requests.exceptions.Timeout, requests.exceptions.ReadTimeout):
-        logging.info("Error with Timeout - pausing bot for 30 seconds...")
-        time.sleep(30)
-        return
+# unread PMs are fetched this many at a time, and a tick keeps fetching
+# until the inbox is empty or this many seconds have passed
+PM_PAGE_LIMIT = 50
+PM_DRAIN_BUDGET = 30
+# ids of recently handled PMs, in case one comes back because marking it
+# as read failed
+HANDLED_PM_MEMORY = 1000
 
-    except requests.exceptions.ConnectionError:
-        logging.info("Error with connection, skipping checking private messages...")
-        return
+_handled_pms = OrderedDict()
+_handled_pms_lock = threading.Lock()
+_pm_poll_interval = settings.PM_MIN_INTERVAL
 
-    except requests.exceptions.HTTPError:
-        logging.info("Error with HTTP connection, restarting bot...")
-        restart_bot()    
-        return
 
-    for pm_data in private_messages:
-        pm_sender = pm_data['private_message']['creator_id']
-        pm_username = pm_data['creator']['name']
-        pm_context = pm_data['private_message']['content']
-        pm_id = pm_data['private_message']['id']
-        pm_account_age = pm_data['creator']['published']
-
-        output = lemmy.user.get(pm_sender)
-        user_local = output['person_view']['person']['local']
-        user_admin = output['person_view']['is_admin']
-
-        # first make sure the pm isn't coming from zippy otherwise it'll put
-        # zippy in a loop.
-        if pm_sender == settings.BOT_ID:
-            lemmy.private_message.mark_as_read(pm_id, True)
-            continue
+def pm_poll_interval():
+    # check_pms' job interval - short while PMs are coming in, backing off when idle
+    return _pm_poll_interval
 
-        # IMPORTANT keep this here - only put reply code above that you want
-        # ANYONE ON LEMMY/FEDIVERSE TO BE ABLE TO ACCESS outside of your
-        # instance when they message your bot.
-        if user_local != settings.LOCAL:
-            lemmy.private_message.create(f"{bot_strings.GREETING} {pm_username} \n\n {bot_strings.LOCAL_ONLY_WARNING}\n \n {bot_strings.PM_SIGNOFF}", pm_sender)
-            lemmy.private_message.mark_as_read(pm_id, True)
-            continue
-        
-        if pm_context == "#help":
-            pmf.pm_help(user_admin, pm_username, pm_id, pm_sender)
-            continue
-        
-        if pm_context == "#autoposthelp":
-            lemmy.private_message.create(f"{bot_strings.GREETING} {pm_username}\n\n{bot_strings.AUTOPOST_HELP}", pm_sender)
-            lemmy.private_message.mark_as_read(pm_id, True)
-            continue
-
-        if pm_context == '#rsshelp':
-            lemmy.private_message.create(f"{bot_strings.GREETING} {pm_username}\n\n{bot_strings.RSS_HELP}", pm_sender)
-            lemmy.private_message.mark_as_read(pm_id, True)
-            continue
 
-        if pm_context == "#rules":
-            lemmy.private_message.create(f"{bot_strings.GREETING} {pm_username}\n\n{bot_strings.INS_RULES}\n\n{bot_strings.PM_SIGNOFF}", pm_sender)
-            lemmy.private_message.mark_as_read(pm_id, True)
-            continue
+def check_pms():
+    global _pm_poll_interval
+    deadline = time.monotonic() + PM_DRAIN_BUDGET
+    seen = set()
 
-        if pm_context == "#credits":
-            lemmy.private_message.create(f"{bot_strings.GREETING} {pm_username}\n\n{bot_strings.CREDITS}\n\n{bot_strings.PM_SIGNOFF}", pm_sender)
-            lemmy.private_message.mark_as_read(pm_id, True)
-            continue
+    while time.monotonic() < deadline:
+        try:
+            private_messages = fetch_unread_pms(seen, deadline)
 
-        if pm_context == "#feedback":
-            lemmy.private_message.create(f"{bot_strings.GREETING} {pm_username}\n\n{bot_strings.FEEDBACK_MESSAGE}\n\n{bot_strings.PM_SIGNOFF}", pm_sender)
-            lemmy.private_message.mark_as_read(pm_id, True)
-            continue
+            if private_messages is None:
+                logging.info("No data received from private message API. Skipping...")
+                break
 
-        if pm_context in ["#unsubscribe", "#subscribe"]:
-            status = "unsub" if pm_context == "#unsubscribe" else "sub"
-            pmf.pm_sub(pm_sender, status, pm_username, pm_id, broadcast_status)
-            continue
+        except (requests.exceptions.Timeout, requests.exceptions.ReadTimeout):
+            logging.info("Error with Timeout - pausing bot for 30 seconds...")
+            time.sleep(30)
+            return
 
+        except requests.exceptions.ConnectionError:
+            logging.info("Error with connection, skipping checking private messages...")
+            return
 
-        if pm_context.split(" -")[0] == "#takeover":
-            pmf.pm_takeover(user_admin, pm_context, pm_id, pm_username, pm_sender)
-            continue
+        except requests.exceptions.HTTPError:
+            logging.info("Error with HTTP connection, skipping until the next check...")
+            note_api_failure()
+            return
 
-        if pm_context.split(" -")[0] == "#modremove":
-            pmf.pm_removemod(user_admin, pm_context, pm_id, pm_username, pm_sender)
-            continue
+        if not private_messages:
+            break
+        seen.update(pm_data['private_message']['id'] for pm_data in private_messages)
 
-        if pm_context.split(" ")[0] == "#vote":
-            pmf.pm_vote(pm_context, pm_username, pm_account_age, pm_id, pm_sender, add_vote_to_db)
-            continue
+        # different senders are handled concurrently, each sender's messages in order
+        by_sender = defaultdict(list)
+        for pm_data in sorted(private_messages, key=lambda pm_data: pm_data['private_message']['id']):
+            if pm_already_handled(pm_data['private_message']['id']):
+                pm_outbox.mark_as_read(pm_data['private_message']['id'], True)
+                continue
+            by_sender[pm_data['private_message']['creator_id']].append(pm_data)
 
-        if pm_context.split(" @")[0] == "#poll":
-            pmf.pm_poll(user_admin, pm_context, pm_username, pm_id, pm_sender, create_poll)
-            continue
-        
-        if pm_context.split(" @")[0] == "#closepoll":
-            pmf.pm_closepoll(user_admin, pm_context, pm_username, pm_id, pm_sender, close_poll)
-            continue
+        futures = [PM_EXECUTOR.submit(handle_sender_pms, messages) for messages in by_sender.values()]
+        wait(futures)
+        # send the replies and mark everything read before looking for more
+        pm_outbox.flush()
 
-        if pm_context.split(" @")[0] == "#countpoll":
-            pmf.pm_countpoll(user_admin, pm_context, pm_username, pm_id, pm_sender, count_votes)
-            continue
+    if seen:
+        _pm_poll_interval = settings.PM_MIN_INTERVAL
+        logging.debug("Handled %s private messages", len(seen))
+    else:
+        _pm_poll_interval = min(_pm_poll_interval * 2, settings.PM_MAX_INTERVAL)
 
-        if pm_context.split(" ")[0] == "#giveaway":
-            pmf.pm_giveaway(user_admin, pm_id, pm_context, pm_username, pm_sender, add_giveaway_thread)
-            continue
-        
-        if pm_context.split(" ")[0] == "#closegiveaway":
-            pmf.pm_closegiveaway(user_admin, close_giveaway_thread, pm_context, pm_id)
-            continue
-        
-        if pm_context.split(" ")[0] == "#drawgiveaway":
-            pmf.pm_drawgiveaway(user_admin, draw_giveaway_thread, pm_context, pm_username, pm_sender, pm_id)
-            continue
 
-        # broadcast messages
-        if pm_context.split(" ")[0] == "#broadcast":
-            pmf.pm_broadcast(user_admin, pm_context, pm_id, broadcast_message)
-            continue
+def fetch_unread_pms(seen, deadline):
+    """
+    Page through the unread PMs, skipping ids in seen. Returns None if the
+    first page couldn't be fetched.
+    """
+    private_messages = []
+    page = 1
+    while True:
+        pm = lemmy.private_message.list(True, page, limit=PM_PAGE_LIMIT)
+        if pm is None:
+            return None if page == 1 else private_messages
 
-        if pm_context.split(" ")[0] == "#rssdelete":
-            pmf.pm_rssdelete(pm_context, pm_sender, pm_username, pm_id, delete_rss)
-            continue
+        batch = pm.get('private_messages', [])
+        private_messages.extend(pm_data for pm_data in batch if pm_data['private_message']['id'] not in seen)
+        if len(batch) < PM_PAGE_LIMIT or time.monotonic() >= deadline:
+            return private_messages
+        page += 1
 
-        if pm_context.split(" ")[0] == "#welcomedelete":
-            pmf.pm_welcomedelete(pm_context, pm_username, pm_sender, pm_id, delete_welcome)
-            continue
 
-        # mod action - add words to be scanned for community
-        if pm_context.split(" ")[0] == "#comscan":
-            pmf.pm_comscan(pm_context, pm_username, pm_sender, pm_id, add_community_word)
-            continue
+def pm_already_handled(pm_id):
+    with _handled_pms_lock:
+        return pm_id in _handled_pms
 
-        # mod action - add welcome message to community
-        if pm_context.split(" ")[0] == "#welcome":
-            pmf.pm_welcome(pm_context, pm_username, pm_sender, pm_id, add_welcome_message)
-            continue
 
-        # mod/admin action - create rss feed in community
-        if pm_context.split(" ")[0] == "#rss":
-            pmf.pm_rss(pm_context, pm_username, pm_sender, pm_id, add_new_feed, connect_to_rss_db, fetch_latest_posts, insert_new_post)
-            continue
+def remember_handled_pm(pm_id):
+    with _handled_pms_lock:
+        _handled_pms[pm_id] = None
+        while len(_handled_pms) > HANDLED_PM_MEMORY:
+            _handled_pms.popitem(last=False)
 
-        # mod action - pin a post
-        if pm_context.split(" ")[0] == '#autopost':
-            pmf.pm_autopost(pm_context, pm_username, pm_sender, pm_id, add_autopost_to_db, get_first_post_date)
-            continue
 
-        if pm_context.split(" ")[0] == "#autopostdelete":
-            pmf.pm_autopostdelete(pm_context,delete_autopost,pm_username,pm_sender,pm_id)
-            continue
+def handle_sender_pms(messages):
+    for pm_data in messages:
+        # back off for everyone while Lemmy is rate limiting us
+        wait_for_rate_limit()
+        try:
+            if handle_pm(pm_data) is False:
+                return
+            remember_handled_pm(pm_data['private_message']['id'])
+        except Exception:
+            # leave the rest unread so they're handled in order next time
+            logging.exception("Failed to handle private message %s", pm_data['private_message']['id'])
+            return
 
-        if pm_context == "#purgevotes":
-            pmf.pm_purgevotes(user_admin, pm_id, check_dbs)
-            continue
 
-        if pm_context == "#purgeadminactions":
-            pmf.pm_purgeadminactions(user_admin, pm_id, check_dbs)
-            continue
+def handle_pm(pm_data):
+    pm_sender = pm_data['private_message']['creator_id']
+    pm_username = pm_data['creator']['name']
+    pm_context = pm_data['private_message']['content']
+    pm_id = pm_data['private_message']['id']
+    pm_account_age = pm_data['creator']['published']
 
-        if pm_context == "#purgerss":
-            pmf.pm_purgerss(user_admin, pm_id, check_dbs)
-            continue
-            
-        if pm_context == "#purgegiveaway":
-            pmf.pm_purgegiveaway(user_admin, pm_id, check_dbs)
-            continue
-
-        if pm_context.split(" ")[0] == "#reject":
-            pmf.pm_reject(pm_context, pm_sender, pm_username, pm_id, reject_user)
-            continue
+    sender = cache_manager.get_person(pm_sender)
+    if sender is None:
+        logging.info("Couldn't fetch the profile of PM sender %s, skipping for now.", pm_sender)
+        return False
+    user_local = sender['local']
+    user_admin = sender['is_admin']
 
-        if pm_context.split(" ")[0] == "#ban":
-            pmf.pm_ban(user_admin, pm_sender, pm_context, pm_id, ban_email, send_matrix_message)
-            continue
+    # first make sure the pm isn't coming from zippy otherwise it'll put
+    # zippy in a loop.
+    if pm_sender == settings.BOT_ID:
+        pm_outbox.mark_as_read(pm_id, True)
+        return
 
-        if pm_context.split(" ")[0] == '#warn':
-            pmf.pm_warn(user_admin, pm_context, pm_username, pm_id, pm_sender, ordinal, get_warning_count, send_matrix_message, log_warning)
-            continue
+    # IMPORTANT keep this here - only put reply code above that you want
+    # ANYONE ON LEMMY/FEDIVERSE TO BE ABLE TO ACCESS outside of your
+    # instance when they message your bot.
+    if user_local != settings.LOCAL:
+        pm_outbox.create(f"{bot_strings.GREETING} {pm_username} \n\n {bot_strings.LOCAL_ONLY_WARNING}\n \n {bot_strings.PM_SIGNOFF}", pm_sender)
+        pm_outbox.mark_as_read(pm_id, True)
+        return
+    
+    if pm_router.dispatch(
+            pm_context,
+            pm_username=pm_username,
+            pm_sender=pm_sender,
+            pm_id=pm_id,
+            pm_account_age=pm_account_age,
+            user_admin=user_admin):
+        return
 
-        if pm_context.split(" ")[0] == '#lock':
-            pmf.pm_lock(user_admin, pm_context, pm_username, pm_id, send_matrix_message)
-            continue
-        
-        if pm_context.split(" ")[0] == "#tagenforcer":
-            pmf.pm_tagenforcer(pm_username, pm_context, pm_sender, pm_id, store_enforcement)
-            continue
-        
-        if pm_context.split(" ")[0] == "#hide":
-            pmf.pm_hide(user_admin, pm_context, pm_sender, pm_id, pm_username, send_matrix_message)
-            continue
+    ### Code for conversations
+    if pm_sender in pmf.pending_giveaway_setup:
+        pmf.pm_giveaway_followup(pm_sender, pm_context, pm_id, add_giveaway_thread)    
+        return
         
-        if pm_context.split(" ")[0] == "#spam_add":
-            pmf.pm_spam_add(user_admin, pm_context, pm_sender, pm_id, pm_username, add_pm_spam_phrase)
-            
-        ### Code for conversations
-        if pm_sender in pmf.pending_giveaway_setup:
-            pmf.pm_giveaway_followup(pm_sender, pm_context, pm_id, add_giveaway_thread)    
-            continue
-            
-        ###    
+    ###    
 
 
-        # keep this at the bottom
-        pmf.pm_notunderstood(pm_username, pm_sender, pm_id)
-        continue
+    # keep this at the bottom
+    pmf.pm_notunderstood(pm_username, pm_sender, pm_id)
+    return
  
 def is_spam_email(email):
 
@@ -829,106 +863,184 @@ def is_spam_email(email):
 
 
 
+APPLICATION_PAGE_LIMIT = 50
+APPLICATION_MAX_PAGES = 10
+REGISTRATION_INSERT_CHUNK = 100
+# an application without an email yet holds the watermark back for this many
+# seconds after it was first seen, so it's picked up once the email is there
+REGISTRATION_EMAIL_WAIT = 60 * 60
+_apps_waiting_for_email = {}
+
+
+def fetch_new_applications(watermark):
+    """
+    Page back through the registration applications (newest first) until the
+    watermark application id is reached and return everything newer, oldest
+    first. None if the API call failed.
+
+    With no watermark yet only the first page is returned.
+    """
+    new_apps = {}
+    for page in range(1, APPLICATION_MAX_PAGES + 1):
+        output = lemmy.admin.list_applications(limit=APPLICATION_PAGE_LIMIT, page=page)
+        if not output:
+            if page == 1:
+                return None
+            break
+
+        apps = output.get('registration_applications', [])
+        reached_watermark = False
+        for app in apps:
+            app_id = app['registration_application']['id']
+            if watermark is not None and app_id <= watermark:
+                reached_watermark = True
+                continue
+            new_apps[app_id] = app
+
+        if reached_watermark or watermark is None or len(apps) < APPLICATION_PAGE_LIMIT:
+            break
+
+    return [new_apps[app_id] for app_id in sorted(new_apps)]
+
+
 def get_new_users():
+    watermark = get_scan_watermark('registration_applications')
     try:
-        output = lemmy.admin.list_applications()
+        new_apps = fetch_new_applications(watermark)
 
         # Ensure output is not None before accessing it
-        if not output:
+        if new_apps is None:
             logging.error("Received None from API, skipping and backing off...")
             time.sleep(30)
             return
-        
-        if "error" in output and output["error"] == "rate_limit_error":
-            logging.warning("Rate limit hit, sleeping for 60 seconds...")
-            time.sleep(60)
-            return
-
-        new_apps = output.get('registration_applications', [])
 
     except requests.exceptions.ConnectionError:
         logging.info("Error with connection, skipping checking new applications...")
+        return
     except (requests.exceptions.Timeout, requests.exceptions.ReadTimeout):
         logging.info("Error with Timeout - pausing bot for 30 seconds...")
         time.sleep(30)
+        return
     except requests.exceptions.HTTPError:
-        logging.info("Error with HTTP connection, restarting bot...")
-        restart_bot()
+        logging.info("Error with HTTP connection, skipping until the next check...")
+        note_api_failure()
+        return
 
+    if not new_apps:
+        return
+
+    registrations = []
+    # the watermark only moves up to the first application still waiting on
+    # its email. Those after it are added now and skipped next time, as the
+    # users are already there
+    handled_up_to = None
+    waiting = False
     for output in new_apps:
-        local_user_id = output['registration_application']['local_user_id']
-        username = output['creator']['name']
+        app_id = output['registration_application']['id']
         email = output['creator_local_user'].get('email')
-        public_user_id = output['creator_local_user']['person_id']
-        
-        if email is None:
+        if email is None and not done_waiting_for_email(app_id):
+            waiting = True
             continue
+        _apps_waiting_for_email.pop(app_id, None)
+
+        if email is not None:
+            registrations.append((
+                output['registration_application']['local_user_id'],
+                output['creator_local_user']['person_id'],
+                output['creator']['name'],
+                email))
+        if not waiting:
+            handled_up_to = app_id
+
+    # new users are onboarded by the onboarding stage jobs
+    if add_registrations(registrations) is None:
+        # try the same applications again next time
+        return
 
-        if update_registration_db(
-                local_user_id,
-                username,
-                public_user_id,
-                email) == "new_user":
-            logging.debug("sending new user a pm")
-            lemmy.private_message.create(
-                bot_strings.GREETING +
-                " " +
-                username +
-                ". " +
-                bot_strings.WELCOME_MESSAGE +
-                bot_strings.PM_SIGNOFF,
-                public_user_id)
+    if handled_up_to is not None:
+        set_scan_watermark('registration_applications', handled_up_to)
 
-            # Check if the email is from a known spam domain
-            if is_spam_email(email):
-                logging.info("User %s tried to register with a potential spam email: %s", username, email)
 
-                matrix_body = f"New user {username} (https://{settings.INSTANCE}/u/{username}) with ID {public_user_id} has signed up with an email address that may be a temporary or spam email address: {email}"
-                asyncio.run(send_matrix_message(matrix_body))
+def done_waiting_for_email(app_id):
+    # whether an application with no email has had REGISTRATION_EMAIL_WAIT
+    # seconds to get one, after which it's skipped
+    first_seen = _apps_waiting_for_email.setdefault(app_id, time.monotonic())
+    if time.monotonic() - first_seen < REGISTRATION_EMAIL_WAIT:
+        return False
+    _apps_waiting_for_email.pop(app_id)
+    logging.info("Registration application %s still has no email, skipping it", app_id)
+    return True
 
-            if settings.EMAIL_FUNCTION:
-                welcome_email(email)
-                
-            insert_block(public_user_id)
 
-        continue
+def add_registrations(registrations):
+    """
+    Add (local_user_id, public_user_id, username, email) rows to the users
+    table in one transaction, subscribed to broadcasts by default. Users
+    already there are left alone (unique local_user_id index). Returns the
+    set of local_user_ids that were added, or None on a database error.
+    Onboarding is queued for the new users in the same transaction.
+    """
+    added = set()
+    try:
+        with connect_to_users_db() as conn:
+            for i in range(0, len(registrations), REGISTRATION_INSERT_CHUNK):
+                chunk = registrations[i:i + REGISTRATION_INSERT_CHUNK]
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO users (local_user_id, public_user_id, username, email, subscribed) VALUES "
+                    + ", ".join(["(?, ?, ?, ?, 1)"] * len(chunk))
+                    + " RETURNING local_user_id",
+                    [value for registration in chunk for value in registration])
+                added.update(row[0] for row in cursor.fetchall())
+            onboarding.queue_users(conn, [registration for registration in registrations if registration[0] in added])
+    except sqlite3.Error as error:
+        logging.error("Failed to add new users to the database: %s", error)
+        return None
+
+    if added:
+        logging.debug("Added %s new users to database", len(added))
+    return added
 
 
-def update_registration_db(local_user_id, username, public_user_id, email):
-    try:
-        with sqlite3.connect('resources/users.db') as conn:
-            curs = conn.cursor()
+@onboarding.stage("welcome_pm")
+def onboard_welcome_pm(user):
+    logging.debug("sending new user a pm")
+    return lemmy.private_message.create(
+        bot_strings.GREETING +
+        " " +
+        user['username'] +
+        ". " +
+        bot_strings.WELCOME_MESSAGE +
+        bot_strings.PM_SIGNOFF,
+        user['public_user_id']) is not None
 
-            # search db for matching user id
-            curs.execute(
-                'SELECT local_user_id FROM users WHERE local_user_id=?', (local_user_id,))
-            id_match = curs.fetchone()
 
-            if id_match is not None:
-                logging.debug("Matching ID found, ignoring")
-                return "User ID already exists"
+@onboarding.stage("spam_check", max_attempts=3)
+def onboard_spam_check(user):
+    # Check if the email is from a known spam domain
+    if is_spam_email(user['email']):
+        logging.info("User %s tried to register with a potential spam email: %s", user['username'], user['email'])
+        onboarding.add_stage(user, "spam_alert")
+    return True
 
-            # default user to subscribed list
-            subscribed = 1
 
-            logging.debug("User ID did not match an existing user ID, adding")
-            sqlite_insert_query = "INSERT INTO users (local_user_id, public_user_id, username, email, subscribed) VALUES (?, ?, ?, ?, ?);"
-            data_tuple = (
-                local_user_id,
-                public_user_id,
-                username,
-                email,
-                subscribed)
+@onboarding.stage("spam_alert", initial=False)
+def onboard_spam_alert(user):
+    username = user['username']
+    matrix_body = f"New user {username} (https://{settings.INSTANCE}/u/{username}) with ID {user['public_user_id']} has signed up with an email address that may be a temporary or spam email address: {user['email']}"
+    send_matrix_message(matrix_body)
+    return True
 
-            curs.execute(sqlite_insert_query, data_tuple)
-            logging.debug("Added new user to database")
-            return "new_user"
-    except sqlite3.Error as error:
-        logging.error("Failed to execute sqlite statement", error)
-        return "Database error occurred"
-    except Exception as error:
-        logging.error("An error occurred", error)
-        return "An unknown error occurred"
+
+@onboarding.stage("welcome_email")
+def onboard_welcome_email(user):
+    if settings.EMAIL_FUNCTION:
+        welcome_email(user['email'])
+    return True
+
+
+@onboarding.stage("instance_blocks", max_attempts=10, retry_delay=5 * 60)
+def onboard_instance_blocks(user):
+    return insert_block(user['public_user_id'])
 
 
 def get_communities():
@@ -946,8 +1058,8 @@ def get_communities():
         time.sleep(30)
         return
     except requests.exceptions.HTTPError:
-        logging.info("Error with HTTP connection, restarting bot...")
-        restart_bot()    
+        logging.info("Error with HTTP connection, skipping until the next check...")
+        note_api_failure()
         return
 
 
@@ -955,17 +1067,13 @@ def get_communities():
         community_id = communities['community']['id']
         community_name = communities['community']['name']
 
-        find_mod = lemmy.community.get(community_id)
+        community = cache_manager.get_community(community_id)
 
-        if find_mod is None or find_mod.get('moderators') is None:
+        if community is None or not community['moderators']:
             logging.info("Unable to get moderator of community, skipping.")
             continue
 
-        mods = find_mod['moderators']
-
-        for find_mod in mods:
-            mod_id = find_mod['moderator']['id']
-            mod_name = find_mod['moderator']['name']
+        mod_id, mod_name = community['moderators'][-1]
 
         if new_community_db(community_id, community_name) == "community":
             lemmy.private_message.create(
@@ -1058,15 +1166,17 @@ def giveaway_entry(thread_id,comment_poster, comment_username, account_age):
 
         giveaway_id, acc_limit, sub_limit, local_only = row
 
-        user_json = lemmy.user.get(comment_poster)
+        person = cache_manager.get_person(comment_poster)
+        if person is None:
+            return
         post_info = lemmy.post.get(thread_id)
         community_id = post_info['community_view']['community']['id']
 
-        if local_only and not user_json['person_view']['person']['local']:
+        if local_only and not person['local']:
             lemmy.private_message.create(f"Hello {comment_username},\n\n Unfortunately only users local to Lemmy.zip can enter this giveaway. \n\n {bot_strings.PM_SIGNOFF}", comment_poster)
             return  
         
-        acc_age = account_age_days(user_json)
+        acc_age = account_age_days(person['published'])
 
         if acc_limit is not None and acc_age < acc_limit:
             lemmy.private_message.create(f"Hello {comment_username},\n\n Unfortunately your account is too new enter this giveaway. \n\n {bot_strings.PM_SIGNOFF}", comment_poster)
@@ -1079,10 +1189,8 @@ def giveaway_entry(thread_id,comment_poster, comment_username, account_age):
                 return  # joined community too recently
             
         # check if user is a moderator in the community and if so, reject entry
-        check_if_mod = lemmy.community.get(id=community_id)
-        for moderator_info in check_if_mod['moderators']:
-            if moderator_info['moderator']['id'] == comment_poster:
-                return
+        if cache_manager.is_moderator(comment_poster, community_id):
+            return
                 
         try:
             cursor = conn.cursor()
@@ -1100,8 +1208,7 @@ def giveaway_entry(thread_id,comment_poster, comment_username, account_age):
                 logging.info("User '%s' has already entered giveaway '%s'", comment_poster, giveaway_id)
                 
 
-def account_age_days(user_json: dict) -> int:
-    published_str = user_json['person_view']['person']['published']
+def account_age_days(published_str: str) -> int:
     published_dt  = datetime.fromisoformat(published_str.replace("Z", "+00:00"))
     return (datetime.now(timezone.utc) - published_dt).days
 
@@ -1163,7 +1270,7 @@ def check_if_giveaway(thread_id):
 
 def new_community_db(community_id, community_name):
     try:
-        with sqlite3.connect('resources/users.db') as conn:
+        with connect_to_users_db() as conn:
             curs = conn.cursor()
 
             # search db to see if community exists in DB already
@@ -1195,50 +1302,13 @@ def new_community_db(community_id, community_name):
 
 
 def welcome_email(email):
-    message = MIMEMultipart()
-    message['From'] = settings.SENDER_EMAIL
-    message['To'] = email
-    message['Subject'] = bot_strings.EMAIL_SUBJECT
-
-    # use this for a simple text email, uncomment below:
-    # body
-    # body = bot_strings.EMAIL_SUBJECT + ".\n\n We've received your application and one of our Admins will manually verify your account shortly. \n\n Lemmy.zip prides itself on being a welcoming and inclusive Lemmy instance, and to help reduce spam we manually verify all accounts.\n\n Once your account is accepted, you will receive another email from us confirming this and then you'll be able to log in to your account using the details you set up. You won't be able to login until you've received this confirmation email.\n\n If you've not received an email confirming you have been accepted within a couple of hours, please email hello@lemmy.zip with your username, and we can look into the issue further. Please be patient with us!\n\n Thanks again for signing up to Lemmy.zip, we're excited to welcome you to the Fediverse :)\n\n PS - Once you've logged in, look out for a message from ZippyBot with a guide on how to get started!"
-    # message.attach(MIMEText(body, 'plain'))
-
-    # use this for sending a HTML email i.e. with pictures and colours.
-    # html email - resources to be saved in the "resources" folder
-    with open('resources/index.html', 'r', encoding='utf-8') as html_file:
-        html_content = html_file.read()
-    # Attach the HTML content to the email
-    message.attach(MIMEText(html_content, 'html'))
-
-    # Attach the image as an inline attachment
-    with open('resources/images/image-1.png', 'rb') as image_file:
-        image = MIMEImage(image_file.read())
-        # use content ids and change to img tag in html to match
-        image.add_header('Content-ID', '<image-1>')
-        message.attach(image)
-
-    with open('resources/images/image-2.png', 'rb') as image_file:
-        image = MIMEImage(image_file.read())
-        image.add_header('Content-ID', '<image-2>')
-        message.attach(image)
-
-    # initialise SMTP server - keep from here for either email type.
-    try:
-        server = smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT)
-        server.starttls()
-        server.login(settings.SENDER_EMAIL, settings.SENDER_PASSWORD)
-        server.sendmail(settings.SENDER_EMAIL, email, message.as_string())
-        logging.info("Welcome email sent successfully")
-    except Exception as e:
-        logging.error("Error: Unable to send email.", str(e))
-    finally:
-        server.quit()
+    # the html email and its images are cached by email_manager, see
+    # resources/index.html and resources/images
+    email_manager.queue_email(email, email_manager.welcome_message(email), "welcome email")
 
 
 def ban_email(person_id):
-    with sqlite3.connect('resources/users.db') as conn:
+    with connect_to_users_db() as conn:
         curs = conn.cursor()
 
         curs.execute(
@@ -1272,17 +1342,10 @@ def ban_email(person_id):
 
         # send
         try:
-            with smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT) as server:
-                server.starttls()
-                server.login(settings.SENDER_EMAIL, settings.SENDER_PASSWORD)
-                server.sendmail(
-                    settings.SENDER_EMAIL,
-                    email,
-                    message.as_string())
-                logging.info("Ban notification email sent successfully.")
-                return "sent"
-        except Exception as e:
-            logging.error("Error: Unable to send email. %s", e)
+            email_manager.queue_email(email, message, "ban notification email")
+            return "queued"
+        except sqlite3.Error as e:
+            logging.error("Error: Unable to queue email. %s", e)
             return "error"
 
 
@@ -1291,7 +1354,12 @@ def steam_deals():
     rss_url = "http://www.reddit.com/r/steamdeals/new/.rss?sort=new"
 
     # parse feed
-    feed = feedparser.parse(rss_url)
+    try:
+        response = http_manager.get(rss_url, "feed")
+    except requests.exceptions.RequestException as e:
+        logging.warning("Couldn't fetch the steam deals feed: %s", e)
+        return
+    feed = feedparser.parse(response.content, response_headers=http_manager.feed_headers(response))
 
     # loop through 10 entries
     for entry in feed.entries[:10]:
@@ -1322,48 +1390,146 @@ def steam_deals():
 
 def RSS_feed():
     try:
+        now = int(time.time())
         with connect_to_rss_db() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                SELECT feed_id, feed_url, url_contains_filter, url_excludes_filter, title_contains_filter, title_excludes_filter, community, tag
+                SELECT feed_id, feed_url, url_contains_filter, url_excludes_filter, title_contains_filter, title_excludes_filter, community, tag, etag, last_modified, poll_interval, error_count
                 FROM feeds
-            """)
+                WHERE next_poll IS NULL OR next_poll <= ?
+            """, (now,))
             feeds = cursor.fetchall()
 
-        for feed in feeds:
-            feed_id, feed_url, url_contains_filter, url_excludes_filter, title_contains_filter, title_excludes_filter, community, tag = feed
-            posts = fetch_latest_posts(
-                feed_url,
-                url_contains_filter,
-                url_excludes_filter,
-                title_contains_filter,
-                title_excludes_filter)
-
-            if posts == "URL access error":
-                logging.error("Skipping RSS Feed due to URL access error.")
-                continue
+        if not feeds:
+            return
+
+        # download and parse the due feeds concurrently, then post from this thread
+        with ThreadPoolExecutor(max_workers=settings.RSS_WORKERS, thread_name_prefix="rss") as executor:
+            results = list(executor.map(fetch_feed_update, feeds))
+
+        for feed, (posts, etag, last_modified, poll_interval) in zip(feeds, results):
+            feed_id, feed_url, url_contains_filter, url_excludes_filter, title_contains_filter, title_excludes_filter, community, tag, old_etag, old_last_modified, old_interval, error_count = feed
 
             if not isinstance(posts, list):
-                logging.error("Failed to fetch posts for feed URL %s. Error: %s", feed_url, posts)
+                # back off a failing feed, doubling each time up to the maximum
+                error_count += 1
+                poll_interval = min(
+                    (old_interval or settings.RSS_MIN_INTERVAL) * 2 ** min(error_count, 10),
+                    settings.RSS_MAX_INTERVAL)
+                update_feed_schedule(feed_id, old_etag, old_last_modified, old_interval, error_count, now + poll_interval)
+                if posts == "URL access error":
+                    logging.error("Skipping RSS Feed due to URL access error.")
+                else:
+                    logging.error("Failed to fetch posts for feed URL %s. Error: %s", feed_url, posts)
                 continue
 
-            for post in posts:
-                if insert_new_post(feed_id, post):
-                    if tag:
-                        post_title = f"[{tag}] " + post['title']
-                    else:
-                        post_title = post['title']
-                    # actually post to lemmy here
-                    logging.debug("Creating an RSS post.")
-                    lemmy.post.create(
-                        community_id=int(community),
-                        name=post_title,
-                        url=post['post_url'])
+            update_feed_schedule(feed_id, etag, last_modified, poll_interval, 0, now + poll_interval)
+            logging.debug("Next poll of RSS feed %s in %s seconds", feed_url, poll_interval)
+
+            for post in insert_new_posts(feed_id, posts):
+                if tag:
+                    post_title = f"[{tag}] " + post['title']
+                else:
+                    post_title = post['title']
+                # actually post to lemmy here
+                logging.debug("Creating an RSS post.")
+                lemmy.post.create(
+                    community_id=int(community),
+                    name=post_title,
+                    url=post['post_url'])
     except Exception as e:
         logging.error("An error occurred: %s", e)
         return "error"
 
 
+def fetch_feed_update(feed):
+    """
+    Worker for RSS_feed - conditionally download one feed and filter its posts.
+
+    Returns (posts, etag, last_modified, poll_interval). posts is an empty list
+    when the feed hasn't changed since the stored ETag/Last-Modified.
+    """
+    feed_id, feed_url, url_contains_filter, url_excludes_filter, title_contains_filter, title_excludes_filter, community, tag, etag, last_modified, poll_interval, error_count = feed
+    try:
+        response = download_feed(feed_url, etag, last_modified)
+        if response is None:
+            return "URL access error", etag, last_modified, poll_interval
+
+        if response.status_code == 304:
+            logging.debug("RSS feed %s not modified", feed_url)
+            return [], etag, last_modified, feed_poll_interval(poll_interval, headers=response.headers)
+
+        parsed = feedparser.parse(response.content, response_headers=http_manager.feed_headers(response))
+        posts = filter_posts(
+            parsed,
+            url_contains_filter,
+            url_excludes_filter,
+            title_contains_filter,
+            title_excludes_filter)
+        return (
+            posts,
+            response.headers.get('ETag'),
+            response.headers.get('Last-Modified'),
+            feed_poll_interval(poll_interval, parsed.entries, response.headers))
+    except Exception as e:
+        logging.error("An error occurred: %s", e)
+        return "error", etag, last_modified, poll_interval
+
+
+def feed_poll_interval(poll_interval, entries=None, headers=None):
+    """
+    Seconds until a feed should be polled again, kept between RSS_MIN_INTERVAL
+    and RSS_MAX_INTERVAL.
+
+    With entries, polls about twice per typical gap between posts, and slower
+    the longer the feed has gone quiet. Otherwise the last interval is kept.
+    The feed's Cache-Control/Expires headers are never polled faster than.
+    """
+    interval = poll_interval or settings.RSS_MIN_INTERVAL
+
+    published = sorted(
+        (calendar.timegm(parsed_time) for parsed_time in (
+            entry.get('published_parsed') or entry.get('updated_parsed') for entry in entries or [])
+         if parsed_time),
+        reverse=True)
+    if published:
+        gaps = [newer - older for newer, older in zip(published, published[1:]) if newer > older]
+        quiet_for = max(time.time() - published[0], 0)
+        interval = max(statistics.median(gaps) / 2 if gaps else interval, quiet_for / 4)
+
+    if headers is not None:
+        interval = max(interval, cache_lifetime(headers))
+
+    return int(min(max(interval, settings.RSS_MIN_INTERVAL), settings.RSS_MAX_INTERVAL))
+
+
+def cache_lifetime(headers):
+    # how long the server says its response stays fresh, 0 if it doesn't say
+    for directive in headers.get('Cache-Control', '').split(','):
+        name, _, value = directive.strip().partition('=')
+        if name.lower() == 'max-age' and value.strip('"').isdigit():
+            return int(value.strip('"'))
+
+    expires = headers.get('Expires')
+    if expires:
+        try:
+            expires = parsedate_to_datetime(expires)
+            date = parsedate_to_datetime(headers['Date']) if headers.get('Date') else datetime.now(timezone.utc)
+            return max((expires - date).total_seconds(), 0)
+        except (TypeError, ValueError):
+            pass
+    return 0
+
+
+def update_feed_schedule(feed_id, etag, last_modified, poll_interval, error_count, next_poll):
+    with connect_to_rss_db() as conn:
+        execute_sql_query(
+            conn,
+            """UPDATE feeds SET etag = ?, last_modified = ?, poll_interval = ?, error_count = ?, next_poll = ?
+            WHERE feed_id = ?""",
+            (etag, last_modified, poll_interval, error_count, next_poll, feed_id))
+
+
 def fetch_rss_feeds():
     try:
         logging.debug("Connecting to RSS DB to fetch RSS feeds")
@@ -1377,6 +1543,74 @@ def fetch_rss_feeds():
         return "error"
 
 
+def download_feed(feed_url, etag=None, last_modified=None):
+    """
+    Download a feed once over the shared session, sending the stored
+    validators so an unchanged feed comes back as a bodyless 304.
+    Returns the response, or None if the feed couldn't be accessed.
+    """
+    logging.debug("Fetching latest RSS posts from %s", feed_url)
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    response = http_manager.get(feed_url, "feed", headers=headers)
+    if response.status_code == 404:
+        logging.error("URL not found (404): %s", feed_url)
+        return None
+
+    if response.status_code == 403:
+        logging.error("Access forbidden (403) to URL: %s", feed_url)
+        return None
+
+    if response.status_code not in (200, 304):
+        logging.error(
+            "Failed to access URL %s. HTTP status code: %s", feed_url, response.status_code
+        )
+        return None
+
+    return response
+
+
+def filter_posts(
+        feed,
+        url_contains_filter=None,
+        url_excludes_filter=None,
+        title_contains_filter=None,
+        title_excludes_filter=None):
+    filtered_posts = []
+    for entry in feed.entries[:3]:
+        post_url = entry.link
+        post_content = entry.title + ' ' + \
+            entry.summary if hasattr(entry, 'summary') else entry.title
+
+        # URL filter
+        if url_contains_filter and not any(
+                filter_word in post_url for filter_word in url_contains_filter.split(',')):
+            continue
+        if url_excludes_filter and any(
+                filter_word in post_url for filter_word in url_excludes_filter.split(',')):
+            continue
+
+        # title filter
+        if title_contains_filter and not any(
+                word in post_content for word in title_contains_filter.split(',')):
+            continue
+        if title_excludes_filter and any(
+                word in post_content for word in title_excludes_filter.split(',')):
+            continue
+
+        filtered_posts.append({
+            'post_url': post_url,
+            'title': entry.title,
+            'description': entry.summary if hasattr(entry, 'summary') else '',
+            'post_date': entry.published if hasattr(entry, 'published') else ''
+        })
+    return filtered_posts
+
+
 def fetch_latest_posts(
         feed_url,
         url_contains_filter=None,
@@ -1384,81 +1618,90 @@ def fetch_latest_posts(
         title_contains_filter=None,
         title_excludes_filter=None):
     try:
-        logging.debug("Fetching latest RSS posts from %s", feed_url)
-        # Stream=True to only fetch headers
-        response = requests.get(feed_url, stream=True, timeout=10)
-        if response.status_code == 404:
-            logging.error("URL not found (404): %s", feed_url)
+        response = download_feed(feed_url)
+        if response is None:
             return "URL access error"
 
-        if response.status_code == 403:
-            logging.error("Access forbidden (403) to URL: %s", feed_url)
-            return "URL access error"
-
-        if response.status_code != 200:
-            logging.error(
-                "Failed to access URL %s. HTTP status code: %s", feed_url, response.status_code
-            )
-            return "URL access error"
-
-        feed = feedparser.parse(feed_url)
+        feed = feedparser.parse(response.content, response_headers=http_manager.feed_headers(response))
+        return filter_posts(
+            feed,
+            url_contains_filter,
+            url_excludes_filter,
+            title_contains_filter,
+            title_excludes_filter)
+    except Exception as e:
+        logging.error("An error occurred: %s", e)
+        return "error"
 
-        filtered_posts = []
-        for entry in feed.entries[:3]:
-            post_url = entry.link
-            post_content = entry.title + ' ' + \
-                entry.summary if hasattr(entry, 'summary') else entry.title
 
-            # URL filter
-            if url_contains_filter and not any(
-                    filter_word in post_url for filter_word in url_contains_filter.split(',')):
-                continue
-            if url_excludes_filter and any(
-                    filter_word in post_url for filter_word in url_excludes_filter.split(',')):
-                continue
+# rows per INSERT, well under sqlite's bound parameter limit
+RSS_INSERT_CHUNK = 100
 
-            # title filter
-            if title_contains_filter and not any(
-                    word in post_content for word in title_contains_filter.split(',')):
-                continue
-            if title_excludes_filter and any(
-                    word in post_content for word in title_excludes_filter.split(',')):
-                continue
+# post urls recently confirmed to be in rss.db, most recent last
+_seen_rss_posts = OrderedDict()
+_seen_rss_lock = threading.Lock()
 
-            filtered_posts.append({
-                'post_url': post_url,
-                'title': entry.title,
-                'description': entry.summary if hasattr(entry, 'summary') else '',
-                'post_date': entry.published if hasattr(entry, 'published') else ''
-            })
-        return filtered_posts
-    except Exception as e:
-        logging.error("An error occurred: %s", e)
-        return "error"
 
+def insert_new_posts(feed_id, posts):
+    """
+    Record a batch of fetched posts in rss.db and return the ones that weren't
+    there already, in their original order.
 
-def insert_new_post(feed_id, post):
+    The whole batch is checked against the unique post_url index and inserted
+    in one statement. URLs seen recently are skipped without touching the db.
+    """
+    batch = {}
+    for post in posts:
+        if post['post_url'] not in batch and not rss_post_seen(post['post_url']):
+            batch[post['post_url']] = post
+    if not batch:
+        return []
+
+    inserted = set()
     try:
-        logging.debug("Inserting new post to RSS DB")
+        logging.debug("Inserting %s RSS posts to RSS DB", len(batch))
         with connect_to_rss_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT post_id FROM posts WHERE post_url = ?", (post['post_url'],))
-            if cursor.fetchone() is None:
-                cursor.execute(
-                    "INSERT INTO posts (feed_id, post_url, title, description, posted, post_date) VALUES (?, ?, ?, ?, ?, ?)",
-                    (feed_id,
-                     post['post_url'],
-                     post['title'],
-                     post['description'],
-                     0,
-                     post['post_date']))
-                conn.commit()
-                return True
-        return False
+            rows = list(batch.values())
+            for i in range(0, len(rows), RSS_INSERT_CHUNK):
+                chunk = rows[i:i + RSS_INSERT_CHUNK]
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO posts (feed_id, post_url, title, description, posted, post_date) VALUES "
+                    + ", ".join(["(?, ?, ?, ?, 0, ?)"] * len(chunk))
+                    + " RETURNING post_url",
+                    [value for post in chunk for value in (
+                        feed_id, post['post_url'], post['title'], post['description'], post['post_date'])])
+                inserted.update(row[0] for row in cursor.fetchall())
     except Exception as e:
         logging.error("An error occurred: %s", e)
-        return "error"
+        return []
+
+    remember_rss_posts(batch)
+    return [post for url, post in batch.items() if url in inserted]
+
+
+def rss_post_seen(post_url):
+    with _seen_rss_lock:
+        if post_url in _seen_rss_posts:
+            _seen_rss_posts.move_to_end(post_url)
+            return True
+    return False
+
+
+def remember_rss_posts(post_urls):
+    if settings.RSS_SEEN_CACHE_SIZE <= 0:
+        return
+    with _seen_rss_lock:
+        for post_url in post_urls:
+            _seen_rss_posts[post_url] = None
+            _seen_rss_posts.move_to_end(post_url)
+        while len(_seen_rss_posts) > settings.RSS_SEEN_CACHE_SIZE:
+            _seen_rss_posts.popitem(last=False)
+
+
+def forget_rss_posts():
+    # call whenever rows are deleted from posts
+    with _seen_rss_lock:
+        _seen_rss_posts.clear()
 
 
 def add_new_feed(
@@ -1571,6 +1814,9 @@ def add_community_word(community, words, action):
     conn.commit()
     conn.close()
 
+    # rebuild the cached matchers with the new list
+    word_filter.invalidate()
+
     return "added"
 
 
@@ -1598,99 +1844,162 @@ def add_deal_to_db(deal_title, deal_published):
         return "error"
 
 
-def check_comments():
-    recent_comments = lemmy.comment.list(
-        limit=10, sort=SortType.New, type_=ListingType.Local)
-    for comment in recent_comments:
-        comment_id = comment['comment']['id']
-        comment_text = comment['comment']['content']
-        comment_poster = comment['creator']['id']
-
-        # check if it has already been scanned
-        if check_comment_db(comment_id) == "duplicate":
-            continue
+# newest local posts/comments are paged back through until the watermark
+SCAN_PAGE_LIMIT = 50
+SCAN_MAX_PAGES = 10
 
-        # check if its a comment by a mod to delete a post
-        if comment_text == "#delete":
-            community = comment['community']['id']
-            post = comment['post']['id']
-            poster = comment['post']['creator_id']
 
-            output = lemmy.community.get(id=community)
+def get_scan_watermark(name, seed_table=None, seed_column=None):
+    with connect_to_mod_db() as conn:
+        row = execute_sql_query(
+            conn, "SELECT last_id FROM scan_state WHERE name = ?", (name,))
+        if row:
+            return row[0]
+        if seed_table is None:
+            return None
 
-            for moderator_info in output['moderators']:
-                if moderator_info['moderator']['id'] == comment_poster:
-                    if poster == settings.BOT_ID:
-                        lemmy.post.delete(post_id=post, deleted=True)
+        # first run with a watermark - carry on from what was already scanned
+        row = execute_sql_query(conn, f"SELECT MAX({seed_column}) FROM {seed_table}")
+        return row[0] if row else None
 
-        community_name = comment['community']['name']
 
-        # check if a giveaway post
-        if settings.GIVEAWAY_ENABLED:
+def set_scan_watermark(name, last_id):
+    with connect_to_mod_db() as conn:
+        execute_sql_query(
+            conn,
+            "INSERT INTO scan_state (name, last_id) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET last_id = excluded.last_id",
+            (name, last_id))
 
-            comment_username = comment['creator']['name']
-            creator_local = comment['creator']['local']
-            thread_id = comment['post']['id']
-            account_age = comment['creator']['published']
-            
-            if check_if_giveaway(thread_id) == True:
-                giveaway_entry(thread_id, comment_poster, comment_username, account_age)
-                
-        # Initialize match flags for each post
-        match_found_text = False
 
-        with connect_to_mod_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT words FROM community_words WHERE community = ?", (community_name,))
-            result = cursor.fetchone()
-            if result:
-                db_words_set = set(result[0].split(','))
+def fetch_since_watermark(list_items, item_key, watermark):
+    """
+    Page back through the newest local items until the watermark id is reached
+    and return everything newer than it, oldest first.
 
-                text_words_set = set(comment_text.lower().split())
+    With no watermark yet only the first page is returned, rather than walking
+    back through the whole instance history.
+    """
+    new_items = {}
+    for page in range(1, SCAN_MAX_PAGES + 1):
+        items = list_items(
+            limit=SCAN_PAGE_LIMIT, page=page, sort=SortType.New, type_=ListingType.Local)
+        if not items:
+            break
 
-                match_found_text = bool(db_words_set & text_words_set)
+        reached_watermark = False
+        for item in items:
+            item_id = item[item_key]['id']
+            if watermark is not None and item_id <= watermark:
+                reached_watermark = True
+                continue
+            new_items[item_id] = item
 
-        if match_found_text:
-            lemmy.comment.report(
-                comment_id,
-                reason="Word in comment appears on community banned list - Automated report by " +
-                bot_strings.BOT_NAME)
-            mod_action = "Comment Flagged"
-            logging.info("Word matching regex found in content, reported.")
+        if reached_watermark or watermark is None or len(items) < SCAN_PAGE_LIMIT:
+            break
+    else:
+        logging.warning("Scanned %s pages of %ss without reaching the last one seen.", SCAN_MAX_PAGES, item_key)
 
-        else:
-            mod_action = "None"
+    return [new_items[item_id] for item_id in sorted(new_items)]
 
-        add_comment_to_db(comment_id, comment_poster, mod_action)
 
-        # admin matrix report
-        regex_pattern = re.compile(settings.SLUR_REGEX)
-        match_found = False
+def send_slur_alert(content_type, content_ids):
+    if not content_ids:
+        return
 
-        if re.search(regex_pattern, comment_text.lower()):
-            match_found = True
+    links = "\n".join(
+        f"- https://{settings.INSTANCE}/{content_type}/{content_id}" for content_id in content_ids)
+    matrix_body = f"Word(s) matching banned list appearing in {len(content_ids)} {content_type}(s). - Please review urgently.\n\n{links}"
+    send_matrix_message(matrix_body)
 
-        if match_found:
-            matrix_body = "Word(s) matching banned list appearing in comment https://" + \
-                settings.INSTANCE + "/comment/" + str(comment_id) + ". - Please review urgently."
-            asyncio.run(send_matrix_message(matrix_body))
-            break
 
+# an item that fails this many checks in a row is skipped, so one bad post or
+# comment can't hold the watermark back forever
+SCAN_MAX_ATTEMPTS = 3
+_scan_failures = {}
 
-def check_comment_db(comment_id):
+
+def scan_item(kind, item_id, scan, item, slur_hits):
+    """
+    Run scan(item, slur_hits) and return whether the watermark can move past
+    item_id: it was scanned, or has now failed SCAN_MAX_ATTEMPTS times.
+    """
     try:
-        with connect_to_mod_db() as conn:
-            action_query = '''SELECT comment_id FROM new_comments WHERE comment_id=?'''
-            comment_match = execute_sql_query(
-                conn, action_query, (comment_id,))
+        scan(item, slur_hits)
+    except Exception:
+        failures = _scan_failures.get((kind, item_id), 0) + 1
+        if failures >= SCAN_MAX_ATTEMPTS:
+            _scan_failures.pop((kind, item_id), None)
+            logging.exception("Scanning %s %s failed %s times, skipping it", kind, item_id, failures)
+            return True
+        _scan_failures[(kind, item_id)] = failures
+        logging.exception("Scanning %s %s failed, will retry next check", kind, item_id)
+        return False
 
-            if comment_match:
-                return "duplicate"
+    _scan_failures.pop((kind, item_id), None)
+    return True
 
-    except Exception as e:
-        logging.error("An error occurred: %s", e)
-    return "error"
+
+def scan_comment(comment, slur_hits):
+    comment_id = comment['comment']['id']
+    comment_text = comment['comment']['content']
+    comment_poster = comment['creator']['id']
+
+    # check if its a comment by a mod to delete a post
+    if comment_text == "#delete":
+        community = comment['community']['id']
+        post = comment['post']['id']
+        poster = comment['post']['creator_id']
+
+        if poster == settings.BOT_ID and cache_manager.is_moderator(comment_poster, community):
+            lemmy.post.delete(post_id=post, deleted=True)
+
+    community_name = comment['community']['name']
+
+    # check if a giveaway post
+    if settings.GIVEAWAY_ENABLED:
+
+        comment_username = comment['creator']['name']
+        creator_local = comment['creator']['local']
+        thread_id = comment['post']['id']
+        account_age = comment['creator']['published']
+
+        if check_if_giveaway(thread_id) == True:
+            giveaway_entry(thread_id, comment_poster, comment_username, account_age)
+
+    # community banned word list
+    if word_filter.find_match(community_name, comment_text):
+        lemmy.comment.report(
+            comment_id,
+            reason="Word in comment appears on community banned list - Automated report by " +
+            bot_strings.BOT_NAME)
+        mod_action = "Comment Flagged"
+        logging.info("Word matching regex found in content, reported.")
+
+    else:
+        mod_action = "None"
+
+    add_comment_to_db(comment_id, comment_poster, mod_action)
+
+    # admin matrix report, sent once for the whole batch
+    if word_filter.get_slur_regex().search(comment_text.lower()):
+        slur_hits.append(comment_id)
+
+
+def check_comments():
+    watermark = get_scan_watermark('comments', 'new_comments', 'comment_id')
+    new_comments = fetch_since_watermark(lemmy.comment.list, 'comment', watermark)
+    last_scanned = None
+    slur_hits = []
+    try:
+        for comment in new_comments:
+            if not scan_item('comment', comment['comment']['id'], scan_comment, comment, slur_hits):
+                # the rest is picked up again next check
+                break
+            last_scanned = comment['comment']['id']
+    finally:
+        if last_scanned is not None:
+            set_scan_watermark('comments', last_scanned)
+        send_slur_alert('comment', slur_hits)
 
 
 def add_comment_to_db(comment_id, comment_poster, mod_action):
@@ -1709,103 +2018,84 @@ def add_comment_to_db(comment_id, comment_poster, mod_action):
     return "error"
 
 
-def check_posts():
-    recent_posts = lemmy.post.list(
-        limit=10,
-        sort=SortType.New,
-        type_=ListingType.Local)
-    for post in recent_posts:
-        post_id = post['post']['id']
-        post_title = post['post']['name']
-
-        # check if post has already been scanned
-        if check_post_db(post_id) == "duplicate":
-            continue
+def scan_post(post, slur_hits):
+    post_id = post['post']['id']
+    post_title = post['post']['name']
 
-        # Check if 'body' exists in the 'post' dictionary
-        if 'body' in post['post']:
-            post_text = post['post']['body']
-        else:
-            post_text = "No body found"
+    # Check if 'body' exists in the 'post' dictionary
+    if 'body' in post['post']:
+        post_text = post['post']['body']
+    else:
+        post_text = "No body found"
+
+    poster_id = post['creator']['id']
+    poster_name = post['creator']['name']
+    community_name = post['community']['name']
+
+    # community banned word list, in the body or title
+    if word_filter.find_match(community_name, post_text, post_title):
+        lemmy.post.report(
+            post_id,
+            reason="Word in post by user " +
+            poster_name +
+            " appears on community slur list - Automated report by " +
+            bot_strings.BOT_NAME)
+        mod_action = "Post Flagged"
+        logging.info(
+            "Word matching community ban list found in post by %s, reported.",
+            poster_name
+        )
 
-        poster_id = post['creator']['id']
-        poster_name = post['creator']['name']
-        community_name = post['community']['name']
+    else:
+        mod_action = "None"
 
-        # Initialize match flags for each post
-        match_found_text = False
-        match_found_title = False
+    add_post_to_db(post_id, poster_id, mod_action)
 
-        with connect_to_mod_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT words FROM community_words WHERE community = ?", (community_name,))
-            result = cursor.fetchone()
-            if result:
-                db_words_set = set(result[0].split(','))
-
-                text_words_set = set(post_text.lower().split())
-                title_words_set = set(post_title.lower().split())
-
-                # Check for word matches in text and title
-                match_found_text = bool(db_words_set & text_words_set)
-                match_found_title = bool(db_words_set & title_words_set)
-
-        if match_found_text or match_found_title:
-            lemmy.post.report(
-                post_id,
-                reason="Word in post by user " +
-                poster_name +
-                " appears on community slur list - Automated report by " +
-                bot_strings.BOT_NAME)
-            mod_action = "Post Flagged"
-            logging.info(
-                "Word matching community ban list found in post by %s, reported.",
-                poster_name
-            )
+    # admin matrix report, sent once for the whole batch
+    slur_regex = word_filter.get_slur_regex()
+    if slur_regex.search(post_text.lower()) or slur_regex.search(post_title.lower()):
+        slur_hits.append(post_id)
 
-        else:
-            mod_action = "None"
+    # Check if the post is meant to have a tag and doesn't have one
+    with connect_to_tags_db() as conn:
+        cursor = conn.cursor()
+        # Check if the community has enforcement rules
+        cursor.execute('SELECT DISTINCT tags FROM enforcement_rules WHERE community = ?', (community_name,))
+        rows = cursor.fetchall()
 
-        add_post_to_db(post_id, poster_id, mod_action)
+        if not rows:
+            return
 
-        # admin matrix report
-        regex_pattern = re.compile(settings.SLUR_REGEX)
-        match_found = False
+        # Get all required tags for this community
+        required_tags = set()
+        for row in rows:
+            required_tags.update(row[0].split(","))  # Convert stored comma-separated tags into a set
 
-        if re.search(regex_pattern, post_text.lower()):
-            match_found = True
-        if re.search(regex_pattern, post_title.lower()):
-            match_found = True
+        # Check if any of the required tags are in the post title
+        if any(tag.lower() in post_title.lower() for tag in required_tags):
+            return  # Post complies, no action needed
+
+        # If the post does not contain the required tags, log it for enforcement
+        log_tag_action(community_name, post_id)
+
+
+def check_posts():
+    watermark = get_scan_watermark('posts', 'new_posts', 'post_id')
+    new_posts = fetch_since_watermark(lemmy.post.list, 'post', watermark)
+    last_scanned = None
+    slur_hits = []
+    try:
+        for post in new_posts:
+            if not scan_item('post', post['post']['id'], scan_post, post, slur_hits):
+                # the rest is picked up again next check
+                break
+            last_scanned = post['post']['id']
+    finally:
+        if last_scanned is not None:
+            set_scan_watermark('posts', last_scanned)
+        send_slur_alert('post', slur_hits)
 
-        if match_found:
-            matrix_body = "Word(s) matching banned list appearing in post https://" + \
-                settings.INSTANCE + "/post/" + str(post_id) + ". - Please review urgently."
-            asyncio.run(send_matrix_message(matrix_body))
-            break
-        
-        # Check if the post is meant to have a tag and doesn't have one
-        with connect_to_tags_db() as conn:
-            cursor = conn.cursor()
-            # Check if the community has enforcement rules
-            cursor.execute('SELECT DISTINCT tags FROM enforcement_rules WHERE community = ?', (community_name,))
-            rows = cursor.fetchall()
 
-            if not rows:
-                continue
-            
-            # Get all required tags for this community
-            required_tags = set()
-            for row in rows:
-                required_tags.update(row[0].split(","))  # Convert stored comma-separated tags into a set
-            
-            # Check if any of the required tags are in the post title
-            if any(tag.lower() in post_title.lower() for tag in required_tags):
-                return  # Post complies, no action needed
-            
-            # If the post does not contain the required tags, log it for enforcement
-            log_tag_action(community_name, post_id)
-            
 def log_tag_action(community, post_id):
     with connect_to_tags_db() as conn:
         cursor = conn.cursor()
@@ -2019,19 +2309,6 @@ def store_enforcement(community, tags, steps):
 
         conn.commit()
 
-def check_post_db(post_id):
-    try:
-        with connect_to_mod_db() as conn:
-            action_query = '''SELECT post_id FROM new_posts WHERE post_id=?'''
-            post_match = execute_sql_query(conn, action_query, (post_id,))
-
-            if post_match:
-                return "duplicate"
-    except Exception as e:
-        logging.error("An error occurred: %s", e)
-    return "error"
-
-
 def add_post_to_db(post_id, poster_id, mod_action):
     try:
         logging.debug("Adding new post to db")
@@ -2048,37 +2325,94 @@ def add_post_to_db(post_id, poster_id, mod_action):
     return "error"
 
 
-def broadcast_message(message):
-    # get lowest and highest local user ids first
+# the longest one send_broadcasts run keeps going before handing back to the
+# scheduler
+BROADCAST_RUN_TIME = 60
+
+
+def broadcast_message(message, admin_id):
+    """
+    Queue a broadcast to every subscribed user, to be sent by send_broadcasts.
+    Returns the broadcast's job id and how many users it will go to.
+    """
+    with connect_to_users_db() as conn:
+        total = conn.execute("SELECT COUNT(*) FROM users WHERE subscribed = 1").fetchone()[0]
+        cursor = conn.execute(
+            "INSERT INTO broadcast_jobs (message, admin_id, total, created) VALUES (?, ?, ?, ?)",
+            (message, admin_id, total, int(time.time())))
+        conn.commit()
+        logging.info("Broadcast %s queued for %s users", cursor.lastrowid, total)
+        return cursor.lastrowid, total
+
+
+def send_broadcast_pm(message, username, public_id):
+    try:
+        return lemmy.private_message.create(
+            bot_strings.GREETING +
+            " " +
+            username +
+            ".\n \n" +
+            message +
+            "\n\n --- \n *This is an automated message. To unsubscribe, please reply to this message with* `#unsubscribe`.",
+            public_id) is not None
+    except Exception:
+        logging.exception("Message failed to send to %s", username)
+        return False
+
+
+def send_broadcasts():
+    """
+    Send queued broadcasts, oldest first, at BROADCAST_RATE messages a second.
+    Each job's position (the last local_user_id sent to) is saved after every
+    message, so a restart carries on from the next user instead of starting
+    over. The admin who sent #broadcast gets a progress PM every
+    BROADCAST_REPORT_EVERY messages and one when it's done.
+    """
+    deadline = time.monotonic() + BROADCAST_RUN_TIME
+    spacing = 1 / settings.BROADCAST_RATE
+
     try:
-        logging.debug("broadcasting message")
         with connect_to_users_db() as conn:
-            cursor = conn.cursor()
-            query = "SELECT public_user_id, username, subscribed FROM users ORDER BY local_user_id"
-            cursor.execute(query)
-
-            for row in cursor.fetchall():
-                public_id, username, subscribed = row
-                try:
-                    if subscribed == 1:
-                        lemmy.private_message.create(
-                            bot_strings.GREETING +
-                            " " +
-                            username +
-                            ".\n \n" +
-                            message +
-                            "\n\n --- \n *This is an automated message. To unsubscribe, please reply to this message with* `#unsubscribe`.",
-                            public_id)
-                        time.sleep(0.1)
-                except Exception as e:
-                    logging.exception("Message failed to send to %s", username)
-    except sqlite3.Error as e:
-        logging.error("SQLite error: %s", e)
+            while time.monotonic() < deadline:
+                job = conn.execute(
+                    "SELECT job_id, message, admin_id, last_user_id, sent, failed, total FROM broadcast_jobs "
+                    "WHERE finished IS NULL ORDER BY job_id LIMIT 1").fetchone()
+                if not job:
+                    return
+                job_id, message, admin_id, last_user_id, sent, failed, total = job
+
+                users = iter_users(
+                    ("local_user_id", "public_user_id", "username"), subscribed=True, after_id=last_user_id)
+                for local_user_id, public_id, username in users:
+                    if time.monotonic() >= deadline:
+                        return
+                    started = time.monotonic()
+
+                    if send_broadcast_pm(message, username, public_id):
+                        sent += 1
+                    else:
+                        failed += 1
+                    conn.execute(
+                        "UPDATE broadcast_jobs SET last_user_id = ?, sent = ?, failed = ? WHERE job_id = ?",
+                        (local_user_id, sent, failed, job_id))
+                    conn.commit()
 
-    finally:
-        if cursor:
-            cursor.close()
+                    if (sent + failed) % settings.BROADCAST_REPORT_EVERY == 0:
+                        pm_outbox.create(
+                            f"Broadcast {job_id} progress: {sent + failed} of about {total} users done ({failed} failed).",
+                            admin_id)
 
+                    time.sleep(max(spacing - (time.monotonic() - started), 0))
+
+                conn.execute("UPDATE broadcast_jobs SET finished = ? WHERE job_id = ?", (int(time.time()), job_id))
+                conn.commit()
+                logging.info("Broadcast %s finished, %s sent, %s failed", job_id, sent, failed)
+                pm_outbox.create(f"Broadcast {job_id} has finished: sent to {sent} users, {failed} failed.", admin_id)
+
+    finally:
+        # only check_pms flushes the outbox otherwise, and that only runs when
+        # there are unread PMs, so the admin's notices are sent from here
+        pm_outbox.flush()
 
 def reject_user(user, rejection):
     with connect_to_users_db() as conn:
@@ -2087,7 +2421,6 @@ def reject_user(user, rejection):
 
         if result:
             email = result[0]
-            logging.info("Rejection email sent to %s", email)
 
             message = MIMEMultipart()
             message['From'] = settings.SENDER_EMAIL
@@ -2098,17 +2431,8 @@ def reject_user(user, rejection):
             body = "We've rejected your Lemmy.zip application. In order to create an inclusive, active, and spam-free Lemmy instance, we manually review each application. If you think this was a mistake, please email us at hello@lemmy.zip from the email address you created your account with and make sure to include your username, and we'll take a look. \n\n Your account was rejected for the following reason: " + rejection
             message.attach(MIMEText(body, 'plain'))
 
-            try:
-                server = smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT)
-                server.starttls()
-                server.login(settings.SENDER_EMAIL, settings.SENDER_PASSWORD)
-                server.sendmail(settings.SENDER_EMAIL, email, message.as_string())
-                logging.info("Rejection email sent successfully")
-            except Exception as e:
-                logging.error("Error: Unable to send email. %s", str(e))
-            finally:
-                server.quit()
-        
+            email_manager.queue_email(email, message, "rejection email")
+
         else:
             logging.warning("No email found for user ID %s", user)
 
@@ -2191,7 +2515,7 @@ def post_reports():
                         if word in report_reason and settings.MATRIX_FLAG:
                             matrix_body = "Report from " + creator + " regarding a post at https://" + settings.INSTANCE + "/post/" + \
                                 str(reported_content_id) + ". The user gave the report reason: " + report_reason + " - Please review urgently."
-                            asyncio.run(send_matrix_message(matrix_body))
+                            send_matrix_message(matrix_body)
                             break
 
 
@@ -2255,7 +2579,7 @@ def comment_reports():
                             # write message to send to matrix
                             matrix_body = "Report from " + creator + " regarding a comment at https://" + settings.INSTANCE + "/comment/" + \
                                 str(reported_content_id) + ". The user gave the report reason: " + report_reason + " - Please review urgently."
-                            asyncio.run(send_matrix_message(matrix_body))
+                            send_matrix_message(matrix_body)
                             break
 
 
@@ -2358,7 +2682,7 @@ def check_scheduled_posts():
                     lemmy.post.feature(
                         int(previous_post), False, FeatureType.Community)
 
-                com_details = lemmy.community.get(name=community_name)
+                com_details = cache_manager.get_community(community_name)
 
                 if com_details is None:
                     query = "DELETE FROM com_posts WHERE pin_id = ?"
@@ -2388,7 +2712,7 @@ def check_scheduled_posts():
                 post_title = post_title.replace(
                     "%w", current_utc.strftime("%A"))  # Day of the week
 
-                com_id = com_details['community_view']['community']['id']
+                com_id = com_details['id']
                 # create post
                 post_output = lemmy.post.create(
                     com_id, post_title, post_url, post_body)
@@ -2478,28 +2802,6 @@ def get_warning_count(person_id):
         logging.info("Error retrieving warning count: %s", e)
         raise
 
-async def send_matrix_message(matrix_body):
-    client = AsyncClient(settings.MATRIX_URL, settings.MATRIX_ACCOUNT)
-
- # use an access token to log in
-    client.access_token = settings.MATRIX_API_KEY
-
-    room_id = settings.MATRIX_ROOM_ID
-
-    # send a message to the room
-    await client.room_send(
-        room_id=room_id,
-        message_type="m.room.message",
-        content={
-            "msgtype": "m.text",
-            "body": matrix_body
-        }
-    )
-
-    # log out
-    await client.close()
-
-
 def ordinal(n):
     if 10 <= n % 100 <= 20:
         suffix = 'th'
@@ -2508,41 +2810,46 @@ def ordinal(n):
     return str(n) + suffix
 
 def insert_block(person_id):
-    
+    # returns whether the default blocks are in place, so onboarding can retry
     if settings.DEFAULT_INSTANCE_BLOCKS:
         instance_blocks_list = [int(x) for x in settings.DEFAULT_INSTANCE_BLOCKS.split(',')]
     else:
         instance_blocks_list = []
-    
+    if not instance_blocks_list:
+        return True
+
     published = datetime.utcnow()
-    
-    try:    
-        conn = psycopg2.connect(host=settings.DB_HOST, port=settings.DB_PORT, user=settings.DB_USER, password=settings.DB_PASSWORD, dbname=settings.DB_NAME)
-        conn.autocommit = False  # Enable transaction handling
-        cursor = conn.cursor()
 
-        for instance_id in instance_blocks_list:
-            # Insert new record
-            cursor.execute(
-                """
-                INSERT INTO instance_block (person_id, instance_id, published)
-                VALUES (%s, %s, %s);
-                """,
-                (person_id, instance_id, published),
-            )
+    conn = None
+    try:
+        conn = PG_POOL.getconn()
+        with conn.cursor() as cursor:
+            for instance_id in instance_blocks_list:
+                # Insert new record, a retry may find some already there
+                cursor.execute(
+                    """
+                    INSERT INTO instance_block (person_id, instance_id, published)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT DO NOTHING;
+                    """,
+                    (person_id, instance_id, published),
+                )
 
         conn.commit()  # Commit transaction
         logging.info("Default block inserted successfully!")
+        return True
 
     except psycopg2.Error as e:
-        conn.rollback()  # Rollback if an error occurs
-        logging.info(f"Database error: {e}")
+        if conn is not None:
+            conn.rollback()  # Rollback if an error occurs
+        logging.error("Database error: %s", e)
+        return False
 
     finally:
-        cursor.close()
-        conn.close()
-        
-           
+        if conn is not None:
+            PG_POOL.putconn(conn)
+
+
 def scan_private_message(pm_context, creator_id):
     spam_flag = False
     ban_flag = False
@@ -2582,15 +2889,15 @@ def scan_private_message(pm_context, creator_id):
                     logging.info(f"User {creator_id} flagged for rapid spam.")
 
         if spam_flag:
-            get_user = lemmy.user.get(creator_id)
+            get_user = cache_manager.get_person(creator_id)
             if not get_user:
                 logging.error(f"Failed to fetch user data for ID {creator_id}")
                 return "notspam"
 
-            name = get_user['person_view']['person']['name']
-            instance = get_user['site']['actor_id'].removeprefix("https://").rstrip("/")
+            name = get_user['name']
+            instance = get_user['site_actor_id'].removeprefix("https://").rstrip("/")
             logging.info(f"site: {instance}")
-            is_admin = get_user['person_view']['is_admin']
+            is_admin = get_user['is_admin']
 
             if is_admin:
                 return "notspam"
@@ -2600,17 +2907,17 @@ def scan_private_message(pm_context, creator_id):
             if ban_flag:
                 logging.info(f"Account likely spam posting - {user_url}. Will ban.")
                 lemmy.user.ban(ban=True, person_id=creator_id, reason="Automod Ban - Identified as a spam account", remove_data=True)
+                cache_manager.invalidate_person(creator_id)
 
                 matrix_body = f"Account likely a spam account, banning: {user_url}"
-                asyncio.run(send_matrix_message(matrix_body))
+                send_matrix_message(matrix_body)
                 return "spam"
             else:
                 logging.info(f"Account possibly spam, warning admin team - {user_url}")
                 matrix_body = f"Account possibly a spam account, manual review required: {user_url}"
-                asyncio.run(send_matrix_message(matrix_body))
-                time.sleep(1)
+                send_matrix_message(matrix_body)
                 matrix_body = f"PM Content: \n\n {pm_context}"
-                asyncio.run(send_matrix_message(matrix_body))
+                send_matrix_message(matrix_body)
                 return "spam"
 
     except Exception as e:
@@ -2628,7 +2935,7 @@ def add_pm_spam_phrase(spam_phrase):
             conn.commit()
             logging.info(f"Spam phrase '{spam_phrase}' added successfully.")
             matrix_body = f"New spam phrase added to PM Scanner: {spam_phrase}"
-            asyncio.run(send_matrix_message(matrix_body))
+            send_matrix_message(matrix_body)
             
     except sqlite3.Error as e:
         logging.error(f"Error adding spam phrase: {e}")
@@ -2650,3 +2957,36 @@ def check_message_bus():
 
         scan_private_message(pm_content, pm_sender)
 
+
+# functions the PM command handlers in pm_functions are given by name
+pm_router.provide(
+    broadcast_status=broadcast_status,
+    add_vote_to_db=add_vote_to_db,
+    create_poll=create_poll,
+    close_poll=close_poll,
+    count_votes=count_votes,
+    add_giveaway_thread=add_giveaway_thread,
+    close_giveaway_thread=close_giveaway_thread,
+    draw_giveaway_thread=draw_giveaway_thread,
+    broadcast_message=broadcast_message,
+    delete_rss=delete_rss,
+    delete_welcome=delete_welcome,
+    add_community_word=add_community_word,
+    add_welcome_message=add_welcome_message,
+    add_new_feed=add_new_feed,
+    connect_to_rss_db=connect_to_rss_db,
+    fetch_latest_posts=fetch_latest_posts,
+    insert_new_posts=insert_new_posts,
+    forget_rss_posts=forget_rss_posts,
+    add_autopost_to_db=add_autopost_to_db,
+    get_first_post_date=get_first_post_date,
+    delete_autopost=delete_autopost,
+    check_dbs=check_dbs,
+    reject_user=reject_user,
+    ban_email=ban_email,
+    send_matrix_message=send_matrix_message,
+    ordinal=ordinal,
+    get_warning_count=get_warning_count,
+    log_warning=log_warning,
+    store_enforcement=store_enforcement,
+    add_pm_spam_phrase=add_pm_spam_phrase)
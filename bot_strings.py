@@ -83,20 +83,24 @@ INS_RULES = (
     "- Try and share ideas, thoughts and criticisms in a constructive way\n"
     "- Tag any NSFW posts as such \n\n")
 
-BOT_COMMANDS = (
-    "These are the commands I currently know:" + "\n\n "
-    "- `#help` - See this message. \n "
-    "- `#rules` - See the current instance rules. \n"
-    "- `#vote` - Vote on an active poll. You'll need to have a vote ID number. An example vote would be `#vote 1 yes` or `#vote 1 no`.\n"
-    "- `#credits` - See who spent their time making this bot work! \n"
-    "- `#autopost` - If you moderate a community, you can schedule an automatic post using this option. Use `#autoposthelp` for a full command list. \n"
-    "- `#rss` - If you moderate a community, you can use RSS feeds to populate it. Use `#rsshelp` for more information. \n\n")
-BOT_ADMIN_COMMANDS = (
-    "As an Admin, you also have access to the following commands: \n"
-    "- `#poll` - Create a poll for users to vote on. Give your poll a name, and you will get back an ID number to users so they can vote on your poll. Example usage: `#poll @Vote for best admin` \n"
-    "- `#closepoll` - Close an existing poll using the poll ID number, for example `#closepoll @1`\n"
-    "- `#countpoll` - Get a total of the responses to a poll using a poll ID number, for example `#countpoll @1` \n"
-    "- `#takeover` - Add a user as a mod to an existing community. Command is `#takeover` followed by these identifiers in this order: `-community_name` then `-user_id` (use `-self` here if you want to apply this to yourself) \n\n")
+BOT_COMMANDS_INTRO = (
+    "These are the commands I currently know:" + "\n\n ")
+BOT_ADMIN_COMMANDS_INTRO = (
+    "As an Admin, you also have access to the following commands: \n")
+# help text for each command, listed in #help in this order. Commands without
+# an entry here still work, they just aren't advertised.
+COMMAND_HELP = {
+    "#help": "See this message.",
+    "#rules": "See the current instance rules.",
+    "#vote": "Vote on an active poll. You'll need to have a vote ID number. An example vote would be `#vote 1 yes` or `#vote 1 no`.",
+    "#credits": "See who spent their time making this bot work!",
+    "#autopost": "If you moderate a community, you can schedule an automatic post using this option. Use `#autoposthelp` for a full command list.",
+    "#rss": "If you moderate a community, you can use RSS feeds to populate it. Use `#rsshelp` for more information.",
+    "#poll": "Create a poll for users to vote on. Give your poll a name, and you will get back an ID number to users so they can vote on your poll. Example usage: `#poll @Vote for best admin`",
+    "#closepoll": "Close an existing poll using the poll ID number, for example `#closepoll @1`",
+    "#countpoll": "Get a total of the responses to a poll using a poll ID number, for example `#countpoll @1`",
+    "#takeover": "Add a user as a mod to an existing community. Command is `#takeover` followed by these identifiers in this order: `-community_name` then `-user_id` (use `-self` here if you want to apply this to yourself)",
+}
 
 THREAD_LOCK_MESSAGE = (
     "This thread has been locked by the Lemmy.zip Admin Team.")
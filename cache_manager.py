@@ -0,0 +1,195 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from config import settings
+from lemmy_manager import get_lemmy_instance
+
+lemmy = get_lemmy_instance()
+
+
+class TTLCache:
+    """
+    A thread safe LRU cache whose entries also expire after ttl seconds.
+    Keeps hit/miss counts so the size and ttl settings can be tuned.
+    """
+
+    def __init__(self, name, ttl, maxsize):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_load(self, key, load):
+        # load(key) is only called on a miss, and a None result isn't cached
+        value = self.get(key)
+        if value is None:
+            value = load(key)
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+person_cache = TTLCache("person", settings.PROFILE_CACHE_TTL, settings.PROFILE_CACHE_SIZE)
+# keyed by ("id", community_id) and ("name", name as it was looked up)
+community_cache = TTLCache("community", settings.COMMUNITY_CACHE_TTL, settings.COMMUNITY_CACHE_SIZE)
+
+# a cached "not a moderator" answer older than this is checked against the API
+MOD_REFRESH_AFTER = 60
+
+CACHES = [person_cache, community_cache]
+
+
+def _load_person(person_id):
+    output = lemmy.user.get(person_id)
+    if not output:
+        return None
+
+    person = output['person_view']['person']
+    return {
+        "id": person['id'],
+        "name": person['name'],
+        "local": person['local'],
+        "published": person['published'],
+        "is_admin": output['person_view']['is_admin'],
+        # the site the person's account is on
+        "site_actor_id": (output.get('site') or {}).get('actor_id'),
+    }
+
+
+def get_person(person_id):
+    """
+    The profile fields the bot uses for a person (name, local, published,
+    is_admin, site_actor_id), or None if they can't be fetched.
+    """
+    try:
+        person_id = int(person_id)
+    except (TypeError, ValueError):
+        return None
+    return person_cache.get_or_load(person_id, _load_person)
+
+
+def invalidate_person(person_id=None):
+    # call after banning someone or changing their admin status, or with no
+    # id to drop every cached profile
+    if person_id is None:
+        person_cache.invalidate()
+        return
+    try:
+        person_cache.invalidate(int(person_id))
+    except (TypeError, ValueError):
+        pass
+
+
+def _community_key(community):
+    # ids are ints, anything else is a community name (name or name@instance)
+    return ("id", community) if isinstance(community, int) else ("name", community)
+
+
+def _load_community(key):
+    kind, value = key
+    output = lemmy.community.get(**{kind: value})
+    if not output or output.get('moderators') is None:
+        return None
+
+    moderators = [(info['moderator']['id'], info['moderator']['name']) for info in output['moderators']]
+    return {
+        "id": output['community_view']['community']['id'],
+        "name": output['community_view']['community']['name'],
+        # (id, name) in the order the API lists them
+        "moderators": moderators,
+        "moderator_ids": frozenset(mod_id for mod_id, _ in moderators),
+        "loaded": time.monotonic(),
+    }
+
+
+def get_community(community, refresh=False):
+    """
+    The id, name and moderators of a community, looked up by id (int) or by
+    name (str). None if it can't be found.
+    """
+    key = _community_key(community)
+    details = None if refresh else community_cache.get(key)
+    if details is None:
+        details = _load_community(key)
+        if details is None:
+            return None
+        community_cache.set(("id", details['id']), details)
+        community_cache.set(key, details)
+    return details
+
+
+def is_moderator(person_id, community):
+    """
+    Whether person_id moderates the community (an id or name, see
+    get_community). A "no" from an entry that's more than MOD_REFRESH_AFTER
+    seconds old is refreshed first, so new mods don't wait for the TTL.
+    """
+    details = get_community(community)
+    if details is None:
+        return False
+    if person_id not in details['moderator_ids'] and time.monotonic() - details['loaded'] > MOD_REFRESH_AFTER:
+        details = get_community(community, refresh=True)
+    return details is not None and person_id in details['moderator_ids']
+
+
+def invalidate_community(community=None):
+    # call after changing a community's moderators, or with nothing to drop
+    # every cached community
+    if community is None:
+        community_cache.invalidate()
+        return
+    key = _community_key(community)
+    details = community_cache.get(key)
+    community_cache.invalidate(key)
+    if details is not None:
+        community_cache.invalidate(("id", details['id']))
+        community_cache.invalidate(("name", details['name']))
+
+
+def log_cache_stats():
+    for cache in CACHES:
+        stats = cache.stats()
+        logging.info(
+            "%s cache: %s entries, %s hits, %s misses (%.0f%% hit ratio)",
+            cache.name, stats["size"], stats["hits"], stats["misses"], stats["hit_ratio"] * 100)
@@ -32,6 +32,33 @@ class Settings(BaseSettings):
     DB_HOST: str
     DB_PORT: int
     DEFAULT_INSTANCE_BLOCKS: str
+    JOB_WORKERS: int = 0
+    SLUR_REGEX_FILE: str = ""
+    PM_CONCURRENCY: int = 4
+    PM_MIN_INTERVAL: int = 2
+    PM_MAX_INTERVAL: int = 15
+    HTTP_CONNECT_TIMEOUT: int = 5
+    HTTP_LEMMY_TIMEOUT: int = 10
+    HTTP_FEED_TIMEOUT: int = 20
+    HTTP_DEFAULT_TIMEOUT: int = 10
+    HTTP_LEMMY_POOL_SIZE: int = 16
+    HTTP_HOST_POOLS: int = 32
+    HTTP_POOL_SIZE: int = 4
+    LEMMY_FAILURE_BUDGET: int = 20
+    RATE_LIMIT_HEADROOM: float = 0.8
+    BROADCAST_RATE: float = 2
+    BROADCAST_REPORT_EVERY: int = 500
+    EMAIL_MAX_ATTEMPTS: int = 5
+    SMTP_TIMEOUT: int = 30
+    SMTP_IDLE_TIMEOUT: int = 60
+    RSS_WORKERS: int = 8
+    RSS_MIN_INTERVAL: int = 5 * 60
+    RSS_MAX_INTERVAL: int = 6 * 60 * 60
+    RSS_SEEN_CACHE_SIZE: int = 5000
+    PROFILE_CACHE_TTL: int = 5 * 60
+    PROFILE_CACHE_SIZE: int = 1000
+    COMMUNITY_CACHE_TTL: int = 10 * 60
+    COMMUNITY_CACHE_SIZE: int = 1000
     
     class Config:
         env_file = ".env"
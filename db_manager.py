@@ -0,0 +1,159 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# local database files
+VOTE_DB = 'resources/vote.db'
+USERS_DB = 'resources/users.db'
+GAMES_DB = 'resources/games.db'
+WELCOME_DB = 'resources/welcome/welcome.db'
+MOD_DB = 'resources/mod_actions.db'
+RSS_DB = 'resources/rss.db'
+REPORTS_DB = 'resources/reports.db'
+AUTOPOST_DB = 'resources/autopost.db'
+GIVEAWAY_DB = 'resources/giveaway.db'
+TAGS_DB = 'resources/tags.db'
+BUS_DB = 'resources/welcome/bus.db'
+EMAIL_DB = 'resources/email.db'
+
+# idle connections kept open per database file
+MAX_IDLE = 4
+# prepared statements sqlite3 keeps per connection
+CACHED_STATEMENTS = 256
+
+_idle = {}
+# bumped when a file is deleted so connections to the old file aren't reused
+_generation = {}
+_lock = threading.Lock()
+_stats = {
+    "checkouts": 0,
+    "opened": 0,
+    "checkout_time": 0.0,
+}
+
+
+class PooledConnection:
+    """
+    A sqlite3 connection checked out of the pool.
+
+    Behaves like the connection it wraps, including `with conn:` committing or
+    rolling back, but close() hands it back to the pool instead of closing it.
+    It is also handed back when the object goes out of scope, so existing code
+    that never calls close() doesn't leak connections.
+    """
+
+    def __init__(self, path, conn, generation):
+        self._path = path
+        self._conn = conn
+        self._generation = generation
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._conn.__exit__(exc_type, exc_value, traceback)
+
+    def close(self):
+        if self._conn is not None:
+            _release(self._path, self._conn, self._generation)
+            self._conn = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            # interpreter shutdown, nothing left to hand back to
+            pass
+
+
+def _open(path):
+    conn = sqlite3.connect(
+        path,
+        timeout=10,
+        check_same_thread=False,
+        cached_statements=CACHED_STATEMENTS)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    logging.debug("Opened pooled connection to %s", path)
+    return conn
+
+
+def _release(path, conn, generation):
+    try:
+        # same as closing a connection without committing
+        if conn.in_transaction:
+            conn.rollback()
+    except sqlite3.Error as e:
+        logging.error("Discarding broken connection to %s: %s", path, e)
+        conn.close()
+        return
+
+    with _lock:
+        idle = _idle.setdefault(path, [])
+        if generation == _generation.get(path, 0) and len(idle) < MAX_IDLE:
+            idle.append(conn)
+            return
+    conn.close()
+
+
+def connect(path):
+    start = time.perf_counter()
+    with _lock:
+        idle = _idle.get(path)
+        conn = idle.pop() if idle else None
+        generation = _generation.get(path, 0)
+
+    if conn is None:
+        conn = _open(path)
+        opened = 1
+    else:
+        opened = 0
+
+    with _lock:
+        _stats["checkouts"] += 1
+        _stats["opened"] += opened
+        _stats["checkout_time"] += time.perf_counter() - start
+    return PooledConnection(path, conn, generation)
+
+
+def close_db(path):
+    with _lock:
+        idle = _idle.pop(path, [])
+        _generation[path] = _generation.get(path, 0) + 1
+    for conn in idle:
+        conn.close()
+
+
+def remove_db(path):
+    # drop pooled connections before deleting the file (and its WAL files)
+    close_db(path)
+    for file_path in (path, path + '-wal', path + '-shm'):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+def pool_stats():
+    with _lock:
+        checkouts = _stats["checkouts"]
+        return {
+            "checkouts": checkouts,
+            "opened": _stats["opened"],
+            "reused": checkouts - _stats["opened"],
+            "idle": sum(len(idle) for idle in _idle.values()),
+            "avg_checkout_us": _stats["checkout_time"] / checkouts * 1_000_000 if checkouts else 0.0,
+        }
+
+
+def log_pool_stats():
+    stats = pool_stats()
+    logging.info(
+        "DB pool: %s checkouts, %s opened, %s reused, %s idle, %.1fus average checkout",
+        stats["checkouts"], stats["opened"], stats["reused"], stats["idle"], stats["avg_checkout_us"])
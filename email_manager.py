@@ -0,0 +1,234 @@
+import logging
+import os
+import smtplib
+import threading
+import time
+from email.mime.image import MIMEImage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import bot_strings
+import db_manager
+from config import settings
+
+# due emails sent per send_queued_emails batch query
+SEND_BATCH = 20
+# retry delays double from RETRY_BASE_DELAY up to RETRY_MAX_DELAY seconds
+RETRY_BASE_DELAY = 60
+RETRY_MAX_DELAY = 60 * 60
+
+# the html welcome email and its inline images (src="cid:image-1" etc.)
+WELCOME_HTML = 'resources/index.html'
+WELCOME_IMAGES = [
+    ('resources/images/image-1.png', '<image-1>'),
+    ('resources/images/image-2.png', '<image-2>'),
+]
+
+# (file mtimes it was built from, rendered headers, rendered body)
+_welcome = None
+_welcome_lock = threading.Lock()
+
+_server = None
+_last_used = 0.0
+# one sender at a time, the SMTP connection isn't shared between threads
+_send_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {
+    "queued": 0,
+    "sent": 0,
+    "retries": 0,
+    "failed": 0,
+    "connections": 0,
+}
+
+
+def _count(stat):
+    with _stats_lock:
+        _stats[stat] += 1
+
+
+def queue_email(recipient, message, description="email"):
+    """
+    Queue an email (an email.message.Message, or one already rendered to a
+    string) to be sent by send_queued_emails and return straight away.
+    Queued emails survive a restart.
+    """
+    if not isinstance(message, str):
+        message = message.as_string()
+    with db_manager.connect(db_manager.EMAIL_DB) as conn:
+        conn.execute(
+            "INSERT INTO outbox (recipient, message, description, created) VALUES (?, ?, ?, ?)",
+            (recipient, message, description, int(time.time())))
+        conn.commit()
+    _count("queued")
+    logging.info("Queued %s to %s", description, recipient)
+
+
+def _render_welcome():
+    message = MIMEMultipart()
+    message['From'] = settings.SENDER_EMAIL
+    message['Subject'] = bot_strings.EMAIL_SUBJECT
+
+    with open(WELCOME_HTML, 'r', encoding='utf-8') as html_file:
+        message.attach(MIMEText(html_file.read(), 'html'))
+
+    for path, content_id in WELCOME_IMAGES:
+        with open(path, 'rb') as image_file:
+            image = MIMEImage(image_file.read())
+        image.add_header('Content-ID', content_id)
+        message.attach(image)
+
+    headers, body = message.as_string().split("\n\n", 1)
+    return headers, body
+
+
+def _welcome_mtimes():
+    return tuple(os.stat(path).st_mtime_ns for path in [WELCOME_HTML] + [path for path, _ in WELCOME_IMAGES])
+
+
+def welcome_message(recipient):
+    """
+    The welcome email for recipient, rendered to a string for queue_email.
+    The html and images are only read and encoded when one of the files has
+    changed, each email just adds its own To header to the cached copy.
+    """
+    global _welcome
+    mtimes = _welcome_mtimes()
+    with _welcome_lock:
+        if _welcome is None or _welcome[0] != mtimes:
+            _welcome = (mtimes, *_render_welcome())
+            logging.debug("Rendered welcome email template")
+        _, headers, body = _welcome
+
+    # the address comes from a sign up form, don't let it add headers
+    recipient = recipient.replace("\r", "").replace("\n", "")
+    return f"{headers}\nTo: {recipient}\n\n{body}"
+
+
+def _connect():
+    global _server
+    server = smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT)
+    server.starttls()
+    server.login(settings.SENDER_EMAIL, settings.SENDER_PASSWORD)
+    _server = server
+    _count("connections")
+    logging.debug("Opened SMTP connection to %s", settings.SMTP_SERVER)
+
+
+def _disconnect():
+    global _server
+    if _server is None:
+        return
+    try:
+        _server.quit()
+    except (smtplib.SMTPException, OSError):
+        _server.close()
+    _server = None
+
+
+def _get_server():
+    # mail servers drop idle connections, so one that's been idle a while is
+    # checked before it's trusted with a message
+    if _server is not None and time.monotonic() - _last_used > settings.SMTP_IDLE_TIMEOUT:
+        try:
+            _server.noop()
+        except (smtplib.SMTPException, OSError):
+            _disconnect()
+    if _server is None:
+        _connect()
+    return _server
+
+
+def _deliver(recipient, message):
+    global _last_used
+    try:
+        _get_server().sendmail(settings.SENDER_EMAIL, recipient, message)
+    except (smtplib.SMTPServerDisconnected, ConnectionError):
+        # dropped since it was checked, one go on a fresh connection
+        _disconnect()
+        _get_server().sendmail(settings.SENDER_EMAIL, recipient, message)
+    _last_used = time.monotonic()
+
+
+def _is_server_error(error):
+    # SMTPException is an OSError too, but most of them are about one message
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, smtplib.SMTPAuthenticationError)):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+def _retry_delay(attempts):
+    return min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+
+
+def send_queued_emails():
+    """
+    Send every queued email that's due, reusing one logged in SMTP connection
+    for all of them (and for later runs, until it has been idle for
+    SMTP_IDLE_TIMEOUT). A failed email is retried with a growing delay, up to
+    EMAIL_MAX_ATTEMPTS tries, unless the server refused the recipient.
+    """
+    with _send_lock:
+        while True:
+            with db_manager.connect(db_manager.EMAIL_DB) as conn:
+                emails = conn.execute(
+                    "SELECT email_id, recipient, message, description, attempts FROM outbox "
+                    "WHERE status = 'pending' AND next_attempt <= ? ORDER BY email_id LIMIT ?",
+                    (int(time.time()), SEND_BATCH)).fetchall()
+            if not emails:
+                break
+
+            for email_id, recipient, message, description, attempts in emails:
+                try:
+                    _deliver(recipient, message)
+                except Exception as e:
+                    _email_failed(email_id, recipient, description, attempts + 1, e)
+                    if _is_server_error(e):
+                        # the server's the problem, not this email, try again next run
+                        _disconnect()
+                        return
+                    continue
+
+                with db_manager.connect(db_manager.EMAIL_DB) as conn:
+                    conn.execute("DELETE FROM outbox WHERE email_id = ?", (email_id,))
+                    conn.commit()
+                _count("sent")
+                logging.info("Sent %s to %s", description, recipient)
+
+        if _server is not None and time.monotonic() - _last_used > settings.SMTP_IDLE_TIMEOUT:
+            _disconnect()
+
+
+def _email_failed(email_id, recipient, description, attempts, error):
+    permanent = isinstance(error, smtplib.SMTPRecipientsRefused) or attempts >= settings.EMAIL_MAX_ATTEMPTS
+    with db_manager.connect(db_manager.EMAIL_DB) as conn:
+        if permanent:
+            conn.execute(
+                "UPDATE outbox SET status = 'failed', attempts = ?, last_error = ? WHERE email_id = ?",
+                (attempts, str(error), email_id))
+        else:
+            conn.execute(
+                "UPDATE outbox SET attempts = ?, next_attempt = ?, last_error = ? WHERE email_id = ?",
+                (attempts, int(time.time() + _retry_delay(attempts)), str(error), email_id))
+        conn.commit()
+
+    if permanent:
+        _count("failed")
+        logging.error("Giving up on %s to %s after %s attempts: %s", description, recipient, attempts, error)
+    else:
+        _count("retries")
+        logging.warning("Unable to send %s to %s, will retry: %s", description, recipient, error)
+
+
+def email_stats():
+    with db_manager.connect(db_manager.EMAIL_DB) as conn:
+        pending = conn.execute("SELECT COUNT(*) FROM outbox WHERE status = 'pending'").fetchone()[0]
+    with _stats_lock:
+        return dict(_stats, pending=pending)
+
+
+def log_email_stats():
+    stats = email_stats()
+    logging.info(
+        "Email outbox: %s queued, %s sent over %s connections, %s retries, %s failed, %s pending",
+        stats["queued"], stats["sent"], stats["connections"], stats["retries"], stats["failed"], stats["pending"])
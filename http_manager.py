@@ -0,0 +1,97 @@
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import settings
+
+USER_AGENT = f"{settings.INSTANCE} community bot"
+
+LEMMY_URL = f"https://{settings.INSTANCE}"
+
+# (connect, read) timeouts in seconds for each kind of request
+TIMEOUTS = {
+    "lemmy": (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_LEMMY_TIMEOUT),
+    "feed": (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_FEED_TIMEOUT),
+    "default": (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_DEFAULT_TIMEOUT),
+}
+
+_session = None
+_lock = threading.Lock()
+
+
+def _build_session():
+    session = requests.Session()
+    session.headers["User-Agent"] = USER_AGENT
+
+    # every job and PM worker may be talking to our own instance at once, so
+    # it gets a bigger pool than the feed sites, which see a few requests each
+    session.mount(LEMMY_URL, HTTPAdapter(
+        pool_connections=1, pool_maxsize=settings.HTTP_LEMMY_POOL_SIZE))
+    default_adapter = HTTPAdapter(
+        pool_connections=settings.HTTP_HOST_POOLS, pool_maxsize=settings.HTTP_POOL_SIZE)
+    session.mount("https://", default_adapter)
+    session.mount("http://", default_adapter)
+    return session
+
+
+def get_session():
+    """
+    The shared requests session for outbound fetches, so repeat requests to a
+    host reuse its open connection instead of a new TCP/TLS handshake.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            _session = _build_session()
+        return _session
+
+
+def timeout(kind):
+    return TIMEOUTS.get(kind, TIMEOUTS["default"])
+
+
+def request(method, url, kind="default", **kwargs):
+    kwargs.setdefault("timeout", timeout(kind))
+    return get_session().request(method, url, **kwargs)
+
+
+def get(url, kind="default", **kwargs):
+    return request("GET", url, kind, **kwargs)
+
+
+def feed_headers(response):
+    """
+    A response's headers for feedparser.parse(response_headers=...). feedparser
+    copies them into a plain dict and looks up lowercase names, so requests'
+    case insensitive headers would lose the Content-Type (and its charset).
+    """
+    return {name.lower(): value for name, value in response.headers.items()}
+
+
+def connection_stats():
+    """
+    Per host connection pool stats: connections opened vs requests sent over
+    them. The closer connections is to requests, the less reuse we get.
+    """
+    stats = {}
+    for adapter in set(get_session().adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = f"{pool.scheme}://{pool.host}"
+            host_stats = stats.setdefault(host, {"connections": 0, "requests": 0})
+            host_stats["connections"] += pool.num_connections
+            host_stats["requests"] += pool.num_requests
+    return stats
+
+
+def log_connection_stats():
+    stats = connection_stats()
+    if stats:
+        logging.info("HTTP connections: %s", ", ".join(
+            f"{host}={s['requests']} requests/{s['connections']} connections"
+            for host, s in sorted(stats.items(), key=lambda item: -item[1]["requests"])))
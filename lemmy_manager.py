@@ -1,18 +1,206 @@
 from pythorhead import Lemmy
+from pythorhead import requestor
 from config import settings
-import sys
+import http_manager
+import rate_limit_manager
+import logging
+import os
+import random
+import requests
+import threading
 import time
+import urllib3
 
 # Global variable
 LEMMY = None
 
+# how long to hold off after Lemmy says we're rate limited, if it doesn't say
+RATE_LIMIT_PAUSE = 10
+
+# transient server errors are retried this many times in all, backing off
+# exponentially (with jitter) from RETRY_BASE_DELAY up to RETRY_MAX_DELAY
+RETRY_STATUSES = {500, 502, 503, 504}
+MAX_ATTEMPTS = 4
+RETRY_BASE_DELAY = 1
+RETRY_MAX_DELAY = 30
+
+_rate_limited_until = 0.0
+_rate_limit_lock = threading.Lock()
+_login_lock = threading.Lock()
+_failures = 0
+_failure_lock = threading.Lock()
+
+
+def _is_rate_limited(response):
+    if response.status_code == 429:
+        return True
+    # lemmy reports its own rate limiting as an error body
+    return not response.ok and "rate_limit" in response.text[:200]
+
+
+def _watch_rate_limits(send):
+    def request(url, **kwargs):
+        response = send(url, **kwargs)
+        if _is_rate_limited(response):
+            retry_after = response.headers.get("Retry-After", "")
+            pause = int(retry_after) if retry_after.isdigit() else RATE_LIMIT_PAUSE
+            note_rate_limited(pause)
+        return response
+    return request
+
+
+def _is_auth_error(response):
+    if response.status_code == 401:
+        return True
+    # an expired or revoked jwt
+    return not response.ok and "not_logged_in" in response.text[:200]
+
+
+def _backoff(attempt):
+    delay = min(RETRY_BASE_DELAY * 2 ** attempt, RETRY_MAX_DELAY)
+    time.sleep(random.uniform(delay / 2, delay))
+
+
+def _never_sent(error):
+    # the connection couldn't be made, so the server can't have acted on it
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+
+def _retry_failures(method, send):
+    # a POST or PUT that timed out or got a 5xx may still have gone through
+    # (a PM sent, a user banned), so only GETs are sent again after that
+    idempotent = method == "GET"
+
+    def request(url, **kwargs):
+        # the login call itself must never trigger a re-login
+        can_relog = not url.endswith("/user/login")
+        for attempt in range(MAX_ATTEMPTS):
+            last_attempt = attempt + 1 == MAX_ATTEMPTS
+            try:
+                response = send(url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if last_attempt or not (idempotent or _never_sent(e)):
+                    note_api_failure()
+                    raise
+                logging.warning("Lemmy request failed (%s), retrying", e)
+                _backoff(attempt)
+                continue
+
+            if can_relog and _is_auth_error(response):
+                can_relog = False
+                if relog_in(kwargs.get("headers")):
+                    continue
+
+            if response.status_code in RETRY_STATUSES and idempotent and not last_attempt:
+                logging.warning("Lemmy returned %s for %s, retrying", response.status_code, url)
+                _backoff(attempt)
+                continue
+
+            if response.status_code >= 500 or _is_auth_error(response):
+                note_api_failure()
+            else:
+                note_api_success()
+            return response
+    return request
+
+
+def _session_send(method):
+    # keep-alive connections from the shared session instead of a new
+    # connection per call with requests.get/put/post
+    def send(url, **kwargs):
+        # our timeouts rather than pythorhead's single request_timeout
+        kwargs.pop("timeout", None)
+        return http_manager.request(method, url, "lemmy", **kwargs)
+    return send
+
+
+# pythorhead sends every API call through this map. It isn't public API, so
+# requirements.txt pins the pythorhead version this was written against
+for _method in requestor.Request:
+    requestor.REQUEST_MAP[_method] = _retry_failures(
+        _method.value, rate_limit_manager.governed(_method.value, _watch_rate_limits(_session_send(_method.value))))
+
+
+def _current_token():
+    # pythorhead has no public accessor for the current token
+    return LEMMY._requestor._auth.token
+
+
+def relog_in(headers=None):
+    """
+    Get a fresh JWT after ours expired or was revoked, without restarting.
+    The Authorization header in headers (the failed request's) is updated
+    so the request can be retried. Only one thread logs in, the others pick
+    up its token.
+    """
+    with _login_lock:
+        token = _current_token()
+        if headers is None or headers.get("Authorization") == f"Bearer {token}":
+            logging.warning("Lemmy login is no longer valid, logging in again")
+            LEMMY.log_in(settings.USERNAME, settings.PASSWORD)
+            # a failed login leaves the old token in place and still reports
+            # success, so only a new token counts
+            if _current_token() in (None, token):
+                logging.error("Logging in to Lemmy again failed")
+                return False
+            token = _current_token()
+
+        if headers is not None and "Authorization" in headers:
+            headers["Authorization"] = f"Bearer {token}"
+        return True
+
+
+def note_api_success():
+    global _failures
+    _failures = 0
+
+
+def note_api_failure():
+    """
+    Count a Lemmy call that failed even after retrying. The bot is only
+    restarted once LEMMY_FAILURE_BUDGET calls in a row have failed.
+    """
+    global _failures
+    with _failure_lock:
+        _failures += 1
+        failures = _failures
+    if failures >= settings.LEMMY_FAILURE_BUDGET:
+        logging.error("%s Lemmy API calls in a row have failed, restarting bot...", failures)
+        restart_bot()
+
+
+def note_rate_limited(pause):
+    global _rate_limited_until
+    with _rate_limit_lock:
+        _rate_limited_until = max(_rate_limited_until, time.monotonic() + pause)
+    logging.warning("Rate limited by Lemmy, backing off for %ss", pause)
+
+
+def rate_limit_remaining():
+    return max(_rate_limited_until - time.monotonic(), 0)
+
+
+def wait_for_rate_limit():
+    # block while a rate limit backoff is in progress
+    while (remaining := rate_limit_remaining()) > 0:
+        time.sleep(remaining)
+
+
 def login():
     global LEMMY
      
     LEMMY = Lemmy("https://" + settings.INSTANCE, request_timeout=10)
     LEMMY.log_in(settings.USERNAME, settings.PASSWORD)
+    load_rate_limits()
     return LEMMY
 
+def load_rate_limits():
+    # pace our calls to the limits the instance advertises, re-read now and then
+    rate_limit_manager.configure(LEMMY.site.get())
+
 def get_lemmy_instance():
     global LEMMY
     if LEMMY is None:
@@ -21,4 +209,5 @@ def get_lemmy_instance():
 
 def restart_bot():
     time.sleep(15) 
-    sys.exit(1)  
\ No newline at end of file
+    # jobs run in worker threads, where sys.exit would only end that thread
+    os._exit(1)  
\ No newline at end of file
@@ -1,15 +1,25 @@
+import asyncio
 import logging
-import time
-import schedule
 
-from lemmy_manager import login
+from lemmy_manager import login, load_rate_limits
 from config import settings
+from scheduler import Job, run_jobs
+import cache_manager
+import db_manager
+import email_manager
+import http_manager
+import matrix_manager
+import onboarding
+import pm_outbox
+import pm_router
+import rate_limit_manager
+import word_filter
 
 from bot_code import (
-    check_pms, check_dbs, get_new_users, get_communities, steam_deals, 
+    check_pms, pm_poll_interval, check_dbs, get_new_users, get_communities, steam_deals, 
     check_comments, check_posts, check_reports, check_scheduled_posts, 
     clear_notifications, RSS_feed, check_version, check_pending_enforcements,
-    check_message_bus
+    check_message_bus, send_broadcasts
 )
 
 # Call login function
@@ -29,26 +39,44 @@ if __name__ == "__main__":
     check_version()
     check_dbs()
 
-    # seconds
-    schedule.every(5).seconds.do(check_pms)
-    schedule.every(5).seconds.do(check_message_bus)
-    schedule.every(10).seconds.do(get_new_users)
-    schedule.every(30).seconds.do(get_communities)
-    schedule.every(30).seconds.do(check_reports)
-    schedule.every(30).seconds.do(check_scheduled_posts)
-    schedule.every(30).seconds.do(check_pending_enforcements)
+    jobs = [
+        # seconds
+        Job(check_pms, pm_poll_interval, timeout=5 * 60),
+        Job(check_message_bus, 5),
+        Job(get_new_users, 10),
+        Job(get_communities, 30),
+        Job(check_reports, 30),
+        Job(check_scheduled_posts, 30),
+        Job(check_pending_enforcements, 30),
+        Job(send_broadcasts, 10, timeout=5 * 60),
+        Job(email_manager.send_queued_emails, 5, timeout=5 * 60),
 
-    # minutes
-    schedule.every(30).minutes.do(clear_notifications)
-    schedule.every(10).minutes.do(steam_deals)
+        # minutes
+        Job(clear_notifications, 30 * 60),
+        Job(load_rate_limits, 30 * 60),
+        Job(steam_deals, 10 * 60, timeout=5 * 60),
+        Job(db_manager.log_pool_stats, 10 * 60),
+        Job(http_manager.log_connection_stats, 10 * 60),
+        Job(rate_limit_manager.log_rate_limit_stats, 10 * 60),
+        Job(matrix_manager.log_matrix_stats, 10 * 60),
+        Job(word_filter.log_match_counts, 30 * 60),
+        Job(pm_router.log_command_stats, 30 * 60),
+        Job(pm_outbox.log_outbox_stats, 30 * 60),
+        Job(cache_manager.log_cache_stats, 30 * 60),
+        Job(email_manager.log_email_stats, 30 * 60),
+        Job(onboarding.log_onboarding_stats, 30 * 60),
+    ]
+
+    # each onboarding stage (welcome PM, spam check, email...) polls its own work
+    jobs.extend(Job(worker, 5, timeout=5 * 60) for worker in onboarding.stage_workers())
 
     # optional
     if settings.SLUR_ENABLED: #this needs taking out as giveaway functionality is behind check_comments
-        schedule.every(10).seconds.do(check_comments)
-        schedule.every(10).seconds.do(check_posts)
+        jobs.append(Job(check_comments, 10))
+        jobs.append(Job(check_posts, 10))
+        jobs.append(Job(word_filter.reload_slur_regex, 5 * 60))
     if settings.RSS_ENABLED:
-        schedule.every(10).minutes.do(RSS_feed)
+        # each feed has its own schedule, this only checks which are due
+        jobs.append(Job(RSS_feed, 60, timeout=15 * 60))
 
-while True:
-    schedule.run_pending()
-    time.sleep(1)
+    asyncio.run(run_jobs(jobs))
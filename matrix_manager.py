@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+
+from nio import AsyncClient, RoomSendError
+
+from config import settings
+
+# messages queued within this many seconds of each other go out as one
+COALESCE_WINDOW = 2
+MAX_BATCH = 20
+MAX_RETRIES = 5
+
+_queue = queue.Queue()
+_thread = None
+_start_lock = threading.Lock()
+# bumped by every job thread that sends and by the sender thread
+_stats_lock = threading.Lock()
+_stats = {
+    "queued": 0,
+    "sent": 0,
+    "batches": 0,
+    "retries": 0,
+    "dropped": 0,
+}
+
+
+def _count(stat, amount=1):
+    with _stats_lock:
+        _stats[stat] += amount
+
+
+def send_matrix_message(matrix_body):
+    """
+    Queue a message for the admin Matrix room and return straight away.
+
+    Messages are sent in the background over one long-lived client, and a
+    burst of messages is combined into a single Matrix message.
+    """
+    _ensure_started()
+    _count("queued")
+    _queue.put(matrix_body)
+
+
+def queue_depth():
+    return _queue.qsize()
+
+
+def matrix_stats():
+    with _stats_lock:
+        return dict(_stats, queue_depth=queue_depth())
+
+
+def log_matrix_stats():
+    stats = matrix_stats()
+    logging.info(
+        "Matrix sender: %s queued, %s sent in %s batches, %s retries, %s dropped, %s waiting",
+        stats["queued"], stats["sent"], stats["batches"], stats["retries"], stats["dropped"], stats["queue_depth"])
+
+
+def _ensure_started():
+    global _thread
+    with _start_lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_run, name="matrix-sender", daemon=True)
+            _thread.start()
+
+
+def _run():
+    asyncio.run(_sender())
+
+
+def _next_batch():
+    batch = [_queue.get()]
+    deadline = time.monotonic() + COALESCE_WINDOW
+    while len(batch) < MAX_BATCH:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+async def _send(client, matrix_body):
+    for attempt in range(MAX_RETRIES):
+        try:
+            response = await client.room_send(
+                room_id=settings.MATRIX_ROOM_ID,
+                message_type="m.room.message",
+                content={
+                    "msgtype": "m.text",
+                    "body": matrix_body
+                }
+            )
+            if not isinstance(response, RoomSendError):
+                return True
+            logging.warning("Matrix send failed: %s", response.message)
+        except Exception as e:
+            logging.warning("Matrix send failed: %s", e)
+
+        if attempt + 1 < MAX_RETRIES:
+            _count("retries")
+            await asyncio.sleep(2 ** attempt)
+    return False
+
+
+async def _sender():
+    client = AsyncClient(settings.MATRIX_URL, settings.MATRIX_ACCOUNT)
+    # use an access token to log in
+    client.access_token = settings.MATRIX_API_KEY
+
+    try:
+        while True:
+            # this loop only exists to send, so blocking it while idle is fine
+            batch = _next_batch()
+            if await _send(client, "\n\n".join(batch)):
+                _count("sent", len(batch))
+                _count("batches")
+            else:
+                _count("dropped", len(batch))
+                logging.error("Dropped %s Matrix message(s) after %s attempts", len(batch), MAX_RETRIES)
+    finally:
+        await client.close()
@@ -0,0 +1,134 @@
+import logging
+import sqlite3
+
+import db_manager
+
+
+def dedupe(table, column):
+    # keep the first row for each value so a unique index can be added. NULLs
+    # never clash in a unique index, so rows without a value are all kept
+    return (f"DELETE FROM {table} WHERE {column} IS NOT NULL AND rowid NOT IN "
+            f"(SELECT MIN(rowid) FROM {table} WHERE {column} IS NOT NULL GROUP BY {column})")
+
+
+# Schema changes per database file, applied in order on top of the tables
+# check_dbs creates. The position in each list is the schema version, which
+# is stored in the file itself (PRAGMA user_version), so only add to the end.
+MIGRATIONS = {
+    db_manager.MOD_DB: [
+        # 1 - index the scanned posts/comments and warnings lookups
+        [
+            dedupe('new_comments', 'comment_id'),
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_new_comments_comment_id ON new_comments (comment_id)",
+            dedupe('new_posts', 'post_id'),
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_new_posts_post_id ON new_posts (post_id)",
+            "CREATE INDEX IF NOT EXISTS idx_warnings_user_id ON warnings (user_id)",
+        ],
+    ],
+    db_manager.REPORTS_DB: [
+        # 1 - one row per report
+        [
+            dedupe('post_reports', 'report_id'),
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_post_reports_report_id ON post_reports (report_id)",
+            dedupe('comment_reports', 'report_id'),
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_comment_reports_report_id ON comment_reports (report_id)",
+        ],
+    ],
+    db_manager.RSS_DB: [
+        # 1 - one row per posted url, and index posts by feed for #rssdelete
+        [
+            dedupe('posts', 'post_url'),
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_posts_post_url ON posts (post_url)",
+            "CREATE INDEX IF NOT EXISTS idx_posts_feed_id ON posts (feed_id)",
+        ],
+        # 2 - cache validators for conditional feed requests
+        [
+            "ALTER TABLE feeds ADD COLUMN etag TEXT",
+            "ALTER TABLE feeds ADD COLUMN last_modified TEXT",
+        ],
+        # 3 - per feed polling schedule (next_poll is a unix timestamp)
+        [
+            "ALTER TABLE feeds ADD COLUMN next_poll INTEGER",
+            "ALTER TABLE feeds ADD COLUMN poll_interval INTEGER",
+            "ALTER TABLE feeds ADD COLUMN error_count INTEGER NOT NULL DEFAULT 0",
+            "CREATE INDEX IF NOT EXISTS idx_feeds_next_poll ON feeds (next_poll)",
+        ],
+    ],
+    db_manager.USERS_DB: [
+        # 1 - one row per user/community, and index the public id lookups
+        [
+            dedupe('users', 'local_user_id'),
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_users_local_user_id ON users (local_user_id)",
+            "CREATE INDEX IF NOT EXISTS idx_users_public_user_id ON users (public_user_id)",
+            dedupe('communities', 'community_id'),
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_communities_community_id ON communities (community_id)",
+        ],
+        # 2 - walk subscribed users in id order (iter_users)
+        [
+            "CREATE INDEX IF NOT EXISTS idx_users_subscribed_local_user_id ON users (subscribed, local_user_id)",
+        ],
+        # 3 - due onboarding work per stage
+        [
+            "CREATE INDEX IF NOT EXISTS idx_onboarding_stage_status_next_attempt ON onboarding (stage, status, next_attempt)",
+        ],
+    ],
+    db_manager.EMAIL_DB: [
+        # 1 - due email lookup
+        [
+            "CREATE INDEX IF NOT EXISTS idx_outbox_status_next_attempt ON outbox (status, next_attempt)",
+        ],
+    ],
+    db_manager.VOTE_DB: [
+        # 1 - duplicate vote check
+        [
+            "CREATE INDEX IF NOT EXISTS idx_votes_vote_id_username ON votes (vote_id, username)",
+        ],
+    ],
+    db_manager.GAMES_DB: [
+        # 1 - duplicate deal check
+        [
+            "CREATE INDEX IF NOT EXISTS idx_deals_name_date ON deals (deal_name, deal_date)",
+        ],
+    ],
+    db_manager.TAGS_DB: [
+        # 1 - rule lookups by community and by step
+        [
+            "CREATE INDEX IF NOT EXISTS idx_enforcement_rules_community ON enforcement_rules (community)",
+            "CREATE INDEX IF NOT EXISTS idx_enforcement_rules_step ON enforcement_rules (enforcement_id, action_order)",
+        ],
+    ],
+}
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(path, migrations):
+    conn = db_manager.connect(path)
+    current = get_schema_version(conn)
+
+    for version, statements in enumerate(migrations, start=1):
+        if version <= current:
+            continue
+
+        try:
+            conn.execute("BEGIN")
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            conn.close()
+            logging.exception("Migrating %s to schema version %s failed, rolled back", path, version)
+            raise
+
+        logging.info("Migrated %s to schema version %s", path, version)
+    conn.close()
+
+
+def run_migrations():
+    for path, migrations in MIGRATIONS.items():
+        migrate(path, migrations)
+    logging.info("All local database migrations checked.")
@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+
+import db_manager
+
+# rows per stage worker run
+STAGE_BATCH = 20
+
+QUEUE_STAGE = (
+    "INSERT OR IGNORE INTO onboarding (local_user_id, public_user_id, username, email, stage, created) "
+    "VALUES (?, ?, ?, ?, ?, ?)")
+
+# stage name -> Stage, in the order new users go through them
+_stages = {}
+_lock = threading.Lock()
+_stats = {}
+
+
+class Stage:
+    def __init__(self, name, handler, max_attempts, retry_delay, max_delay, initial):
+        self.name = name
+        self.handler = handler
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_delay = max_delay
+        self.initial = initial
+
+    def next_delay(self, attempts):
+        return min(self.retry_delay * 2 ** (attempts - 1), self.max_delay)
+
+
+def stage(name, max_attempts=5, retry_delay=60, max_delay=60 * 60, initial=True):
+    """
+    Register the decorated function as an onboarding stage. It's called with
+    the new user's row (local_user_id, public_user_id, username, email) and
+    returns True once that user's stage is done. Anything else, or an
+    exception, is retried retry_delay seconds later (doubling up to
+    max_delay) until max_attempts tries have failed.
+
+    Stages with initial=False are only run for users that another stage adds
+    them for, see add_stage().
+    """
+    def register(handler):
+        if name in _stages:
+            raise ValueError(f"Onboarding stage {name} is already registered")
+        _stages[name] = Stage(name, handler, max_attempts, retry_delay, max_delay, initial)
+        _stats[name] = {"done": 0, "retries": 0, "failed": 0}
+        return handler
+    return register
+
+
+def queue_users(conn, users):
+    """
+    Queue every initial stage for each (local_user_id, public_user_id,
+    username, email) in users. Takes the users.db connection the users were
+    added with, so both are committed together.
+    """
+    rows = [(*user, stage.name, int(time.time()))
+            for user in users for stage in _stages.values() if stage.initial]
+    conn.executemany(QUEUE_STAGE, rows)
+
+
+def add_stage(user, name):
+    # queue a follow up stage for a user, from inside another stage
+    with db_manager.connect(db_manager.USERS_DB) as conn:
+        conn.execute(
+            QUEUE_STAGE,
+            (user['local_user_id'], user['public_user_id'], user['username'], user['email'], name, int(time.time())))
+        conn.commit()
+
+
+def run_stage(name):
+    """
+    Run one stage for every user it's due for. Each stage has its own job,
+    so a slow mail server or database only holds up its own stage.
+    """
+    stage = _stages[name]
+    with db_manager.connect(db_manager.USERS_DB) as conn:
+        rows = conn.execute(
+            "SELECT onboarding_id, local_user_id, public_user_id, username, email, attempts FROM onboarding "
+            "WHERE stage = ? AND status = 'pending' AND next_attempt <= ? ORDER BY onboarding_id LIMIT ?",
+            (name, int(time.time()), STAGE_BATCH)).fetchall()
+
+    for onboarding_id, local_user_id, public_user_id, username, email, attempts in rows:
+        user = {
+            "local_user_id": local_user_id,
+            "public_user_id": public_user_id,
+            "username": username,
+            "email": email,
+        }
+        try:
+            done = stage.handler(user) is True
+            error = None if done else "stage returned a failure"
+        except Exception as e:
+            logging.exception("Onboarding stage %s failed for %s", name, username)
+            done, error = False, str(e)
+
+        if done:
+            _finished(onboarding_id, name)
+        else:
+            _failed(onboarding_id, stage, username, attempts + 1, error)
+
+
+def _finished(onboarding_id, name):
+    with db_manager.connect(db_manager.USERS_DB) as conn:
+        conn.execute("DELETE FROM onboarding WHERE onboarding_id = ?", (onboarding_id,))
+        conn.commit()
+    with _lock:
+        _stats[name]["done"] += 1
+
+
+def _failed(onboarding_id, stage, username, attempts, error):
+    with db_manager.connect(db_manager.USERS_DB) as conn:
+        if attempts >= stage.max_attempts:
+            conn.execute(
+                "UPDATE onboarding SET status = 'failed', attempts = ?, last_error = ? WHERE onboarding_id = ?",
+                (attempts, error, onboarding_id))
+        else:
+            conn.execute(
+                "UPDATE onboarding SET attempts = ?, next_attempt = ?, last_error = ? WHERE onboarding_id = ?",
+                (attempts, int(time.time() + stage.next_delay(attempts)), error, onboarding_id))
+        conn.commit()
+
+    with _lock:
+        if attempts >= stage.max_attempts:
+            _stats[stage.name]["failed"] += 1
+            logging.error("Giving up on onboarding stage %s for %s after %s attempts", stage.name, username, attempts)
+        else:
+            _stats[stage.name]["retries"] += 1
+            logging.warning("Onboarding stage %s for %s will be retried (attempt %s)", stage.name, username, attempts)
+
+
+def stage_workers():
+    # one job function per stage, named so the scheduler's logs say which
+    workers = []
+    for name in _stages:
+        def worker(name=name):
+            run_stage(name)
+        worker.__name__ = f"onboarding_{name}"
+        workers.append(worker)
+    return workers
+
+
+def onboarding_stats():
+    with db_manager.connect(db_manager.USERS_DB) as conn:
+        waiting = dict(conn.execute(
+            "SELECT stage, COUNT(*) FROM onboarding WHERE status = 'pending' GROUP BY stage").fetchall())
+    with _lock:
+        return {name: dict(stats, pending=waiting.get(name, 0)) for name, stats in _stats.items()}
+
+
+def log_onboarding_stats():
+    for name, stats in onboarding_stats().items():
+        logging.info(
+            "Onboarding %s: %s done, %s retries, %s failed, %s pending",
+            name, stats["done"], stats["retries"], stats["failed"], stats["pending"])
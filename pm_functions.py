@@ -1,5 +1,4 @@
 # Standard library imports
-import asyncio
 import logging
 import os
 from datetime import datetime, timedelta
@@ -21,6 +20,13 @@ from pythorhead.types import SortType, ListingType, FeatureType
 from config import settings
 from lemmy_manager import get_lemmy_instance
 import bot_strings
+import cache_manager
+import db_manager
+import http_manager
+import pm_outbox
+import pm_router
+import word_filter
+from pm_router import ADMIN, USER, command
 
 
 lemmy = get_lemmy_instance()
@@ -28,40 +34,72 @@ lemmy = get_lemmy_instance()
 pending_giveaway_setup: dict[str, dict] = {}
 
 
+@command("#help", exact=True)
 def pm_help(user_admin, pm_username, pm_id, pm_sender):
     greeting = f"{bot_strings.GREETING} {pm_username}. "
-    commands = bot_strings.BOT_COMMANDS  # Common part for all users
+
+    # only list commands that are registered and that this user can run
+    available = {cmd.prefix: cmd.permission for cmd in pm_router.get_commands(user_admin)}
+
+    def help_lines(permission):
+        return "".join(
+            f"- `{prefix}` - {text} \n"
+            for prefix, text in bot_strings.COMMAND_HELP.items()
+            if available.get(prefix) == permission)
+
+    commands = bot_strings.BOT_COMMANDS_INTRO + help_lines(USER) + "\n"
 
     # Add admin commands if user is an admin
     if user_admin:
-        commands += bot_strings.BOT_ADMIN_COMMANDS
+        commands += bot_strings.BOT_ADMIN_COMMANDS_INTRO + help_lines(ADMIN) + "\n"
 
     # Add the signoff at the end
     commands += bot_strings.PM_SIGNOFF
 
     # Send the message
-    lemmy.private_message.create(greeting + commands, pm_sender)
+    pm_outbox.create(greeting + commands, pm_sender)
 
     # Mark the message as read
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
+
+
+def reply_command(prefix, message, signoff=True):
+    # register a command that just replies with a fixed message
+    def handler(pm_username, pm_sender, pm_id):
+        reply = f"{bot_strings.GREETING} {pm_username}\n\n{message}"
+        if signoff:
+            reply += f"\n\n{bot_strings.PM_SIGNOFF}"
+        pm_outbox.create(reply, pm_sender)
+        pm_outbox.mark_as_read(pm_id, True)
+    return command(prefix, exact=True)(handler)
 
 
+reply_command("#autoposthelp", bot_strings.AUTOPOST_HELP, signoff=False)
+reply_command("#rsshelp", bot_strings.RSS_HELP, signoff=False)
+reply_command("#rules", bot_strings.INS_RULES)
+reply_command("#credits", bot_strings.CREDITS)
+reply_command("#feedback", bot_strings.FEEDBACK_MESSAGE)
+
+
+@command("#subscribe", exact=True, parse=lambda pm_context: {"status": "sub"})
+@command("#unsubscribe", exact=True, parse=lambda pm_context: {"status": "unsub"})
 def pm_sub(pm_sender, status, pm_username, pm_id, broadcast_status):
     if broadcast_status(pm_sender, status) == "successful":
         message = bot_strings.UNSUB_MESSAGE if status == "unsub" else bot_strings.SUB_MESSAGE
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}\n\n{message}\n\n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
-    lemmy.private_message.create(
+    pm_outbox.create(
         f"{bot_strings.GREETING} {pm_username}\n\n{bot_strings.SUB_ERROR}",
         pm_sender)
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
     return
 
 
+@command("#takeover", permission=ADMIN)
 def pm_takeover(user_admin, pm_context, pm_id, pm_username, pm_sender):
     if user_admin:
         community_name = pm_context.split("-")[1].strip()
@@ -78,22 +116,25 @@ def pm_takeover(user_admin, pm_context, pm_id, pm_username, pm_sender):
 
 
         if community_id is None:
-            lemmy.private_message.create(
+            pm_outbox.create(
                 f"{bot_strings.GREETING} {pm_username}. Sorry, I can't find the community you've requested.",
                 pm_sender)
-            lemmy.private_message.mark_as_read(pm_id, True)
+            pm_outbox.mark_as_read(pm_id, True)
             return
 
         lemmy.community.add_mod_to_community(
             True, community_id=int(community_id), person_id=int(user_id))
-        lemmy.private_message.create(
+        cache_manager.invalidate_community(community_name)
+        cache_manager.invalidate_community(int(community_id))
+        pm_outbox.create(
             f"Confirmation: {community_name} ({community_id}) has been taken over by user id {user_id}.",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
     return
 
+@command("#modremove", permission=ADMIN)
 def pm_removemod(user_admin, pm_context, pm_id, pm_username, pm_sender):
     if user_admin:
         community_name = pm_context.split("-")[1].strip()
@@ -110,24 +151,27 @@ def pm_removemod(user_admin, pm_context, pm_id, pm_username, pm_sender):
 
 
         if community_id is None:
-            lemmy.private_message.create(
+            pm_outbox.create(
                 f"{bot_strings.GREETING} {pm_username}. Sorry, I can't find the community you've requested.",
                 pm_sender)
-            lemmy.private_message.mark_as_read(pm_id, True)
+            pm_outbox.mark_as_read(pm_id, True)
             return
 
         lemmy.community.add_mod_to_community(
             False, community_id=int(community_id), person_id=int(user_id))
-        lemmy.private_message.create(
+        cache_manager.invalidate_community(community_name)
+        cache_manager.invalidate_community(int(community_id))
+        pm_outbox.create(
             f"Confirmation: {community_name} ({community_id}) has had a moderator removed with user id {user_id}.",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
     return
         
 
 
+@command("#vote")
 def pm_vote(
         pm_context,
         pm_username,
@@ -145,33 +189,34 @@ def pm_vote(
         pm_account_age)
 
     if db_response == "duplicate":
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. Oops! It looks like you've already voted on this poll. Votes can only be counted once. \n\n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     if db_response == "notvalid":
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. Oops! It doesn't look like the poll you've tried to vote on exists. Please double check the vote ID and try again. \n\n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     if db_response == "closed":
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. Sorry, it appears the poll you're trying to vote on is now closed. Please double check the vote ID and try again. \n\n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
-    lemmy.private_message.create(
+    pm_outbox.create(
         f"{bot_strings.GREETING} {pm_username}. Your vote has been counted on the \'{db_response}\' poll. Thank you for voting! \n\n{bot_strings.PM_SIGNOFF}",
         pm_sender)
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
     return
 
 
+@command("#poll", permission=ADMIN, denied="You need to be an instance admin in order to create a poll.")
 def pm_poll(
         user_admin,
         pm_context,
@@ -182,18 +227,19 @@ def pm_poll(
     if user_admin:
         poll_name = pm_context.split("@")[1]
         poll_id = create_poll(poll_name, pm_username)
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. Your poll has been created with ID number {poll_id}. You can now give this ID to people and they can now cast a vote using the `#vote` operator.\n\n {bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
-    lemmy.private_message.create(
+    pm_outbox.create(
         f"{bot_strings.GREETING} {pm_username}. You need to be an instance admin in order to create a poll.\n\n {bot_strings.PM_SIGNOFF}",
         pm_sender)
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
     return
 
 
+@command("#closepoll", permission=ADMIN)
 def pm_closepoll(
         user_admin,
         pm_context,
@@ -204,18 +250,19 @@ def pm_closepoll(
     if user_admin:
         poll_id = pm_context.split("@")[1]
         if close_poll(poll_id) == "closed":
-            lemmy.private_message.create(
+            pm_outbox.create(
                 f"{bot_strings.GREETING} {pm_username}. Your poll (ID = {poll_id}) has been closed \n\n {bot_strings.PM_SIGNOFF}",
                 pm_sender)
-            lemmy.private_message.mark_as_read(pm_id, True)
+            pm_outbox.mark_as_read(pm_id, True)
             return
-    lemmy.private_message.create(
+    pm_outbox.create(
         f"{bot_strings.GREETING} {pm_username}. I couldn't close that poll due to an error. \n\n {bot_strings.PM_SIGNOFF}",
         pm_sender)
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
     return
 
 
+@command("#countpoll", permission=ADMIN)
 def pm_countpoll(
         user_admin,
         pm_context,
@@ -226,41 +273,42 @@ def pm_countpoll(
     if user_admin:
         poll_id = pm_context.split("@")[1]
         yes_votes, no_votes = count_votes(poll_id)
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. There are {yes_votes} yes votes and {no_votes} no votes on that poll. \n\n {bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
     return
 
 
+@command("#giveaway", permission=ADMIN)
 def pm_giveaway(user_admin, pm_id, pm_context, pm_username, pm_sender, add_giveaway_thread):
     
     if not user_admin:
-        lemmy.private_message.mark_as_read(pm_id, True); return
+        pm_outbox.mark_as_read(pm_id, True); return
         
     parts = pm_context.split()
     
     if len(parts) != 2:
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} Please use `#giveaway <thread_id>`.",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True); return
+        pm_outbox.mark_as_read(pm_id, True); return
 
     thread_id = parts[1]
     pending_giveaway_setup[pm_sender] = {
         "thread_id": thread_id,
         "step": 1          # expect next answer
     }
-    lemmy.private_message.create(
+    pm_outbox.create(
         "I've got your Giveaway request! 📝  \n How would you like to restrict entrants?\n\n"
         "• `account <days>` – minimum **account** age in days\n\n"
         "• `subscribed <days>` – minimum **subscription** age in days\n\n"
         "• `none` – no age restriction",
         pm_sender)
-    lemmy.private_message.mark_as_read(pm_id, True)    
+    pm_outbox.mark_as_read(pm_id, True)    
 
 
 def pm_giveaway_followup(pm_sender, pm_content, pm_id, add_giveaway_thread):
@@ -287,16 +335,16 @@ def pm_giveaway_followup(pm_sender, pm_content, pm_id, add_giveaway_thread):
                 state["subscribed_age_limit"] = days
                 state["account_age_limit"] = None
         else:
-            lemmy.private_message.create("Please answer `account <days>`, `subscribed <days>`, or `none`.", pm_sender)
-            lemmy.private_message.mark_as_read(pm_id, True)   
+            pm_outbox.create("Please answer `account <days>`, `subscribed <days>`, or `none`.", pm_sender)
+            pm_outbox.mark_as_read(pm_id, True)   
             return True      # swallow message
 
         state["step"] = 2
-        lemmy.private_message.create(
+        pm_outbox.create(
             "Great!  🔒  Restrict to **local users only**?\n\n"
             "Reply `yes` or `no` (default is no).",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)   
+        pm_outbox.mark_as_read(pm_id, True)   
         return True
 
     # ---------- STEP 2 ----------
@@ -310,26 +358,28 @@ def pm_giveaway_followup(pm_sender, pm_content, pm_id, add_giveaway_thread):
             state["subscribed_age_limit"],
             state["local_only"]
         )
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"✅ Giveaway set up!  ID #{giveaway_id} is now **active**.",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)   
+        pm_outbox.mark_as_read(pm_id, True)   
         pending_giveaway_setup.pop(pm_sender, None)
         return True
 
     return False
 
 
+@command("#closegiveaway", permission=ADMIN)
 def pm_closegiveaway(user_admin, close_giveaway_thread, pm_context, pm_id):
     if user_admin:
         thread_id = pm_context.split(" ")[1]
         close_giveaway_thread(thread_id)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
     return
 
 
+@command("#drawgiveaway", permission=ADMIN)
 def pm_drawgiveaway(
         user_admin,
         draw_giveaway_thread,
@@ -342,10 +392,10 @@ def pm_drawgiveaway(
         num_winners = pm_context.split(" ")[2]
         draw_status = draw_giveaway_thread(thread_id, num_winners)
         if draw_status == "min_winners":
-            lemmy.private_message.create(
+            pm_outbox.create(
                 f"{bot_strings.GREETING} {pm_username}. There are too few entrants to draw your giveaway with that many winners. Please reduce the amount of winners or encourage more entrants! \n\n {bot_strings.PM_SIGNOFF}",
                 pm_sender)
-            lemmy.private_message.mark_as_read(pm_id, True)
+            pm_outbox.mark_as_read(pm_id, True)
             return
 
         winners = draw_status
@@ -353,51 +403,57 @@ def pm_drawgiveaway(
         comment_body = f"Congratulations to the winners of this giveaway: {winner_names}!\n\nThe winners of this giveaway have been drawn randomly by ZippyBot."
         lemmy.comment.create(int(thread_id), comment_body)
         lemmy.post.lock(int(thread_id), True)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
     return
 
 
-def pm_broadcast(user_admin, pm_context, pm_id, broadcast_message):
+@command("#broadcast", permission=ADMIN)
+def pm_broadcast(user_admin, pm_context, pm_sender, pm_id, broadcast_message):
     if user_admin:
         message = pm_context.replace('#broadcast', "", 1)
-        broadcast_message(message)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        job_id, total = broadcast_message(message, pm_sender)
+        pm_outbox.create(
+            f"Broadcast {job_id} is queued for {total} subscribed users. I'll send you progress updates as it goes out.",
+            pm_sender)
+        pm_outbox.mark_as_read(pm_id, True)
         return
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
     return
 
 
+@command("#rssdelete")
 def pm_rssdelete(pm_context, pm_sender, pm_username, pm_id, delete_rss):
     feed_id = pm_context.split(" ")[1]
     status = delete_rss(feed_id, pm_sender)
 
     if status == "no_exist":
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. Sorry, there is not an RSS feed with that ID number. Please try again.\n\n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     if status == "not_mod":
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. Sorry, you'll need to be a mod of this community before deleting an RSS feed.\n\n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     if status == "deleted":
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. The RSS feed has been deleted for this community.\n\n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
     return
 
 
+@command("#welcomedelete")
 def pm_welcomedelete(
         pm_context,
         pm_username,
@@ -409,30 +465,31 @@ def pm_welcomedelete(
     status = delete_welcome(com_name, pm_sender)
 
     if status == "no_exist":
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. Sorry, there is not a Welcome message associated with that community.\n\n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     if status == "not_mod":
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. Sorry, you'll need to be a mod of this community before deleting the Welcome message.\n\n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     if status == "deleted":
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. The Welcome message has been deleted for this community.\n\n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
     return
 
 
+@command("#comscan")
 def pm_comscan(pm_context, pm_username, pm_sender, pm_id, add_community_word):
     parts = pm_context.split()
     filters = {
@@ -455,42 +512,35 @@ def pm_comscan(pm_context, pm_username, pm_sender, pm_id, add_community_word):
             flag = None
 
     if not filters['community']:
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. You will need to specify the community with the `-c` flag for this tool to work.\n\n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     if not filters['words']:
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. You will need to specify words in a comma-separated list, i.e., `-w word1,word2,word3`.\n\n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     if not filters['action']:
         filters['action'] = "report"
 
     if filters['action'] != "report" and filters['action'] != "remove":
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. You've not defined a valid action to take. Please ensure you either use `-a report` or `-a remove`.\n\n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
-    output = lemmy.community.get(name=filters['community'])
-
-    for moderator_info in output['moderators']:
-        if moderator_info['moderator']['id'] == pm_sender:
-            is_moderator = True
-            break
-
-    if not is_moderator:
+    if not cache_manager.is_moderator(pm_sender, filters['community']):
         # if pm_sender is not a moderator, send a private message
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. As you are not the moderator of this community, you are not able to use this tool for it.\n\n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     word_add_result = add_community_word(
@@ -500,15 +550,16 @@ def pm_comscan(pm_context, pm_username, pm_sender, pm_id, add_community_word):
     )
 
     if word_add_result == "added":
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. Your list of words has been created/updated. ZippyBot will scan for these words and action them as requested.\n\n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
     return
 
 
+@command("#welcome")
 def pm_welcome(pm_context, pm_username, pm_sender, pm_id, add_welcome_message):
 
     filters = {
@@ -530,32 +581,27 @@ def pm_welcome(pm_context, pm_username, pm_sender, pm_id, add_welcome_message):
         filters['message'] = message
 
     if not filters['message']:
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. Sorry, you can't have a blank welcome message for a community. Please include some text, personalise the message and make it welcoming and friendly!\n\n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
-    output = lemmy.community.get(name=filters['community'])
+    community = cache_manager.get_community(filters['community'])
 
-    if output is None:
-        lemmy.private_message.create(
+    if community is None:
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. The community you requested can't be found. Please double check the spelling and name and try again.\n\n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
-    for moderator_info in output['moderators']:
-        if moderator_info['moderator']['id'] == pm_sender:
-            is_moderator = True
-            break
-
-    if not is_moderator:
+    if not cache_manager.is_moderator(pm_sender, filters['community']):
         # if pm_sender is not a moderator, send a private message
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. As you are not the moderator of this community, you are not able to set a welcome message for it.\n\n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     welcome_message_result = add_welcome_message(
@@ -564,13 +610,14 @@ def pm_welcome(pm_context, pm_username, pm_sender, pm_id, add_welcome_message):
     )
 
     if welcome_message_result == "added":
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. I have successfully added the welcome message to the community. You can run this command again to change the message.\n\n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
     return
 
 
+@command("#rss")
 def pm_rss(
         pm_context,
         pm_username,
@@ -579,7 +626,7 @@ def pm_rss(
         add_new_feed,
         connect_to_rss_db,
         fetch_latest_posts,
-        insert_new_post):
+        insert_new_posts):
     pattern = r'-(url|url_exc|url_inc|title_inc|title_exc|c|t|new_only|ignore)\s*(?:(?:"(.*?)")|(?:“(.*?)”)|([^\s]+))?(?=\s+-|$)'
 
     filters = {
@@ -621,62 +668,59 @@ def pm_rss(
             ignore_bozo_check = True
 
     if not filters['feed_url']:
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. You will need to include a link to an RSS feed for this to work.\n \n{bot_strings.PM_SIGNOFF}",
             pm_sender
         )
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     if not filters['community']:
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. You will need to specify the community you want the RSS feed to be posted to with `-c community_name`.\n \n{bot_strings.PM_SIGNOFF}",
             pm_sender
         )
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
-    output = lemmy.community.get(name=filters['community'])
+    community = cache_manager.get_community(filters['community'])
 
-    if output is None:
-        lemmy.private_message.create(
+    if community is None:
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. The community you requested can't be found. Please double check the spelling and name and try again.\n \n{bot_strings.PM_SIGNOFF}",
             pm_sender
         )
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     com_name = filters['community']
-    filters['community'] = lemmy.discover_community(
-        filters['community'])
+    filters['community'] = community['id']
 
     # check if user is moderator of community
-    is_moderator = False
-
-    for moderator_info in output['moderators']:
-        if moderator_info['moderator']['id'] == pm_sender:
-            is_moderator = True
-            break
-
-    if not is_moderator:
+    if not cache_manager.is_moderator(pm_sender, com_name):
         # if pm_sender is not a moderator, send a private message
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. As you are not the moderator of this community, you are not able to add an RSS feed to it.\n \n{bot_strings.PM_SIGNOFF}",
             pm_sender
         )
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     # check url is a valid rss feed
     feed_url = filters['feed_url']
-    valid_rss = feedparser.parse(feed_url)
+    try:
+        response = http_manager.get(feed_url, "feed")
+        valid_rss = feedparser.parse(response.content, response_headers=http_manager.feed_headers(response))
+    except requests.exceptions.RequestException as e:
+        logging.info("Couldn't fetch RSS feed %s: %s", feed_url, e)
+        valid_rss = feedparser.parse(b"")
     if not ignore_bozo_check and (
             valid_rss.bozo != 0 or 'title' not in valid_rss.feed):
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. I can't find a valid RSS feed in the URL you've provided. Please double check you're linking directly to an RSS feed.\n \n{bot_strings.PM_SIGNOFF}",
             pm_sender
         )
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     
@@ -691,22 +735,22 @@ def pm_rss(
     )
 
     if add_new_feed_result == "exists":
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. The RSS feed you're trying to add already exists in the [{com_name}](/c/{com_name}@{settings.INSTANCE}) community.",
             pm_sender
         )
     elif add_new_feed_result is None:
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. An error occurred while adding the RSS feed. Please try again.",
             pm_sender
         )
     else:
         feed_id = add_new_feed_result
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. I have successfully added the requested RSS feed to the [{com_name}](/c/{com_name}@{settings.INSTANCE}) community. The ID for this RSS feed is {add_new_feed_result} - please keep this safe as you'll need it if you want to delete the feed in the future.",
             pm_sender
         )
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
 
     if new_only:
         with connect_to_rss_db() as conn:
@@ -727,10 +771,10 @@ def pm_rss(
                 url_excludes_filter,
                 title_contains_filter,
                 title_excludes_filter)
-            for post in posts:
-                insert_new_post(feed_id, post)
+            insert_new_posts(feed_id, posts)
 
 
+@command("#autopost")
 def pm_autopost(pm_context, pm_username, pm_sender, pm_id, add_autopost_to_db, get_first_post_date):
     # define the pattern to match each qualifier and its following
     # content
@@ -773,14 +817,14 @@ def pm_autopost(pm_context, pm_username, pm_sender, pm_id, add_autopost_to_db, g
 
     # check mandatory fields
     if post_data['community'] is None:
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. In order to use this command, you will need to specify a community with the `-c` flag, i.e. `-c gaming`.\n\n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     if post_data['title'] is None:
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. In order to use this command, you will need to specify a title with the `-t` flag, i.e. `-t Weekly Thread`. You can also use the following commands in the title: \n\n"
             "- %d (Day - i.e. 12) \n"
             "- %m (Month - i.e. June) \n"
@@ -789,27 +833,27 @@ def pm_autopost(pm_context, pm_username, pm_sender, pm_id, add_autopost_to_db, g
             "For example, `Gaming Thread %w %d %m %y` would give you a title of `Gaming Thread Monday 12 June 2023`.\n\n"
             f"{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     if post_data['day'] is None:
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. In order to use this command, you will need to specify a day of the week with the `-d` flag, i.e. `-d monday`, or a specific date you want the first post to be posted in YYYYMMDD format, i.e. `-d 20230612`.\n\n"
             f"{bot_strings.PM_SIGNOFF}",
             pm_sender
         )
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     if post_data['time'] is None:
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. In order to use this command, you will need to specify a time with the `-h` flag, i.e. `-h 07:30`. Remember all times are UTC!.\n\n"
             f"{bot_strings.PM_SIGNOFF}", pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     if post_data['frequency'] is None:
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. In order to use this command, you will need to specify a post frequency with the `-f` flag, i.e. `-f weekly`. \n\n"
             f"You can use the following frequencies: \n"
             f"- once (the post will only happen once) \n"
@@ -818,12 +862,12 @@ def pm_autopost(pm_context, pm_username, pm_sender, pm_id, add_autopost_to_db, g
             f"- 4weekly (every 28 days) \n"
             f"- monthly (once a month)\n\n"
             f"{bot_strings.PM_SIGNOFF}", pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     if post_data['frequency'] not in [
             "once", "weekly", "fortnightly", "4weekly", "monthly"]:
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. I couldn't find a valid frequency following the -f flag. \n\n"
             f"You can use the following frequencies: \n"
             f"- once (the post will only happen once) \n"
@@ -832,34 +876,27 @@ def pm_autopost(pm_context, pm_username, pm_sender, pm_id, add_autopost_to_db, g
             f"- 4weekly (every 28 days) \n"
             f"- monthly (once a month)\n\n"
             f"{bot_strings.PM_SIGNOFF}", pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     # check community is real
-    output = lemmy.community.get(name=post_data['community'])
+    community = cache_manager.get_community(post_data['community'])
 
-    if output is None:
-        lemmy.private_message.create(
+    if community is None:
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. The community you requested can't be found. Please double check the spelling and name and try again.\n\n"
             f"{bot_strings.PM_SIGNOFF}", pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     # check if user is moderator of community
-    is_moderator = False
-
-    for moderator_info in output['moderators']:
-        if moderator_info['moderator']['id'] == pm_sender:
-            is_moderator = True
-            break  # stop the loop as soon as we find a matching moderator
-
-    if not is_moderator:
+    if not cache_manager.is_moderator(pm_sender, post_data['community']):
         # if pm_sender is not a moderator, send a private message
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. As you are not the moderator of this community, you are not able to create a scheduled post for it.\n\n"
             f"{bot_strings.PM_SIGNOFF}", pm_sender)
 
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     post_data['mod_id'] = pm_sender
@@ -870,10 +907,10 @@ def pm_autopost(pm_context, pm_username, pm_sender, pm_id, add_autopost_to_db, g
         parsed_date = datetime.strptime(post_data['day'], date_format)
         # check if the date is in the past
         if parsed_date.date() < datetime.now().date():
-            lemmy.private_message.create(
+            pm_outbox.create(
                 f"{bot_strings.GREETING} {pm_username}. The date of the post you scheduled is in the past. Unfortunately, I don't have a time machine :( \n\n{bot_strings.PM_SIGNOFF}",
                 pm_sender)
-            lemmy.private_message.mark_as_read(pm_id, True)
+            pm_outbox.mark_as_read(pm_id, True)
             return
         else:
             day_type = "date"
@@ -890,10 +927,10 @@ def pm_autopost(pm_context, pm_username, pm_sender, pm_id, add_autopost_to_db, g
         if post_data['day'].lower() in weekdays:
             day_type = "day"
         else:
-            lemmy.private_message.create(
+            pm_outbox.create(
                 f"{bot_strings.GREETING} {pm_username}. Sorry, I can't work out when you want your post scheduled. Please pick a day of the week or specify a date you want recurring posts to start! Remember dates should be in YYYYMMDD format. \n\n{bot_strings.PM_SIGNOFF}",
                 pm_sender)
-            lemmy.private_message.mark_as_read(pm_id, True)
+            pm_outbox.mark_as_read(pm_id, True)
             return
 
     # Convert the day, time, and frequency into a scheduled datetime
@@ -925,7 +962,7 @@ def pm_autopost(pm_context, pm_username, pm_sender, pm_id, add_autopost_to_db, g
     if post_data['body'] is None:
         post_data['body'] = ""
 
-    lemmy.private_message.create(
+    pm_outbox.create(
         f"{bot_strings.GREETING} {pm_username}. \n\n"
         f"The details for your scheduled post are as follows: \n\n"
         f"- Community: {post_data['community']}\n\n"
@@ -938,10 +975,11 @@ def pm_autopost(pm_context, pm_username, pm_sender, pm_id, add_autopost_to_db, g
         f"- Your next post date is: {next_post_date}\n\n"
         f"- The ID for this autopost is: {auto_post_id}. (Keep this safe as you will need it to cancel your autopost in the future, if you've set up for a repeating schedule.)\n\n"
         f"{bot_strings.PM_SIGNOFF}", pm_sender)
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
     return
 
 
+@command("#autopostdelete")
 def pm_autopostdelete(
         pm_context,
         delete_autopost,
@@ -956,76 +994,84 @@ def pm_autopostdelete(
     delete_conf = delete_autopost(pin_id, pm_sender, del_post)
 
     if delete_conf == "deleted":
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. Your pinned autopost (with ID {pin_id}) has been successfully deleted.\n \n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     if delete_conf == "not deleted":
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     if delete_conf == "no id":
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. A scheduled post with this ID does not exist.\n \n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     if delete_conf == "not mod":
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. As you are not the moderator of this community, you are not able to delete a scheduled post for it.\n \n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
     return
 
 
+@command("#purgevotes", permission=ADMIN, exact=True)
 def pm_purgevotes(user_admin, pm_id, check_dbs):
     if user_admin:
-        if os.path.exists('resources/vote.db'):
-            os.remove('resources/vote.db')
+        if os.path.exists(db_manager.VOTE_DB):
+            db_manager.remove_db(db_manager.VOTE_DB)
             check_dbs()
-            lemmy.private_message.mark_as_read(pm_id, True)
+            pm_outbox.mark_as_read(pm_id, True)
             return
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
     return
 
 
+@command("#purgeadminactions", permission=ADMIN, exact=True)
 def pm_purgeadminactions(user_admin, pm_id, check_dbs):
     if user_admin:
-        if os.path.exists('resources/mod_actions.db'):
-            os.remove('resources/mod_actions.db')
+        if os.path.exists(db_manager.MOD_DB):
+            db_manager.remove_db(db_manager.MOD_DB)
             check_dbs()
-            lemmy.private_message.mark_as_read(pm_id, True)
+            word_filter.invalidate()
+            pm_outbox.mark_as_read(pm_id, True)
             return
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
     return
 
 
-def pm_purgerss(user_admin, pm_id, check_dbs):
+@command("#purgerss", permission=ADMIN, exact=True)
+def pm_purgerss(user_admin, pm_id, check_dbs, forget_rss_posts):
     if user_admin:
-        if os.path.exists('resources/rss.db'):
-            os.remove('resources/rss.db')
+        if os.path.exists(db_manager.RSS_DB):
+            db_manager.remove_db(db_manager.RSS_DB)
             check_dbs()
-            lemmy.private_message.mark_as_read(pm_id, True)
+            # the purged posts are no longer in the db, so don't treat them as seen
+            forget_rss_posts()
+            pm_outbox.mark_as_read(pm_id, True)
             return
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
     return
 
+@command("#purgegiveaway", permission=ADMIN, exact=True)
 def pm_purgegiveaway(user_admin, pm_id, check_dbs):
     if user_admin:
-        if os.path.exists('resources/giveaway.db'):
-            os.remove('resources/giveaway.db')
+        if os.path.exists(db_manager.GIVEAWAY_DB):
+            db_manager.remove_db(db_manager.GIVEAWAY_DB)
             check_dbs()
-            lemmy.private_message.mark_as_read(pm_id, True)
+            pm_outbox.mark_as_read(pm_id, True)
             return
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
     return
 
+@command("#reject")
 def pm_reject(pm_context, pm_sender, pm_username, pm_id, reject_user):
     parts = pm_context.split("#")
     if len(parts) > 1 and parts[1].strip() == "reject":
@@ -1034,44 +1080,48 @@ def pm_reject(pm_context, pm_sender, pm_username, pm_id, reject_user):
             rejection = parts[3].strip()
             #added in lemmy 0.19.11
             reject_user(user, rejection)
-            lemmy.private_message.mark_as_read(pm_id, True)
+            pm_outbox.mark_as_read(pm_id, True)
             return
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. Sorry, you can't use this command.\n \n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
 
+@command("#ban")
 def pm_ban(user_admin, pm_sender, pm_context, pm_id, ban_email, send_matrix_message):
     if user_admin or pm_sender == 9532930:
         person_id = pm_context.split(" ")[1]
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
 
         ban_result = ban_email(person_id)
 
-        banned_user = lemmy.user.get(person_id)
+        # they've been banned, so don't keep serving their old profile
+        cache_manager.invalidate_person(person_id)
+        banned_user = cache_manager.get_person(person_id)
         if banned_user:
-            banned_username = banned_user['person_view']['person']['name']
+            banned_username = banned_user['name']
 
         if ban_result == "notfound":
             matrix_body = f"The ban email has failed as the user ID couldn't be found ({person_id}). Make sure you're using the public ID (can be found in the URL when sending a PM)."
-            asyncio.run(send_matrix_message(matrix_body))
-        elif ban_result == "sent":
-            matrix_body = f"The ban email for id {banned_username}({person_id}) was sent. Modlog here: https://lemmy.zip/modlog?page=1&actionType=ModBan&userId={person_id}."
-            asyncio.run(send_matrix_message(matrix_body))
+            send_matrix_message(matrix_body)
+        elif ban_result == "queued":
+            matrix_body = f"The ban email for id {banned_username}({person_id}) has been queued. Modlog here: https://lemmy.zip/modlog?page=1&actionType=ModBan&userId={person_id}."
+            send_matrix_message(matrix_body)
         else:
             # Handles any other errors from ban_email
             matrix_body = f"There was an error sending the ban email for id {person_id}. Please check Zippy's logs!"
-            asyncio.run(send_matrix_message(matrix_body))
+            send_matrix_message(matrix_body)
 
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
     return
 
 
+@command("#warn", permission=ADMIN)
 def pm_warn(
         user_admin,
         pm_context,
@@ -1086,10 +1136,10 @@ def pm_warn(
         parts = pm_context.split("#")
         if len(parts) > 1 and parts[1].strip() == "warn":
             if len(parts) < 4:
-                lemmy.private_message.create(
+                pm_outbox.create(
                     f"{bot_strings.GREETING} {pm_username}. Your command is incomplete. Please provide a valid user ID and warning message.\n\n{bot_strings.PM_SIGNOFF}",
                     pm_sender)
-                lemmy.private_message.mark_as_read(pm_id, True)
+                pm_outbox.mark_as_read(pm_id, True)
                 return
 
             person_id = int(parts[2].strip())
@@ -1101,51 +1151,52 @@ def pm_warn(
                     raise ValueError(
                         "User ID must be a positive integer.")
             except ValueError:
-                lemmy.private_message.create(
+                pm_outbox.create(
                     f"{bot_strings.GREETING} {pm_username}. The provided user ID is invalid. Please provide a valid positive numeric user ID.\n\n{bot_strings.PM_SIGNOFF}",
                     pm_sender)
-                lemmy.private_message.mark_as_read(pm_id, True)
+                pm_outbox.mark_as_read(pm_id, True)
                 return
 
             try:
-                warned_user = lemmy.user.get(person_id)
+                warned_user = cache_manager.get_person(person_id)
             except Exception as e:
-                lemmy.private_message.create(
+                pm_outbox.create(
                     f"{bot_strings.GREETING} {pm_username}. Failed to retrieve user information: {str(e)}\n\n{bot_strings.PM_SIGNOFF}",
                     pm_sender)
-                lemmy.private_message.mark_as_read(pm_id, True)
+                pm_outbox.mark_as_read(pm_id, True)
                 return
 
             if warned_user:
-                warned_username = warned_user['person_view']['person']['name']
+                warned_username = warned_user['name']
             else:
-                lemmy.private_message.create(
+                pm_outbox.create(
                     f"{bot_strings.GREETING} {pm_username}. Sorry, I could not find the required user by their user ID to issue a warning. Please double-check and try again. \n \n{bot_strings.PM_SIGNOFF}",
                     pm_sender)
-                lemmy.private_message.mark_as_read(pm_id, True)
+                pm_outbox.mark_as_read(pm_id, True)
                 return
 
             try:
                 log_warning(person_id, warn_message, pm_username)
             except ValueError as e:
-                lemmy.private_message.create(
+                pm_outbox.create(
                     f"{bot_strings.GREETING} {pm_username}. Failed to log the warning: {str(e)}\n\n{bot_strings.PM_SIGNOFF}",
                     pm_sender)
 
             warning_count = ordinal(get_warning_count(person_id))
 
-            lemmy.private_message.create(
+            pm_outbox.create(
                 f"Hello, {warned_username}. This is an official warning from the Lemmy.zip Admin Team. \n\n >{warn_message} \n\n *This is your {warning_count} warning.* \n\n --- \n\n This message cannot be replied to. If you wish to dispute this warning, please reach out to any member of the Admin team.",
                 int(person_id))
-            lemmy.private_message.mark_as_read(pm_id, True)
+            pm_outbox.mark_as_read(pm_id, True)
             matrix_body = f"A warning has been issued by {pm_username} for user {warned_username} (User ID: {person_id}): `{warn_message}`. This is the {warning_count} warning for this user. This has been sent successfully."
-            asyncio.run(send_matrix_message(matrix_body))
+            send_matrix_message(matrix_body)
             return
 
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
     return
 
 
+@command("#lock", permission=ADMIN)
 def pm_lock(user_admin, pm_context, pm_username, pm_id, send_matrix_message):
     if user_admin:
         parts = pm_context.split("#")
@@ -1182,28 +1233,29 @@ def pm_lock(user_admin, pm_context, pm_username, pm_id, send_matrix_message):
                     lemmy.comment.distinguish(latest_comment, True)
 
                 matrix_body = f"Thread locked by {pm_username}. Post: https://lemmy.zip/post/{thread_id} -> Comment: https://lemmy.zip/comment/{latest_comment}."
-                asyncio.run(send_matrix_message(matrix_body))
+                send_matrix_message(matrix_body)
 
-                lemmy.private_message.mark_as_read(pm_id, True)
+                pm_outbox.mark_as_read(pm_id, True)
                 return
 
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
     return
 
+@command("#tagenforcer")
 def pm_tagenforcer(pm_username, pm_context, pm_sender, pm_id, store_enforcement):
     # Normalize quotes to avoid issues with special characters
     command = pm_context.replace("“", '"').replace("”", '"')
     tokens = shlex.split(command)
     
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
 
     # Check for a minimum number of tokens to form a valid command
     if len(tokens) < 4:
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. Sorry, it doesn't look like your command was formatted correctly. Please try again! \n\n {bot_strings.PM_SIGNOFF}",
             pm_sender
         )
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
 
     # Parse the command tokens
@@ -1248,7 +1300,7 @@ def pm_tagenforcer(pm_username, pm_context, pm_sender, pm_id, store_enforcement)
             # Validate that a message was actually provided
             if not message.strip():  # Check for empty or whitespace-only messages
                 logging.info("No message found after warn action - rejecting")
-                lemmy.private_message.create(
+                pm_outbox.create(
                     f"{bot_strings.GREETING} {pm_username}. Sorry, it doesn't look like your command was formatted correctly. Your warn command is missing the message required to warn the user! Please try again! \n\n {bot_strings.PM_SIGNOFF}",
                     pm_sender
                 )
@@ -1270,7 +1322,7 @@ def pm_tagenforcer(pm_username, pm_context, pm_sender, pm_id, store_enforcement)
                 next_action_due += timedelta(hours=duration)
                 index += 1  # Move past duration
             else:
-                lemmy.private_message.create(
+                pm_outbox.create(
                     f"{bot_strings.GREETING} {pm_username}. Sorry, it doesn't look like your command was formatted correctly. Your 'wait' command is missing a valid time format (e.g., 24h). Please try again!\n\n{bot_strings.PM_SIGNOFF}",
                     pm_sender
                 )
@@ -1298,45 +1350,40 @@ def pm_tagenforcer(pm_username, pm_context, pm_sender, pm_id, store_enforcement)
         index += 1  # Move to the next token
 
     # Check user is a mod in the community
-    output = lemmy.community.get(name=community)
-    for moderator_info in output['moderators']:
-        if moderator_info['moderator']['id'] == pm_sender:
-            is_moderator = True
-            break
-        
-    if not is_moderator:
+    if not cache_manager.is_moderator(pm_sender, community):
         # if pm_sender is not a moderator, send a private message
-        lemmy.private_message.create(
+        pm_outbox.create(
             f"{bot_strings.GREETING} {pm_username}. As you are not the moderator of this community, you are not able to use this tool for it.\n\n{bot_strings.PM_SIGNOFF}",
             pm_sender)
-        lemmy.private_message.mark_as_read(pm_id, True)
+        pm_outbox.mark_as_read(pm_id, True)
         return
       
     store_enforcement(community, tags, steps)
     logging.info(f"New tags added to {community} community")
     
+@command("#hide", permission=ADMIN)
 def pm_hide(user_admin, pm_context, pm_sender, pm_id, pm_username, send_matrix_message):
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
     parts = pm_context.split("#")
     if len(parts) > 1 and parts[1].strip() == "hide":
         community_id = parts[2].strip()
         
         if user_admin:
             if community_id:
-                com_details = lemmy.community.get(id=community_id)
-                com_name = com_details['community_view']['community']['name']
+                com_name = cache_manager.get_community(int(community_id))['name']
             
                 lemmy.community.hide(hidden=True, community_id=int(community_id))
                 logging.info(f"Community {com_name} hidden from All")
                 
                 matrix_body = f"{pm_username} has hidden community {community_id} from the All feed."
-                asyncio.run(send_matrix_message(matrix_body))
+                send_matrix_message(matrix_body)
                 
                 return
         return   
             
+@command("#spam_add", permission=ADMIN)
 def pm_spam_add(user_admin, pm_context, pm_sender, pm_id, pm_username, add_pm_spam_phrase):
-    lemmy.private_message.mark_as_read(pm_id, True)
+    pm_outbox.mark_as_read(pm_id, True)
     parts = pm_context.split("#")
     if len(parts) > 1 and parts[1].strip() == "spam_add":
         spam_phrase = parts[2].strip()
@@ -1344,8 +1391,8 @@ def pm_spam_add(user_admin, pm_context, pm_sender, pm_id, pm_username, add_pm_sp
             add_pm_spam_phrase(spam_phrase)
 
 def pm_notunderstood(pm_username, pm_sender, pm_id):
-    lemmy.private_message.create(
+    pm_outbox.create(
         f"{bot_strings.GREETING} {pm_username}. Sorry, I did not understand your request. Please try again or use `#help` for a list of commands. \n \n{bot_strings.PM_SIGNOFF}",
         pm_sender
     )
-    lemmy.private_message.mark_as_read(pm_id, True)
\ No newline at end of file
+    pm_outbox.mark_as_read(pm_id, True)
\ No newline at end of file
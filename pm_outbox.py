@@ -0,0 +1,82 @@
+import logging
+import threading
+
+from lemmy_manager import get_lemmy_instance, rate_limit_remaining, wait_for_rate_limit
+
+lemmy = get_lemmy_instance()
+
+_lock = threading.Lock()
+# (content, recipient_id) in the order they were queued
+_replies = []
+# private message id -> read flag, last one wins
+_reads = {}
+_stats = {
+    "queued": 0,
+    "sent": 0,
+    "failed": 0,
+}
+
+
+def create(content, recipient_id):
+    """
+    Queue a private message reply. Same arguments as
+    lemmy.private_message.create, but it is sent by the next flush().
+    """
+    with _lock:
+        _stats["queued"] += 1
+        _replies.append((content, recipient_id))
+
+
+def mark_as_read(private_message_id, read):
+    # queued like create(), marking a message more than once costs one call
+    with _lock:
+        _stats["queued"] += 1
+        _reads[private_message_id] = read
+
+
+def flush():
+    """
+    Send everything queued since the last flush. Identical replies to the same
+    person are only sent once, and sending waits out any rate limit backoff.
+    """
+    with _lock:
+        replies = list(dict.fromkeys(_replies))
+        reads = list(_reads.items())
+        _replies.clear()
+        _reads.clear()
+
+    for content, recipient_id in replies:
+        _send(f"reply to {recipient_id}", lemmy.private_message.create, content, recipient_id)
+    for private_message_id, read in reads:
+        _send(f"mark {private_message_id} as read", lemmy.private_message.mark_as_read, private_message_id, read)
+
+
+def _send(description, api_call, *args):
+    # one retry if the call was refused for rate limiting
+    for attempt in range(2):
+        wait_for_rate_limit()
+        if api_call(*args) is not None:
+            with _lock:
+                _stats["sent"] += 1
+            return True
+        if not rate_limit_remaining():
+            break
+
+    with _lock:
+        _stats["failed"] += 1
+    logging.warning("PM outbox failed to %s", description)
+    return False
+
+
+def outbox_stats():
+    with _lock:
+        pending = len(_replies) + len(_reads)
+        saved = _stats["queued"] - _stats["sent"] - _stats["failed"] - pending
+        return dict(_stats, pending=pending, saved=saved)
+
+
+def log_outbox_stats():
+    stats = outbox_stats()
+    logging.info(
+        "PM outbox: %s queued, %s sent, %s failed, %s API calls saved",
+        stats["queued"], stats["sent"], stats["failed"], stats["saved"])
@@ -0,0 +1,116 @@
+import inspect
+import logging
+import threading
+import time
+from collections import defaultdict
+
+import bot_strings
+import pm_outbox
+
+# permission levels a command can require
+USER = "user"
+ADMIN = "admin"
+
+# prefix -> Command, in registration order
+_commands = {}
+# bot_code functions handed to handlers by parameter name, see provide()
+_dependencies = {}
+_lock = threading.Lock()
+_stats = defaultdict(lambda: {"calls": 0, "errors": 0, "denied": 0, "total_time": 0.0, "max_time": 0.0})
+
+
+class Command:
+    def __init__(self, prefix, handler, permission, exact, parse, denied):
+        self.prefix = prefix
+        self.handler = handler
+        self.permission = permission
+        self.exact = exact
+        self.parse = parse
+        self.denied = denied
+        self.params = list(inspect.signature(handler).parameters)
+
+
+def command(prefix, permission=USER, exact=False, parse=None, denied=None):
+    """
+    Register the decorated function as the handler for PMs starting with
+    prefix (the first space separated word), or equal to it if exact.
+
+    Handler arguments are filled in by name from the message (pm_context,
+    pm_username, pm_sender, pm_id, pm_account_age, user_admin), from
+    parse(pm_context) if given, and from the functions passed to provide().
+    Non-admins using an ADMIN command get the denied reply if there is one,
+    otherwise their message is just marked as read.
+    """
+    def register(handler):
+        if prefix in _commands:
+            raise ValueError(f"PM command {prefix} is already registered")
+        _commands[prefix] = Command(prefix, handler, permission, exact, parse, denied)
+        return handler
+    return register
+
+
+def provide(**dependencies):
+    _dependencies.update(dependencies)
+
+
+def get_commands(user_admin=False):
+    return [cmd for cmd in _commands.values() if user_admin or cmd.permission != ADMIN]
+
+
+def dispatch(pm_context, **message):
+    """
+    Run the handler registered for this PM. Returns False if no command
+    matches, so the caller can fall back to conversations/not understood.
+    """
+    cmd = _commands.get(pm_context.split(" ", 1)[0])
+    if cmd is None or (cmd.exact and pm_context != cmd.prefix):
+        return False
+
+    if cmd.permission == ADMIN and not message.get("user_admin"):
+        with _lock:
+            _stats[cmd.prefix]["denied"] += 1
+        logging.info("%s tried to use admin command %s", message.get("pm_username"), cmd.prefix)
+        if cmd.denied:
+            pm_outbox.create(
+                f"{bot_strings.GREETING} {message.get('pm_username')}. {cmd.denied}\n\n {bot_strings.PM_SIGNOFF}",
+                message["pm_sender"])
+        pm_outbox.mark_as_read(message["pm_id"], True)
+        return True
+
+    arguments = dict(_dependencies, pm_context=pm_context, **message)
+    if cmd.parse:
+        arguments.update(cmd.parse(pm_context))
+
+    start = time.monotonic()
+    failed = False
+    try:
+        cmd.handler(**{name: arguments[name] for name in cmd.params if name in arguments})
+    except Exception:
+        failed = True
+        logging.exception("PM command %s failed", cmd.prefix)
+        # don't pick the same message up again on every poll
+        pm_outbox.mark_as_read(message["pm_id"], True)
+    finally:
+        elapsed = time.monotonic() - start
+        with _lock:
+            stats = _stats[cmd.prefix]
+            stats["calls"] += 1
+            stats["errors"] += failed
+            stats["total_time"] += elapsed
+            stats["max_time"] = max(stats["max_time"], elapsed)
+    return True
+
+
+def command_stats():
+    with _lock:
+        return {prefix: dict(stats) for prefix, stats in _stats.items()}
+
+
+def log_command_stats():
+    stats = command_stats()
+    if not stats:
+        return
+    logging.info("PM commands: %s", ", ".join(
+        f"{prefix}={s['calls']} calls/{s['errors']} errors/{s['denied']} denied "
+        f"avg {s['total_time'] / s['calls'] if s['calls'] else 0:.2f}s max {s['max_time']:.2f}s"
+        for prefix, s in sorted(stats.items(), key=lambda item: -item[1]["calls"])))
@@ -0,0 +1,113 @@
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+from config import settings
+
+# Lemmy's rate limit classes. Anything that isn't one of the others counts
+# against "message", the general API limit.
+LIMIT_TYPES = ("message", "post", "register", "image", "comment", "search")
+
+_buckets = {}
+_lock = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Allows `capacity` calls per `per_seconds`, refilling continuously. Callers
+    that find it empty reserve the next token and wait their turn, so
+    everyone sharing a bucket is served in order.
+    """
+
+    def __init__(self, capacity, per_seconds):
+        self.capacity = max(capacity, 1)
+        self.rate = self.capacity / max(per_seconds, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.waits = 0
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        # take a token, returning how long to wait before it can be used
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            delay = -self.tokens / self.rate
+            self.waits += 1
+            self.waited += delay
+            return delay
+
+
+def limit_type(method, url):
+    path = urlsplit(url).path
+    if "/pictrs/" in path:
+        return "image"
+    path = path.split("/api/v3", 1)[-1].rstrip("/")
+    if method == "POST" and path == "/post":
+        return "post"
+    if method == "POST" and path == "/comment":
+        return "comment"
+    if method == "POST" and path == "/user/register":
+        return "register"
+    if path in ("/search", "/resolve_object"):
+        return "search"
+    return "message"
+
+
+def configure(site):
+    """
+    Set the buckets from a site.get() response's local_site_rate_limit. Only
+    RATE_LIMIT_HEADROOM of each advertised limit is used, to leave room for
+    clock skew and for anything else sharing our IP.
+    """
+    limits = (site or {}).get('site_view', {}).get('local_site_rate_limit')
+    if not limits:
+        logging.warning("Instance didn't advertise its rate limits, Lemmy calls won't be paced")
+        return
+
+    buckets = {}
+    for kind in LIMIT_TYPES:
+        calls, per_seconds = limits.get(kind), limits.get(f"{kind}_per_second")
+        if calls and per_seconds:
+            buckets[kind] = TokenBucket(int(calls * settings.RATE_LIMIT_HEADROOM), per_seconds)
+
+    with _lock:
+        _buckets.clear()
+        _buckets.update(buckets)
+    logging.info("Lemmy rate limits: %s", ", ".join(
+        f"{kind}={limits.get(kind)}/{limits.get(f'{kind}_per_second')}s" for kind in buckets))
+
+
+def acquire(method, url):
+    # block until the call's rate limit class has room for it
+    kind = limit_type(method, url)
+    with _lock:
+        bucket = _buckets.get(kind)
+    if bucket is None:
+        return
+    delay = bucket.reserve()
+    if delay:
+        logging.debug("Pacing %s call for %.2fs", kind, delay)
+        time.sleep(delay)
+
+
+def governed(method, send):
+    def request(url, **kwargs):
+        acquire(method, url)
+        return send(url, **kwargs)
+    return request
+
+
+def log_rate_limit_stats():
+    with _lock:
+        buckets = dict(_buckets)
+    waits = {kind: bucket for kind, bucket in buckets.items() if bucket.waits}
+    if waits:
+        logging.info("Lemmy calls paced: %s", ", ".join(
+            f"{kind}={bucket.waits} waits/{bucket.waited:.1f}s" for kind, bucket in waits.items()))
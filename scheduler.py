@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from config import settings
+
+
+# pool the existing synchronous job functions run in, created by run_jobs
+EXECUTOR = None
+
+
+class Job:
+    """
+    A single periodic job running as its own asyncio task.
+
+    The wrapped function is a normal blocking function from bot_code and is
+    run in EXECUTOR, so a slow Lemmy call or a sleep inside one job never holds
+    up any of the others. `interval` is in seconds and may also be a callable
+    returning the next interval, for jobs that adapt their own polling rate.
+    """
+
+    def __init__(self, func, interval, timeout=None, max_backoff=300):
+        self.func = func
+        self.name = func.__name__
+        self.interval = interval
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self._future = None
+
+    def get_interval(self):
+        if callable(self.interval):
+            return self.interval()
+        return self.interval
+
+    def get_timeout(self):
+        if self.timeout is not None:
+            return self.timeout
+        return max(self.get_interval() * 6, 60)
+
+    def next_delay(self):
+        interval = self.get_interval()
+        if not self.failures:
+            return interval
+
+        # exponential backoff with a bit of jitter, capped at max_backoff
+        backoff = min(interval * 2 ** self.failures, self.max_backoff)
+        return backoff + random.uniform(0, backoff / 10)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.tick(loop)
+            await asyncio.sleep(self.next_delay())
+
+    async def tick(self, loop):
+        # a timed out run can't be killed, so don't stack another one on top
+        if self._future is not None and not self._future.done():
+            logging.warning("Job %s is still running from a previous tick, skipping", self.name)
+            return
+
+        started = asyncio.Event()
+
+        def run():
+            loop.call_soon_threadsafe(started.set)
+            return self.func()
+
+        self._future = loop.run_in_executor(EXECUTOR, run)
+        try:
+            # time spent waiting for a free worker doesn't count against the timeout
+            waiting = asyncio.ensure_future(started.wait())
+            await asyncio.wait({waiting, self._future}, return_when=asyncio.FIRST_COMPLETED)
+            waiting.cancel()
+            await asyncio.wait_for(asyncio.shield(self._future), self.get_timeout())
+            self.failures = 0
+        except asyncio.TimeoutError:
+            self.failures += 1
+            logging.warning("Job %s timed out after %ss (failure %s)", self.name, self.get_timeout(), self.failures)
+        except Exception:
+            self.failures += 1
+            logging.exception("Job %s failed (failure %s)", self.name, self.failures)
+
+
+async def run_jobs(jobs):
+    global EXECUTOR
+    # a worker per job by default, with fewer a short job can sit queued
+    # behind the long running ones
+    workers = settings.JOB_WORKERS or len(jobs)
+    if workers < len(jobs):
+        logging.warning("JOB_WORKERS is %s for %s jobs, some jobs will wait for a free worker", workers, len(jobs))
+    EXECUTOR = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+
+    logging.info("Starting %s jobs with %s workers", len(jobs), workers)
+    try:
+        await asyncio.gather(*(job.run() for job in jobs))
+    finally:
+        EXECUTOR.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,98 @@
+import os
+import sys
+import tempfile
+from unittest import mock
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# config reads .env from the working directory when it's first imported
+TEST_ENV = """
+USERNAME=bot
+PASSWORD=botpassword
+BOT_ID=1
+INSTANCE=lemmy.example
+LOCAL=True
+EMAIL_FUNCTION=False
+SMTP_SERVER=smtp.example
+SMTP_PORT=587
+SENDER_EMAIL=bot@lemmy.example
+SENDER_PASSWORD=password
+SURVEY_CODE=code
+SLUR_ENABLED=False
+SLUR_REGEX=badword
+SERIOUS_WORDS=serious
+MATRIX_FLAG=False
+MATRIX_API_KEY=key
+MATRIX_ROOM_ID=!room:matrix.example
+MATRIX_URL=https://matrix.example
+MATRIX_ACCOUNT=@bot:matrix.example
+RSS_ENABLED=False
+GIVEAWAY_ENABLED=False
+DEBUG_LEVEL=INFO
+STARTUP_WARNING=False
+DB_NAME=lemmy
+DB_USER=lemmy
+DB_PASSWORD=password
+DB_HOST=localhost
+DB_PORT=5432
+DEFAULT_INSTANCE_BLOCKS=
+"""
+
+_env_dir = tempfile.mkdtemp()
+with open(os.path.join(_env_dir, ".env"), "w", encoding="utf-8") as env_file:
+    env_file.write(TEST_ENV)
+_cwd = os.getcwd()
+os.chdir(_env_dir)
+import config  # noqa: E402
+os.chdir(_cwd)
+
+import db_manager  # noqa: E402
+import lemmy_manager  # noqa: E402
+
+# several modules fetch the Lemmy client when imported, and bot_code opens its
+# Postgres pool, so neither may reach the network in tests
+mock.patch.object(lemmy_manager, "get_lemmy_instance", return_value=mock.MagicMock()).start()
+mock.patch("psycopg2.pool.ThreadedConnectionPool").start()
+
+DATABASES = [value for name, value in vars(db_manager).items() if name.endswith("_DB")]
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # the local databases are relative paths under resources/
+    (tmp_path / "resources" / "welcome").mkdir(parents=True)
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    # pooled connections would otherwise point at the last test's files
+    for path in DATABASES:
+        db_manager.close_db(path)
+
+
+@pytest.fixture
+def bot(workdir, monkeypatch):
+    """
+    bot_code, imported without logging in to Lemmy or connecting to Postgres,
+    with its local databases created in the test's working directory. Its
+    lemmy client is a MagicMock.
+    """
+    import bot_code
+
+    monkeypatch.setattr(bot_code, "lemmy", mock.MagicMock())
+    bot_code.check_dbs()
+    return bot_code
+
+
+@pytest.fixture
+def outbox(monkeypatch):
+    """
+    pm_outbox with create and mark_as_read replaced by mocks, to check the
+    replies a handler queued.
+    """
+    import pm_outbox
+
+    replies = mock.Mock()
+    monkeypatch.setattr(pm_outbox, "create", replies.create)
+    monkeypatch.setattr(pm_outbox, "mark_as_read", replies.mark_as_read)
+    return replies
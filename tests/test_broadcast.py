@@ -0,0 +1,32 @@
+from unittest import mock
+
+import pm_outbox
+
+
+def add_users(bot, count):
+    with bot.connect_to_users_db() as conn:
+        conn.executemany(
+            "INSERT INTO users (local_user_id, public_user_id, username, email, subscribed) VALUES (?, ?, ?, ?, 1)",
+            [(i, 100 + i, f"user{i}", f"user{i}@example.com") for i in range(1, count + 1)])
+        conn.commit()
+
+
+def test_finished_broadcast_notifies_admin_without_unread_pms(bot, monkeypatch):
+    outbox_lemmy = mock.MagicMock()
+    monkeypatch.setattr(pm_outbox, "lemmy", outbox_lemmy)
+    monkeypatch.setattr(bot.settings, "BROADCAST_RATE", 1000)
+    monkeypatch.setattr(bot.settings, "BROADCAST_REPORT_EVERY", 2)
+    add_users(bot, 3)
+
+    job_id, total = bot.broadcast_message("hello", 42)
+    assert total == 3
+    bot.send_broadcasts()
+
+    # check_pms never ran, the notices still went out
+    assert bot.lemmy.private_message.create.call_count == 3
+    notices = [call.args for call in outbox_lemmy.private_message.create.call_args_list]
+    assert notices == [
+        (f"Broadcast {job_id} progress: 2 of about 3 users done (0 failed).", 42),
+        (f"Broadcast {job_id} has finished: sent to 3 users, 0 failed.", 42),
+    ]
+    assert pm_outbox.outbox_stats()["pending"] == 0
@@ -0,0 +1,117 @@
+from unittest import mock
+
+import pytest
+
+import cache_manager
+
+
+@pytest.fixture
+def api(monkeypatch):
+    lemmy = mock.MagicMock()
+    monkeypatch.setattr(cache_manager, "lemmy", lemmy)
+    yield lemmy
+    for cache in cache_manager.CACHES:
+        cache.invalidate()
+
+
+def test_ttl_cache_expires_entries():
+    cache = cache_manager.TTLCache("test", ttl=0, maxsize=10)
+    cache.set("key", "value")
+    assert cache.get("key") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_ttl_cache_drops_least_recently_used():
+    cache = cache_manager.TTLCache("test", ttl=60, maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+    assert cache.stats()["hits"] == 3
+    assert cache.stats()["misses"] == 1
+
+
+def test_ttl_cache_does_not_cache_failed_loads():
+    cache = cache_manager.TTLCache("test", ttl=60, maxsize=2)
+    load = mock.Mock(side_effect=[None, "loaded"])
+    assert cache.get_or_load("key", load) is None
+    assert cache.get_or_load("key", load) == "loaded"
+    assert cache.get_or_load("key", load) == "loaded"
+    assert load.call_count == 2
+
+
+def person(person_id, name="someone"):
+    return {"person_view": {"person": {"id": person_id, "name": name, "local": True, "published": "2024-01-01"},
+                            "is_admin": False},
+            "site": {"actor_id": "https://lemmy.example/"}}
+
+
+def test_person_is_fetched_once(api):
+    api.user.get.return_value = person(7)
+
+    assert cache_manager.get_person(7)["name"] == "someone"
+    assert cache_manager.get_person("7")["site_actor_id"] == "https://lemmy.example/"
+    api.user.get.assert_called_once_with(7)
+
+
+def test_invalidated_person_is_fetched_again(api):
+    api.user.get.side_effect = [person(7), person(7, "renamed")]
+    cache_manager.get_person(7)
+
+    cache_manager.invalidate_person(7)
+
+    assert cache_manager.get_person(7)["name"] == "renamed"
+
+
+def test_unknown_person_is_none(api):
+    api.user.get.return_value = None
+    assert cache_manager.get_person(7) is None
+    assert cache_manager.get_person("not an id") is None
+
+
+def community(community_id, name, moderator_ids):
+    return {"community_view": {"community": {"id": community_id, "name": name}},
+            "moderators": [{"moderator": {"id": mod_id, "name": f"mod{mod_id}"}} for mod_id in moderator_ids]}
+
+
+def test_community_is_cached_by_name_and_id(api):
+    api.community.get.return_value = community(5, "news", [7])
+
+    assert cache_manager.get_community("news")["id"] == 5
+    assert cache_manager.get_community(5)["moderators"] == [(7, "mod7")]
+    api.community.get.assert_called_once_with(name="news")
+
+
+def test_moderator_check_uses_the_cache(api):
+    api.community.get.return_value = community(5, "news", [7])
+
+    assert cache_manager.is_moderator(7, "news")
+    assert not cache_manager.is_moderator(8, "news")
+    assert api.community.get.call_count == 1
+
+
+def test_stale_no_is_checked_again(api, monkeypatch):
+    api.community.get.side_effect = [community(5, "news", [7]), community(5, "news", [7, 8])]
+    cache_manager.get_community("news")
+    monkeypatch.setattr(cache_manager, "MOD_REFRESH_AFTER", -1)
+
+    assert cache_manager.is_moderator(8, "news")
+    assert api.community.get.call_count == 2
+
+
+def test_invalidated_community_is_dropped_under_every_key(api):
+    api.community.get.side_effect = [community(5, "news", [7]), community(5, "news", [8])]
+    cache_manager.get_community("news")
+
+    cache_manager.invalidate_community("news")
+
+    assert cache_manager.community_cache.get(("id", 5)) is None
+    assert cache_manager.get_community(5)["moderator_ids"] == frozenset({8})
+
+
+def test_unknown_community_is_none(api):
+    api.community.get.return_value = None
+    assert cache_manager.get_community("nowhere") is None
+    assert not cache_manager.is_moderator(7, "nowhere")
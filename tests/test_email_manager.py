@@ -0,0 +1,89 @@
+import smtplib
+from unittest import mock
+
+import pytest
+
+import db_manager
+import email_manager
+from config import settings
+
+
+@pytest.fixture
+def smtp(bot, monkeypatch):
+    server = mock.MagicMock()
+    connect = mock.Mock(return_value=server)
+    monkeypatch.setattr(email_manager.smtplib, "SMTP", connect)
+    monkeypatch.setattr(email_manager, "_server", None)
+    monkeypatch.setattr(email_manager, "_stats", dict.fromkeys(email_manager._stats, 0))
+    yield connect
+    email_manager._server = None
+
+
+def outbox():
+    with db_manager.connect(db_manager.EMAIL_DB) as conn:
+        return conn.execute("SELECT recipient, status, attempts FROM outbox ORDER BY email_id").fetchall()
+
+
+def test_queued_emails_share_one_connection(smtp):
+    email_manager.queue_email("a@example.com", "message a")
+    email_manager.queue_email("b@example.com", "message b")
+
+    email_manager.send_queued_emails()
+
+    smtp.assert_called_once()
+    assert [call.args[1:] for call in smtp.return_value.sendmail.call_args_list] == [
+        ("a@example.com", "message a"), ("b@example.com", "message b")]
+    assert outbox() == []
+    assert email_manager.email_stats()["sent"] == 2
+
+
+def test_refused_recipient_is_not_retried(smtp):
+    smtp.return_value.sendmail.side_effect = [
+        smtplib.SMTPRecipientsRefused({"a@example.com": (550, b"no such user")}), None]
+    email_manager.queue_email("a@example.com", "message a")
+    email_manager.queue_email("b@example.com", "message b")
+
+    email_manager.send_queued_emails()
+
+    assert outbox() == [("a@example.com", "failed", 1)]
+    assert email_manager.email_stats()["sent"] == 1
+
+
+def test_unreachable_server_leaves_emails_queued(smtp):
+    smtp.side_effect = OSError("connection refused")
+    email_manager.queue_email("a@example.com", "message a")
+    email_manager.queue_email("b@example.com", "message b")
+
+    email_manager.send_queued_emails()
+
+    # the first one is pushed back, the rest wait for the next run
+    assert outbox() == [("a@example.com", "pending", 1), ("b@example.com", "pending", 0)]
+    assert email_manager.email_stats()["retries"] == 1
+
+
+def test_retried_email_is_dropped_after_max_attempts(smtp, monkeypatch):
+    monkeypatch.setattr(settings, "EMAIL_MAX_ATTEMPTS", 2)
+    smtp.return_value.sendmail.side_effect = smtplib.SMTPDataError(451, b"try later")
+    email_manager.queue_email("a@example.com", "message a")
+
+    email_manager.send_queued_emails()
+    assert outbox() == [("a@example.com", "pending", 1)]
+
+    # not due again until the retry delay is up
+    email_manager.send_queued_emails()
+    assert outbox() == [("a@example.com", "pending", 1)]
+    with db_manager.connect(db_manager.EMAIL_DB) as conn:
+        conn.execute("UPDATE outbox SET next_attempt = 0")
+        conn.commit()
+    email_manager.send_queued_emails()
+    assert outbox() == [("a@example.com", "failed", 2)]
+
+
+def test_dropped_connection_is_reopened_once(smtp):
+    smtp.return_value.sendmail.side_effect = [smtplib.SMTPServerDisconnected(), None]
+    email_manager.queue_email("a@example.com", "message a")
+
+    email_manager.send_queued_emails()
+
+    assert smtp.call_count == 2
+    assert outbox() == []
@@ -0,0 +1,70 @@
+from unittest import mock
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import cache_manager
+import http_manager
+import pm_outbox
+import pm_router
+
+RSS = """<?xml version="1.0"?>
+<rss version="2.0"><channel>
+<title>{title}</title><link>https://feed.example/</link><description>news</description>
+<item><title>{item}</title><link>https://feed.example/1</link></item>
+</channel></rss>"""
+
+
+def feed_response(body, content_type="application/rss+xml; charset=utf-8"):
+    response = requests.Response()
+    response.status_code = 200
+    response.headers = CaseInsensitiveDict({"Content-Type": content_type})
+    response._content = body
+    return response
+
+
+def test_feed_headers_keep_content_type():
+    response = feed_response(b"", "text/xml; charset=windows-1252")
+    assert http_manager.feed_headers(response)["content-type"] == "text/xml; charset=windows-1252"
+
+
+def test_rss_command_accepts_well_formed_feed(bot, monkeypatch):
+    body = RSS.format(title="Feed", item="First").encode()
+    monkeypatch.setattr(http_manager, "get", mock.Mock(return_value=feed_response(body)))
+    monkeypatch.setattr(cache_manager, "get_community", mock.Mock(return_value={"id": 5}))
+    monkeypatch.setattr(cache_manager, "is_moderator", mock.Mock(return_value=True))
+    replies = mock.Mock()
+    monkeypatch.setattr(pm_outbox, "create", replies)
+    monkeypatch.setattr(pm_outbox, "mark_as_read", mock.Mock())
+
+    pm_router.dispatch("#rss -url https://feed.example/rss -c news", pm_username="mod", pm_sender=7, pm_id=3,
+                       pm_account_age=100, user_admin=False)
+
+    assert "successfully added" in replies.call_args.args[0]
+    with bot.connect_to_rss_db() as conn:
+        assert conn.execute("SELECT feed_url, community FROM feeds").fetchall() == [("https://feed.example/rss", "5")]
+
+
+def test_steam_deals_survives_fetch_failure(bot, monkeypatch):
+    monkeypatch.setattr(http_manager, "get", mock.Mock(side_effect=requests.exceptions.ConnectTimeout()))
+    assert bot.steam_deals() is None
+    bot.lemmy.post.create.assert_not_called()
+
+
+def koi8_feed():
+    # no encoding in the XML declaration, only in the Content-Type header
+    body = RSS.format(title="Новости", item="Привет").encode("koi8-r")
+    return feed_response(body, "application/rss+xml; charset=koi8-r")
+
+
+def test_fetch_latest_posts_uses_header_charset(bot, monkeypatch):
+    monkeypatch.setattr(http_manager, "get", mock.Mock(return_value=koi8_feed()))
+    posts = bot.fetch_latest_posts("https://feed.example/rss")
+    assert [post["title"] for post in posts] == ["Привет"]
+
+
+def test_fetch_feed_update_uses_header_charset(bot, monkeypatch):
+    monkeypatch.setattr(http_manager, "get", mock.Mock(return_value=koi8_feed()))
+    feed = (1, "https://feed.example/rss", None, None, None, None, "5", None, None, None, 900, 0)
+    posts, _, _, _ = bot.fetch_feed_update(feed)
+    assert [post["title"] for post in posts] == ["Привет"]
@@ -0,0 +1,105 @@
+from unittest import mock
+
+import pytest
+import requests
+import urllib3
+from pythorhead import requestor
+
+import http_manager
+import lemmy_manager
+
+URL = f"{http_manager.LEMMY_URL}/api/v3/private_message"
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(lemmy_manager, "_backoff", lambda attempt: None)
+    yield
+    lemmy_manager.note_api_success()
+
+
+def response(status):
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = b"{}"
+    return resp
+
+
+def connection_refused():
+    reason = urllib3.exceptions.NewConnectionError(None, "connection refused")
+    return requests.exceptions.ConnectionError(urllib3.exceptions.MaxRetryError(None, URL, reason))
+
+
+def send(method, *outcomes):
+    # send one request through pythorhead's REQUEST_MAP, with the network
+    # replaced by outcomes (responses, or exceptions to raise) in order
+    with mock.patch.object(http_manager, "request", side_effect=list(outcomes)) as transport:
+        try:
+            return requestor.REQUEST_MAP[method](URL, json={"content": "hi"}), transport.call_count
+        except requests.exceptions.RequestException as e:
+            return e, transport.call_count
+
+
+def test_post_that_times_out_is_sent_once():
+    result, calls = send(requestor.Request.POST, requests.exceptions.ReadTimeout(), response(200))
+    assert isinstance(result, requests.exceptions.ReadTimeout)
+    assert calls == 1
+
+
+def test_post_with_server_error_is_sent_once():
+    result, calls = send(requestor.Request.POST, response(502), response(200))
+    assert result.status_code == 502
+    assert calls == 1
+
+
+def test_post_that_never_connected_is_retried():
+    result, calls = send(requestor.Request.POST, connection_refused(), response(200))
+    assert result.status_code == 200
+    assert calls == 2
+
+
+def test_post_connect_timeout_is_retried():
+    result, calls = send(requestor.Request.POST, requests.exceptions.ConnectTimeout(), response(200))
+    assert result.status_code == 200
+    assert calls == 2
+
+
+def test_get_is_retried_after_timeout_and_server_error():
+    result, calls = send(requestor.Request.GET, requests.exceptions.ReadTimeout(), response(503), response(200))
+    assert result.status_code == 200
+    assert calls == 3
+
+
+def test_pythorhead_request_map_shape():
+    # lemmy_manager replaces pythorhead's (private) request functions, check
+    # they're still looked up the way it expects
+    assert {method.value for method in requestor.Request} == {"GET", "PUT", "POST"}
+    assert set(requestor.REQUEST_MAP) == set(requestor.Request)
+    assert all(send.__module__ == "lemmy_manager" for send in requestor.REQUEST_MAP.values())
+    assert requestor.Requestor()._auth.token is None
+
+
+@pytest.fixture
+def logged_in(monkeypatch):
+    lemmy = mock.MagicMock()
+    lemmy._requestor = requestor.Requestor()
+    lemmy._requestor._auth.token = "old"
+    monkeypatch.setattr(lemmy_manager, "LEMMY", lemmy)
+    return lemmy
+
+
+def test_relog_in_updates_retried_request(logged_in):
+    logged_in.log_in.side_effect = lambda username, password: logged_in._requestor._auth.set_token("new")
+    headers = {"Authorization": "Bearer old"}
+
+    assert lemmy_manager.relog_in(headers)
+    assert headers == {"Authorization": "Bearer new"}
+
+
+def test_relog_in_fails_when_token_is_unchanged(logged_in):
+    # pythorhead keeps the old token when the login is refused
+    logged_in.log_in.return_value = True
+    headers = {"Authorization": "Bearer old"}
+
+    assert not lemmy_manager.relog_in(headers)
+    assert headers == {"Authorization": "Bearer old"}
@@ -0,0 +1,60 @@
+import sqlite3
+
+import pytest
+
+import db_manager
+import migrations
+
+
+def make_table(rows):
+    conn = db_manager.connect(db_manager.RSS_DB)
+    conn.execute("CREATE TABLE posts (post_id INTEGER PRIMARY KEY, post_url TEXT)")
+    conn.executemany("INSERT INTO posts (post_url) VALUES (?)", [(url,) for url in rows])
+    conn.commit()
+    return conn
+
+
+def test_dedupe_keeps_first_row_per_value():
+    conn = make_table(["a", "b", "a", "c", "b"])
+    conn.execute(migrations.dedupe("posts", "post_url"))
+
+    assert conn.execute("SELECT post_id, post_url FROM posts ORDER BY post_id").fetchall() == [
+        (1, "a"), (2, "b"), (4, "c")]
+
+
+def test_dedupe_keeps_every_null_row():
+    conn = make_table([None, "a", None, "a", None])
+    conn.execute(migrations.dedupe("posts", "post_url"))
+
+    assert conn.execute("SELECT post_id, post_url FROM posts ORDER BY post_id").fetchall() == [
+        (1, None), (2, "a"), (3, None), (5, None)]
+    # and the unique index the dedupe is for still goes on
+    conn.execute("CREATE UNIQUE INDEX idx_posts_post_url ON posts (post_url)")
+
+
+def test_migrate_records_schema_version():
+    conn = make_table(["a", "a"])
+    conn.close()
+    migrations.migrate(db_manager.RSS_DB, [
+        [migrations.dedupe("posts", "post_url"),
+         "CREATE UNIQUE INDEX idx_posts_post_url ON posts (post_url)"],
+    ])
+
+    conn = db_manager.connect(db_manager.RSS_DB)
+    assert migrations.get_schema_version(conn) == 1
+    assert conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0] == 1
+
+
+def test_failed_migration_stops_check_dbs(bot, monkeypatch, caplog):
+    monkeypatch.setitem(migrations.MIGRATIONS, db_manager.RSS_DB, [
+        ["CREATE INDEX IF NOT EXISTS idx_feeds_tag ON feeds (tag)"],
+        ["ALTER TABLE no_such_table ADD COLUMN etag TEXT"],
+    ])
+    db_manager.connect(db_manager.RSS_DB).execute("PRAGMA user_version = 0")
+
+    with pytest.raises(sqlite3.OperationalError):
+        bot.check_dbs()
+
+    assert f"Migrating {db_manager.RSS_DB} to schema version 2 failed" in caplog.text
+    # the version that failed was rolled back, the one before it is kept
+    assert migrations.get_schema_version(db_manager.connect(db_manager.RSS_DB)) == 1
@@ -0,0 +1,106 @@
+import time
+from unittest import mock
+
+import pytest
+
+import db_manager
+import onboarding
+
+USER = (11, 111, "newuser", "new@example.com")
+
+
+@pytest.fixture
+def stages(bot, monkeypatch):
+    # only the stages a test registers, not the bot's own
+    monkeypatch.setattr(onboarding, "_stages", {})
+    monkeypatch.setattr(onboarding, "_stats", {})
+
+
+def queue(*users):
+    with db_manager.connect(db_manager.USERS_DB) as conn:
+        onboarding.queue_users(conn, list(users))
+        conn.commit()
+
+
+def rows():
+    with db_manager.connect(db_manager.USERS_DB) as conn:
+        return conn.execute(
+            "SELECT username, stage, status, attempts, next_attempt FROM onboarding ORDER BY onboarding_id").fetchall()
+
+
+def make_due():
+    with db_manager.connect(db_manager.USERS_DB) as conn:
+        conn.execute("UPDATE onboarding SET next_attempt = 0")
+        conn.commit()
+
+
+def test_retry_delay_doubles_up_to_the_max():
+    stage = onboarding.Stage("test", None, 5, 60, 200, True)
+    assert [stage.next_delay(attempts) for attempts in range(1, 5)] == [60, 120, 200, 200]
+
+
+def test_users_are_queued_for_initial_stages(stages):
+    onboarding.stage("first")(mock.Mock())
+    onboarding.stage("later", initial=False)(mock.Mock())
+
+    queue(USER, (12, 112, "other", "other@example.com"))
+
+    assert [(username, stage) for username, stage, *_ in rows()] == [("newuser", "first"), ("other", "first")]
+
+
+def test_finished_stage_is_removed(stages):
+    handler = mock.Mock(return_value=True)
+    onboarding.stage("first")(handler)
+    queue(USER)
+
+    onboarding.run_stage("first")
+
+    handler.assert_called_once_with(
+        {"local_user_id": 11, "public_user_id": 111, "username": "newuser", "email": "new@example.com"})
+    assert rows() == []
+    assert onboarding.onboarding_stats()["first"] == {"done": 1, "retries": 0, "failed": 0, "pending": 0}
+
+
+def test_failed_stage_backs_off_then_gives_up(stages):
+    handler = mock.Mock(side_effect=[False, RuntimeError("mail server down"), False])
+    onboarding.stage("first", max_attempts=3, retry_delay=60)(handler)
+    queue(USER)
+
+    before = int(time.time())
+    onboarding.run_stage("first")
+    (_, _, status, attempts, next_attempt), = rows()
+    assert (status, attempts) == ("pending", 1)
+    assert before + 60 <= next_attempt <= time.time() + 60
+
+    # not retried until it's due
+    onboarding.run_stage("first")
+    assert handler.call_count == 1
+
+    make_due()
+    onboarding.run_stage("first")
+    assert rows()[0][2:4] == ("pending", 2)
+
+    make_due()
+    onboarding.run_stage("first")
+    assert rows()[0][2:4] == ("failed", 3)
+    assert onboarding.onboarding_stats()["first"] == {"done": 0, "retries": 2, "failed": 1, "pending": 0}
+
+
+def test_stage_can_queue_a_follow_up(stages):
+    onboarding.stage("check")(lambda user: onboarding.add_stage(user, "alert") or True)
+    alert = mock.Mock(return_value=True)
+    onboarding.stage("alert", initial=False)(alert)
+    queue(USER)
+
+    onboarding.run_stage("check")
+    assert [stage for _, stage, *_ in rows()] == ["alert"]
+
+    onboarding.run_stage("alert")
+    alert.assert_called_once()
+    assert rows() == []
+
+
+def test_stage_cannot_be_registered_twice(stages):
+    onboarding.stage("first")(mock.Mock())
+    with pytest.raises(ValueError):
+        onboarding.stage("first")(mock.Mock())
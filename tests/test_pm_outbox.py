@@ -0,0 +1,63 @@
+from unittest import mock
+
+import pytest
+
+import pm_outbox
+
+
+@pytest.fixture
+def api(monkeypatch):
+    lemmy = mock.MagicMock()
+    monkeypatch.setattr(pm_outbox, "lemmy", lemmy)
+    monkeypatch.setattr(pm_outbox, "_replies", [])
+    monkeypatch.setattr(pm_outbox, "_reads", {})
+    monkeypatch.setattr(pm_outbox, "_stats", {"queued": 0, "sent": 0, "failed": 0})
+    monkeypatch.setattr(pm_outbox, "wait_for_rate_limit", lambda: None)
+    monkeypatch.setattr(pm_outbox, "rate_limit_remaining", lambda: 0)
+    return lemmy
+
+
+def test_flush_sends_identical_replies_once(api):
+    pm_outbox.create("hello", 7)
+    pm_outbox.create("other", 8)
+    pm_outbox.create("hello", 7)
+    pm_outbox.create("hello", 8)
+    pm_outbox.mark_as_read(3, False)
+    pm_outbox.mark_as_read(3, True)
+
+    pm_outbox.flush()
+
+    assert [call.args for call in api.private_message.create.call_args_list] == [
+        ("hello", 7), ("other", 8), ("hello", 8)]
+    api.private_message.mark_as_read.assert_called_once_with(3, True)
+    assert pm_outbox.outbox_stats() == {"queued": 6, "sent": 4, "failed": 0, "pending": 0, "saved": 2}
+
+
+def test_flush_empties_the_queue(api):
+    pm_outbox.create("hello", 7)
+    pm_outbox.flush()
+    pm_outbox.flush()
+    assert api.private_message.create.call_count == 1
+
+
+def test_rate_limited_reply_is_retried_once(api, monkeypatch):
+    monkeypatch.setattr(pm_outbox, "rate_limit_remaining", lambda: 5)
+    api.private_message.create.side_effect = [None, None, {"private_message_view": {}}]
+    pm_outbox.create("hello", 7)
+    pm_outbox.create("again", 7)
+
+    pm_outbox.flush()
+
+    assert api.private_message.create.call_count == 3
+    assert pm_outbox.outbox_stats()["sent"] == 1
+    assert pm_outbox.outbox_stats()["failed"] == 1
+
+
+def test_refused_reply_is_not_retried(api):
+    api.private_message.create.return_value = None
+    pm_outbox.create("hello", 7)
+
+    pm_outbox.flush()
+
+    assert api.private_message.create.call_count == 1
+    assert pm_outbox.outbox_stats()["failed"] == 1
@@ -0,0 +1,69 @@
+import pytest
+
+import bot_strings
+import pm_router
+
+
+def message(user_admin=False):
+    return {"pm_username": "someone", "pm_sender": 7, "pm_id": 3, "pm_account_age": 100, "user_admin": user_admin}
+
+
+@pytest.fixture
+def commands(monkeypatch):
+    # register test commands without leaving them behind
+    monkeypatch.setattr(pm_router, "_commands", dict(pm_router._commands))
+
+
+def test_unknown_command_is_not_handled(bot, outbox):
+    assert pm_router.dispatch("#nosuchcommand", **message()) is False
+    assert pm_router.dispatch("hello there", **message()) is False
+    outbox.mark_as_read.assert_not_called()
+
+
+def test_exact_command_needs_the_whole_message(bot, outbox):
+    assert pm_router.dispatch("#subscribe please", **message()) is False
+
+
+def test_handler_gets_parsed_values_and_dependencies(bot, outbox):
+    with bot.connect_to_users_db() as conn:
+        conn.execute("INSERT INTO users (local_user_id, public_user_id, username, email, subscribed) "
+                     "VALUES (1, 7, 'someone', 'someone@example.com', 0)")
+        conn.commit()
+
+    assert pm_router.dispatch("#subscribe", **message()) is True
+
+    with bot.connect_to_users_db() as conn:
+        assert conn.execute("SELECT subscribed FROM users WHERE public_user_id = 7").fetchone() == (1,)
+    assert bot_strings.SUB_MESSAGE in outbox.create.call_args.args[0]
+    outbox.mark_as_read.assert_called_once_with(3, True)
+
+
+def test_admin_command_is_denied_to_users(bot, outbox):
+    denied = pm_router.command_stats().get("#poll", {}).get("denied", 0)
+
+    assert pm_router.dispatch("#poll -q question", **message()) is True
+
+    assert "instance admin in order to create a poll" in outbox.create.call_args.args[0]
+    outbox.mark_as_read.assert_called_once_with(3, True)
+    assert pm_router.command_stats()["#poll"]["denied"] == denied + 1
+
+
+def test_admin_commands_are_hidden_from_users(bot):
+    assert "#poll" not in [cmd.prefix for cmd in pm_router.get_commands()]
+    assert "#poll" in [cmd.prefix for cmd in pm_router.get_commands(user_admin=True)]
+
+
+def test_failed_handler_marks_message_read(bot, outbox, commands):
+    @pm_router.command("#explode")
+    def explode(pm_id):
+        raise RuntimeError("boom")
+
+    assert pm_router.dispatch("#explode", **message()) is True
+
+    outbox.mark_as_read.assert_called_once_with(3, True)
+    assert pm_router.command_stats()["#explode"]["errors"] == 1
+
+
+def test_command_can_only_be_registered_once(commands):
+    with pytest.raises(ValueError):
+        pm_router.command("#help")(lambda: None)
@@ -0,0 +1,72 @@
+from unittest import mock
+
+import pytest
+
+import rate_limit_manager
+from config import settings
+
+
+@pytest.fixture
+def buckets(monkeypatch):
+    monkeypatch.setattr(rate_limit_manager, "_buckets", {})
+    monkeypatch.setattr(settings, "RATE_LIMIT_HEADROOM", 0.5)
+    sleep = mock.Mock()
+    monkeypatch.setattr(rate_limit_manager.time, "sleep", sleep)
+    return sleep
+
+
+def site(**limits):
+    return {"site_view": {"local_site_rate_limit": limits}}
+
+
+def test_bucket_hands_out_capacity_then_paces():
+    bucket = rate_limit_manager.TokenBucket(2, 10)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(5, abs=0.01)
+    # the next caller queues behind the one already waiting
+    assert bucket.reserve() == pytest.approx(10, abs=0.01)
+    assert bucket.waits == 2
+
+
+@pytest.mark.parametrize("method, url, kind", [
+    ("POST", "https://lemmy.example/api/v3/post", "post"),
+    ("PUT", "https://lemmy.example/api/v3/post", "message"),
+    ("POST", "https://lemmy.example/api/v3/comment/", "comment"),
+    ("POST", "https://lemmy.example/api/v3/user/register", "register"),
+    ("GET", "https://lemmy.example/api/v3/search?q=x", "search"),
+    ("POST", "https://lemmy.example/pictrs/image", "image"),
+    ("GET", "https://lemmy.example/api/v3/private_message/list", "message"),
+])
+def test_limit_type(method, url, kind):
+    assert rate_limit_manager.limit_type(method, url) == kind
+
+
+def test_configure_uses_headroom_and_skips_missing_limits(buckets):
+    rate_limit_manager.configure(site(message=180, message_per_second=60, post=6, post_per_second=600, comment=None))
+
+    assert set(rate_limit_manager._buckets) == {"message", "post"}
+    assert rate_limit_manager._buckets["message"].capacity == 90
+    assert rate_limit_manager._buckets["post"].capacity == 3
+
+
+def test_configure_without_limits_keeps_calls_unpaced(buckets):
+    rate_limit_manager.configure({})
+    rate_limit_manager.acquire("POST", "https://lemmy.example/api/v3/post")
+    assert rate_limit_manager._buckets == {}
+    buckets.assert_not_called()
+
+
+def test_governed_waits_for_its_own_class(buckets):
+    rate_limit_manager.configure(site(post=2, post_per_second=60, message=100, message_per_second=60))
+    send = mock.Mock(return_value="response")
+    post = rate_limit_manager.governed("POST", send)
+
+    assert post("https://lemmy.example/api/v3/post") == "response"
+    post("https://lemmy.example/api/v3/post")
+    buckets.assert_called_once()
+    assert buckets.call_args.args[0] == pytest.approx(60, abs=0.1)
+    # other classes aren't held up by it
+    post("https://lemmy.example/api/v3/private_message")
+    assert buckets.call_count == 1
+    assert send.call_count == 3
@@ -0,0 +1,43 @@
+import pytest
+
+
+def application(app_id, email):
+    return {
+        "registration_application": {"id": app_id, "local_user_id": 10 + app_id},
+        "creator_local_user": {"person_id": 100 + app_id, "email": email},
+        "creator": {"name": f"user{app_id}"},
+    }
+
+
+@pytest.fixture
+def applications(bot, monkeypatch):
+    # the listed applications, newest first like the API
+    apps = {1: "one@example.com", 2: None, 3: "three@example.com"}
+    bot.lemmy.admin.list_applications.side_effect = lambda limit, page: {
+        "registration_applications": [application(app_id, email) for app_id, email in sorted(apps.items(), reverse=True)]
+        if page == 1 else []}
+    monkeypatch.setattr(bot, "_apps_waiting_for_email", {})
+    return apps
+
+
+def user_ids(bot):
+    with bot.connect_to_users_db() as conn:
+        return [row[0] for row in conn.execute("SELECT local_user_id FROM users ORDER BY local_user_id")]
+
+
+def test_application_without_email_holds_watermark(bot, applications):
+    bot.get_new_users()
+    assert user_ids(bot) == [11, 13]
+    assert bot.get_scan_watermark('registration_applications') == 1
+
+    applications[2] = "two@example.com"
+    bot.get_new_users()
+    assert user_ids(bot) == [11, 12, 13]
+    assert bot.get_scan_watermark('registration_applications') == 3
+
+
+def test_application_without_email_is_skipped_after_waiting(bot, applications, monkeypatch):
+    monkeypatch.setattr(bot, "REGISTRATION_EMAIL_WAIT", 0)
+    bot.get_new_users()
+    assert user_ids(bot) == [11, 13]
+    assert bot.get_scan_watermark('registration_applications') == 3
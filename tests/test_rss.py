@@ -0,0 +1,16 @@
+import pm_router
+
+
+def post(url):
+    return {"post_url": url, "title": "title", "description": "", "post_date": "2024-01-01"}
+
+
+def test_purgerss_forgets_seen_posts(bot):
+    assert [p["post_url"] for p in bot.insert_new_posts(1, [post("https://a.example/1")])] == ["https://a.example/1"]
+    assert bot.rss_post_seen("https://a.example/1")
+
+    pm_router.dispatch("#purgerss", pm_username="admin", pm_sender=1, pm_id=2,
+                       pm_account_age=100, user_admin=True)
+
+    assert not bot.rss_post_seen("https://a.example/1")
+    assert [p["post_url"] for p in bot.insert_new_posts(1, [post("https://a.example/1")])] == ["https://a.example/1"]
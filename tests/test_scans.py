@@ -0,0 +1,53 @@
+def comment(comment_id, content="hello"):
+    return {
+        "comment": {"id": comment_id, "content": content},
+        "creator": {"id": 10, "name": "someone", "local": True, "published": "2024-01-01T00:00:00Z"},
+        "community": {"id": 5, "name": "community"},
+        "post": {"id": 7, "creator_id": 11},
+    }
+
+
+def test_comment_scan_keeps_the_whole_batch(bot):
+    bot.set_scan_watermark("comments", 100)
+    bot.lemmy.comment.list.side_effect = [[comment(103), comment(102), comment(101)], []]
+
+    bot.check_comments()
+
+    assert bot.get_scan_watermark("comments") == 103
+    with bot.connect_to_mod_db() as conn:
+        scanned = [row[0] for row in conn.execute("SELECT comment_id FROM new_comments ORDER BY comment_id")]
+    assert scanned == [101, 102, 103]
+
+
+def test_failed_comment_is_not_marked_scanned(bot, monkeypatch):
+    bot.set_scan_watermark("comments", 100)
+    bot.lemmy.comment.list.return_value = [comment(103), comment(102), comment(101)]
+    scan_comment = bot.scan_comment
+
+    def flaky_scan(item, slur_hits):
+        if item["comment"]["id"] == 102:
+            raise RuntimeError("lemmy went away")
+        scan_comment(item, slur_hits)
+
+    monkeypatch.setattr(bot, "scan_comment", flaky_scan)
+    bot.check_comments()
+
+    # 101 is done, 102 and everything after it are retried next check
+    assert bot.get_scan_watermark("comments") == 101
+
+
+def test_comment_that_keeps_failing_is_skipped(bot, monkeypatch):
+    bot.set_scan_watermark("comments", 100)
+    bot.lemmy.comment.list.return_value = [comment(102), comment(101)]
+
+    def broken_scan(item, slur_hits):
+        if item["comment"]["id"] == 101:
+            raise RuntimeError("bad comment")
+
+    monkeypatch.setattr(bot, "scan_comment", broken_scan)
+    for _ in range(bot.SCAN_MAX_ATTEMPTS - 1):
+        bot.check_comments()
+        assert bot.get_scan_watermark("comments") == 100
+
+    bot.check_comments()
+    assert bot.get_scan_watermark("comments") == 102
@@ -0,0 +1,24 @@
+import word_filter
+from config import settings
+
+
+def test_reload_keeps_current_pattern_if_new_one_is_invalid(workdir, monkeypatch):
+    regex_file = workdir / "slur_regex.txt"
+    monkeypatch.setattr(settings, "SLUR_REGEX", "badword")
+    monkeypatch.setattr(settings, "SLUR_REGEX_FILE", str(regex_file))
+
+    regex_file.write_text("(unclosed")
+    assert word_filter.reload_slur_regex().pattern == "badword"
+    assert settings.SLUR_REGEX == "badword"
+    assert word_filter.get_slur_regex().search("a badword here")
+
+
+def test_reload_picks_up_changed_file(workdir, monkeypatch):
+    regex_file = workdir / "slur_regex.txt"
+    monkeypatch.setattr(settings, "SLUR_REGEX", "badword")
+    monkeypatch.setattr(settings, "SLUR_REGEX_FILE", str(regex_file))
+
+    regex_file.write_text("worseword\n")
+    word_filter.reload_slur_regex()
+    assert word_filter.get_slur_regex().search("a worseword here")
+    assert not word_filter.get_slur_regex().search("a badword here")
@@ -0,0 +1,128 @@
+import logging
+import re
+import threading
+from collections import Counter
+
+import db_manager
+from config import Settings, settings
+
+# community name -> compiled matcher for its word list, loaded on first use
+_matchers = None
+_lock = threading.Lock()
+_match_counts = Counter()
+
+# (pattern, compiled) for the admin SLUR_REGEX setting
+_slur_regex = (None, None)
+
+
+def compile_words(words):
+    """
+    Compile a word list into one regex that matches any of the words as a
+    whole whitespace-separated token, so a text is scanned in a single pass
+    however long the list is.
+    """
+    words = sorted({word for word in words if word}, key=len, reverse=True)
+    if not words:
+        return None
+    return re.compile(r'(?<!\S)(?:' + '|'.join(re.escape(word) for word in words) + r')(?!\S)')
+
+
+def _load_matchers():
+    with db_manager.connect(db_manager.MOD_DB) as conn:
+        rows = conn.execute("SELECT community, words FROM community_words").fetchall()
+
+    logging.debug("Loaded community word lists for %s communities", len(rows))
+    return {community: compile_words(words.split(',')) for community, words in rows if words}
+
+
+def get_matcher(community):
+    global _matchers
+    with _lock:
+        if _matchers is None:
+            _matchers = _load_matchers()
+        return _matchers.get(community)
+
+
+def invalidate():
+    # call whenever community_words changes
+    global _matchers
+    with _lock:
+        _matchers = None
+
+
+def find_match(community, *texts):
+    """
+    Return the first word from the community's list found in any of the texts,
+    or None. Texts are lowercased before matching.
+    """
+    matcher = get_matcher(community)
+    if matcher is None:
+        return None
+
+    for text in texts:
+        match = matcher.search(text.lower())
+        if match:
+            with _lock:
+                _match_counts[community] += 1
+            return match.group(0)
+    return None
+
+
+def get_match_counts():
+    with _lock:
+        return dict(_match_counts)
+
+
+def log_match_counts():
+    counts = get_match_counts()
+    if counts:
+        logging.info("Community word filter matches: %s", ", ".join(
+            f"{community}={count}" for community, count in sorted(counts.items(), key=lambda item: -item[1])))
+
+
+def get_slur_regex():
+    """
+    The compiled SLUR_REGEX setting. It is only recompiled when the setting
+    changes, e.g. after reload_slur_regex().
+    """
+    global _slur_regex
+    pattern, compiled = _slur_regex
+    if pattern != settings.SLUR_REGEX:
+        compiled = re.compile(settings.SLUR_REGEX)
+        _slur_regex = (settings.SLUR_REGEX, compiled)
+        logging.debug("Compiled SLUR_REGEX")
+    return compiled
+
+
+def reload_slur_regex():
+    """
+    Pick up a changed slur pattern without a restart, from the file at
+    SLUR_REGEX_FILE if it's set, otherwise SLUR_REGEX from the environment
+    and .env. The Docker image has .env baked in, so there only a mounted
+    SLUR_REGEX_FILE can change it. A pattern that doesn't compile is logged
+    and the current one kept.
+    """
+    global _slur_regex
+    if settings.SLUR_REGEX_FILE:
+        try:
+            with open(settings.SLUR_REGEX_FILE, encoding='utf-8') as regex_file:
+                pattern = regex_file.read().strip()
+        except OSError as e:
+            logging.error("Unable to read SLUR_REGEX_FILE, keeping the current pattern: %s", e)
+            return get_slur_regex()
+    else:
+        pattern = Settings().SLUR_REGEX
+
+    if pattern == settings.SLUR_REGEX:
+        return get_slur_regex()
+
+    try:
+        compiled = re.compile(pattern)
+    except re.error as e:
+        logging.error("New SLUR_REGEX doesn't compile, keeping the current pattern: %s", e)
+        return get_slur_regex()
+
+    settings.SLUR_REGEX = pattern
+    _slur_regex = (pattern, compiled)
+    logging.info("Reloaded SLUR_REGEX")
+    return compiled